@@ -0,0 +1,188 @@
+# content_cache.py
+# Generated decks keyed by a normalized request, so users asking for the
+# same deck share one Gemini call. Two layers:
+#   exact: topic, audience, slide count and language, with case, whitespace
+#          and punctuation folded ("Impact of AI on Investment Banking!"
+#          matches "impact of ai on investment banking").
+#   near:  topics whose word shingles are similar enough (MinHash estimate
+#          of Jaccard similarity >= threshold), for the same audience, slide
+#          count, language and numbers ("2024" never matches "2025").
+# Entries expire after a TTL and the least recently used are evicted beyond
+# max_entries. Everything lives in process memory.
+
+import os
+import re
+import time
+import json
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOPWORDS = frozenset("a an and the of on in for to with about at by from into is are its our your how what why".split())
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_text(text: str) -> str:
+    """Casefolds, drops punctuation and collapses whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.casefold()).split())
+
+
+def request_fields(request) -> Dict[str, object]:
+    """The request fields that decide the generated content; the theme does not."""
+    return {"topic": normalize_text(request.topic), "audience": normalize_text(request.target_audience),
+            "slide_count": request.slide_count, "language": normalize_text(request.language)}
+
+
+def exact_key(request) -> str:
+    return hashlib.sha256(json.dumps(request_fields(request), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def shingles(topic: str) -> Set[str]:
+    """Words and word pairs of the normalized topic, without stopwords; pairs keep some word order."""
+    words = [word for word in normalize_text(topic).split() if word not in _STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+class MinHasher:
+    """`num_perm` universal hash permutations of 64-bit shingle hashes."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, items: Set[str]) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big") for item in items]
+        if not hashes:
+            return tuple(_MERSENNE_PRIME for _ in self.params)
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self.params)
+
+
+def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity: the fraction of equal signature positions."""
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class _Entry(NamedTuple):
+    slides: List[dict]
+    expires_at: float
+    group: Tuple
+    signature: Tuple[int, ...]
+
+
+class ContentCache:
+    """
+    LRU of generated slides with a TTL. With near_duplicates, signatures are
+    indexed by LSH bands (`bands` groups of num_perm / bands positions), so
+    a lookup only compares against entries sharing at least one band.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400.0, near_duplicates: bool = True,
+                 threshold: float = 0.75, num_perm: int = 64, bands: int = 16):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._hasher = MinHasher(num_perm)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _group(self, request) -> Tuple:
+        """Near matches must agree on everything but the topic wording, including any numbers in it."""
+        fields = request_fields(request)
+        numbers = tuple(sorted(word for word in fields["topic"].split() if any(c.isdigit() for c in word)))
+        return fields["audience"], fields["slide_count"], fields["language"], numbers
+
+    def _band_keys(self, group: Tuple, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield group, band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for band_key in self._band_keys(entry.group, entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _live(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, request) -> Tuple[Optional[List[dict]], str]:
+        """Returns (slides, "exact" | "near") on a hit, (None, "miss") otherwise."""
+        key = exact_key(request)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.slides, "exact"
+            if self.near_duplicates:
+                group, signature = self._group(request), self._hasher.signature(shingles(request.topic))
+                candidates = set()
+                for band_key in self._band_keys(group, signature):
+                    candidates |= self._buckets.get(band_key, set())
+                best_key, best_score = None, self.threshold
+                for candidate in candidates:
+                    entry = self._live(candidate, now)
+                    if entry is not None:
+                        score = similarity(signature, entry.signature)
+                        if score >= best_score:
+                            best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.near_hits += 1
+                    logger.info(f"Content cache near match for '{request.topic[:60]}' (similarity {best_score:.2f}).")
+                    return self._entries[best_key].slides, "near"
+            self.misses += 1
+            return None, "miss"
+
+    def put(self, request, slides: List[dict]) -> None:
+        key = exact_key(request)
+        group, signature = self._group(request), self._hasher.signature(shingles(request.topic))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(slides, time.monotonic() + self.ttl_seconds, group, signature)
+            if self.near_duplicates:
+                for band_key in self._band_keys(group, signature):
+                    self._buckets[band_key].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"exact_hits": self.exact_hits, "near_hits": self.near_hits, "misses": self.misses,
+                    "entries": len(self._entries), "max_entries": self.max_entries, "ttl_seconds": self.ttl_seconds,
+                    "near_duplicates": self.near_duplicates, "threshold": self.threshold}
+
+
+def content_cache_from_env() -> Optional[ContentCache]:
+    """
+    CONTENT_CACHE=off disables caching. CONTENT_CACHE_SIZE bounds the entries,
+    CONTENT_CACHE_TTL_SECONDS ages them out. CONTENT_CACHE_NEAR_DUPLICATES=off
+    keeps only exact matches; CONTENT_CACHE_SIMILARITY is the near-match threshold.
+    """
+    if os.environ.get("CONTENT_CACHE", "on").lower() == "off":
+        return None
+    return ContentCache(
+        max_entries=int(os.environ.get("CONTENT_CACHE_SIZE", 1000)),
+        ttl_seconds=float(os.environ.get("CONTENT_CACHE_TTL_SECONDS", 86400)),
+        near_duplicates=os.environ.get("CONTENT_CACHE_NEAR_DUPLICATES", "on").lower() != "off",
+        threshold=float(os.environ.get("CONTENT_CACHE_SIMILARITY", 0.75)))
@@ -1,11 +1,20 @@
 import os
 import json
-import re
+import time
+import asyncio
+from typing import List, Optional
 import vertexai
-from vertexai.generative_models import GenerativeModel
-from fastapi import FastAPI, HTTPException
+from vertexai.generative_models import GenerationConfig, GenerativeModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 # Make sure your models.py includes 'language' in the AnalysisResultPayload
-from models import AnalysisResultPayload, ContentResult
+from models import AnalysisResultPayload, ContentResult, Outline, Slide
+from slide_stream import SlideStreamParser
+from structured_output import JSONRepairError, as_object, parse_model_json, response_schema
+from content_cache import content_cache_from_env
+import tracing
+import metrics
 
 # --- FastAPI App and Vertex AI Initialization ------------------------------
 app = FastAPI(
@@ -13,6 +22,26 @@ app = FastAPI(
     description="Generates presentation content using Gemini.",
     version="2.1.0",
 )
+# TRACE_EXPORTER selects "off" (default), "console" or "file" (TRACE_FILE); see tracing.py.
+tracing.init_tracing("content-generation-service")
+tracing.instrument_app(app)
+metrics.instrument_app(app)
+json_extraction_failures = metrics.Counter(
+    "json_extraction_failures_total", "Model responses that could not be parsed into slides.")
+json_parses = metrics.Counter(
+    "model_json_parses_total", "Model responses parsed as JSON, by result (clean, repaired or failed).",
+    ["result"])
+# Decks already written for the same (or a near-identical) request; None when
+# CONTENT_CACHE=off. See content_cache.py for the size, TTL and similarity settings.
+content_cache = content_cache_from_env()
+if content_cache:
+    metrics.CallbackMetric(
+        "content_cache_lookups_total", "Content cache lookups, by result.", "counter",
+        lambda: {("exact_hit",): content_cache.exact_hits, ("near_hit",): content_cache.near_hits,
+                 ("miss",): content_cache.misses}, ("result",))
+first_slide_latency = metrics.Histogram(
+    "content_first_slide_seconds", "Time from a streaming request to its first slide.",
+    buckets=metrics.SLOW_LATENCY_BUCKETS)
 
 try:
     PROJECT_ID = os.environ.get("GCP_PROJECT")
@@ -26,34 +55,71 @@ except Exception as e:
     print(f"❌ ERROR: Failed to initialize Vertex AI: {e}")
     model = None
 
-# --- Helper Function (No changes here) ---------------------------------------
-def extract_json_from_string(text: str) -> str:
-    """
-    Safely extracts a JSON object from a string, even with markdown fences.
-    """
-    pattern = r'```json\s*(\{.*?\})\s*```'
-    fallback_pattern = r'(\{.*?\})'
-    
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        return match.group(1)
-    
-    match = re.search(fallback_pattern, text, re.DOTALL)
-    return match.group(1) if match else ""
+MODEL_NAME = "gemini-2.5-flash"
+# Gemini is constrained to the response models' shape (JSON mode with a
+# schema), so broken output is rare; what still breaks is repaired, and a
+# slide that cannot be repaired is asked for again on its own, up to
+# CONTENT_SLIDE_RETRIES times, instead of failing the whole deck.
+DECK_CONFIG = GenerationConfig(response_mime_type="application/json",
+                               response_schema=response_schema(ContentResult, exclude=("image_base64", "missing_slides")))
+SLIDE_CONFIG = GenerationConfig(response_mime_type="application/json",
+                                response_schema=response_schema(Slide, exclude=("image_base64",)))
+OUTLINE_CONFIG = GenerationConfig(response_mime_type="application/json", response_schema=response_schema(Outline))
+SLIDE_RETRIES = int(os.environ.get("CONTENT_SLIDE_RETRIES", 2))
+# Decks of at least CONTENT_FAN_OUT_MIN_SLIDES slides (0 = never) are written
+# in two phases: a short outline call, then every slide at once, at most
+# CONTENT_FAN_OUT_CONCURRENCY calls in flight per deck. The wall-clock cost
+# is about one outline call plus one slide call instead of growing with
+# the slide count. Smaller decks stay a single call, which is cheaper. The
+# same cap applies to slides regenerated after a single-call deck.
+FAN_OUT_MIN_SLIDES = int(os.environ.get("CONTENT_FAN_OUT_MIN_SLIDES", 8))
+FAN_OUT_CONCURRENCY = max(1, int(os.environ.get("CONTENT_FAN_OUT_CONCURRENCY", 6)))
 
-# --- API Endpoint (Updated) ------------------------------------------------
-# --- API Endpoint (Updated) ------------------------------------------------
-@app.post("/generate-content", response_model=ContentResult)
-async def generate_content(request: AnalysisResultPayload):
+# --- Parsing -----------------------------------------------------------------
+def parse_json(text: str):
+    """parse_model_json, counted by outcome."""
+    try:
+        parsed = parse_model_json(text)
+    except JSONRepairError:
+        json_parses.inc(result="failed")
+        raise
+    json_parses.inc(result="repaired" if parsed.repairs else "clean")
+    if parsed.repairs:
+        print(f"--- Repaired the model's JSON: {', '.join(parsed.repairs)} ---")
+    return parsed
+
+def valid_slide(raw) -> Optional[Slide]:
+    """The slide if it is usable as written: the right shape, a title, and points for a bullet slide."""
+    if not isinstance(raw, dict):
+        return None
+    try:
+        slide = Slide(**raw)
+    except (TypeError, ValidationError):
+        return None
+    if not slide.data.title or (slide.layout == "bullet_points" and not (slide.data.points or slide.data.items)):
+        return None
+    return slide
+
+def parse_slides(text: str, slide_count: int) -> List[Optional[Slide]]:
     """
-    Generates the full presentation content (titles and bullet points)
-    in a single, efficient API call, now including language.
+    Every slide in the model's response, with None in place of each one that
+    is malformed, including the last one when the response was cut short,
+    and for each slide short of `slide_count`. Raises JSONRepairError when no
+    slides array can be recovered at all.
     """
-    if not model:
-        raise HTTPException(status_code=503, detail="Vertex AI model not available.")
-
-    print(f"--- Generating content for topic: '{request.topic[:80]}...' in {request.language} ---")
+    parsed = parse_json(text)
+    raw_slides = as_object(parsed.value, "slides")
+    raw_slides = raw_slides.get("slides") if isinstance(raw_slides, dict) else None
+    if not isinstance(raw_slides, list) or not raw_slides:
+        raise JSONRepairError("No slides array in the model's response.")
+    slides = [valid_slide(raw) for raw in raw_slides]
+    if parsed.truncated:
+        slides[-1] = None
+    return slides + [None] * (slide_count - len(slides))
 
+# --- Prompt ------------------------------------------------------------------
+def build_content_prompt(request: AnalysisResultPayload) -> str:
+    """The deck-writing prompt shared by the blocking and streaming endpoints."""
     # --- START OF CORRECTION ---
     # The prompt is relaxed. It now asks for a MIX of general points and
     # data-supported points, making citations optional and more natural.
@@ -107,17 +173,196 @@ async def generate_content(request: AnalysisResultPayload):
     Ensure the JSON is perfectly formatted.
     """
     # --- END OF CORRECTION ---
+    return prompt
+
+def build_outline_prompt(request: AnalysisResultPayload) -> str:
+    """The first call of a fanned-out generation: slide titles and layouts only."""
+    return f"""
+    You are an expert in creating professional presentations for the financial sector.
+    Plan a presentation as an outline of slide titles; the slides themselves are written later.
+
+    - The user's request is: "{request.topic}"
+    - The target audience is: "{request.target_audience}"
+    - The desired number of slides is: {request.slide_count}
+    - The presentation language MUST be: "{request.language}"
+
+    Return a single JSON object with a "slides" array of exactly {request.slide_count} objects,
+    each with "layout" and "title". The first slide's layout is "title_slide", every other one is
+    "bullet_points". Titles are short, specific and do not repeat each other; together they tell
+    the story of the deck in order.
+    """
+
+def build_slide_prompt(request: AnalysisResultPayload, titles: List[Optional[str]], index: int,
+                       layout: str) -> str:
+    """
+    Asks for one slide of the deck, with every slide's title for context.
+    titles[index] is the title the slide must have, or None to let the model pick one.
+    """
+    outline = "\n".join(
+        f"    {i + 1}. {title or ('(this slide)' if i == index else '(missing)')}" for i, title in enumerate(titles))
+    title = f'Its title is "{titles[index]}".' if titles[index] else ""
+    return f"""
+    You are an expert in creating professional presentations for the financial sector.
+    Write slide {index + 1} of a {len(titles)}-slide presentation. {title}
+
+    - The user's request is: "{request.topic}"
+    - The target audience is: "{request.target_audience}"
+    - The presentation language MUST be: "{request.language}"
+    - The deck's slides:
+{outline}
+
+    Cover only this slide's part of the story; the other slides cover theirs. Where a point rests
+    on a specific statistic, cite the source briefly in parentheses, e.g. (Source: Bloomberg, Oct 2025),
+    but most points need no citation.
+
+    Return a single JSON object with "layout": "{layout}" and "data".
+    - "title_slide" data: {{ "title": "...", "subtitle": "..." }}
+    - "bullet_points" data: {{ "title": "...", "points": ["...", "..."] }} with 4-5 concise points (under 25 words each).
+    """
+
+async def write_slide(request: AnalysisResultPayload, titles: List[Optional[str]], index: int, layout: str,
+                      retry: bool = False) -> Optional[Slide]:
+    """
+    Asks for one slide, trying again up to SLIDE_RETRIES times when the answer
+    is unusable; None if it never is. With retry, the first call is already
+    a retry (the slide came back broken from an earlier call).
+    """
+    prompt = build_slide_prompt(request, titles, index, layout)
+    operation = "regenerate_slide" if retry else "generate_slide"
+    for attempt in range(SLIDE_RETRIES + (0 if retry else 1)):
+        if retry or attempt > 0:
+            metrics.model_call_retries.inc(model=MODEL_NAME, operation="generate_content", error="InvalidSlide")
+        try:
+            with tracing.span(f"llm.{operation}", kind="CLIENT", **{"llm.model": MODEL_NAME, "slide.index": index}), \
+                    metrics.model_call(MODEL_NAME, operation):
+                response = await model.generate_content_async(prompt, generation_config=SLIDE_CONFIG)
+            slide = valid_slide(as_object(parse_json(response.text).value))
+        except Exception as e:
+            print(f"--- Writing slide {index + 1} failed (attempt {attempt + 1}): {e} ---")
+            continue
+        if slide is not None:
+            if retry or attempt > 0:
+                print(f"--- Regenerated slide {index + 1}. ---")
+            return slide
+    print(f"--- Dropping slide {index + 1}: it could not be regenerated. ---")
+    return None
+
+async def regenerate_slide(request: AnalysisResultPayload, slides: List[Optional[Slide]],
+                           index: int) -> Optional[Slide]:
+    """Re-requests one broken slide of a deck written in one call."""
+    titles = [slide.data.title if slide else None for slide in slides]
+    return await write_slide(request, titles, index, "title_slide" if index == 0 else "bullet_points", retry=True)
+
+# --- Outline, Then Fan Out ---------------------------------------------------
+def use_fan_out(request: AnalysisResultPayload) -> bool:
+    return 0 < FAN_OUT_MIN_SLIDES <= request.slide_count
+
+async def generate_outline(request: AnalysisResultPayload) -> Optional[Outline]:
+    """The deck's outline, or None when the outline call fails (the caller then writes the deck in one call)."""
     try:
-        response = await model.generate_content_async(prompt)
-        json_string = extract_json_from_string(response.text)
+        with tracing.span("llm.generate_outline", kind="CLIENT", **{"llm.model": MODEL_NAME}), \
+                metrics.model_call(MODEL_NAME, "generate_outline"):
+            response = await model.generate_content_async(build_outline_prompt(request),
+                                                          generation_config=OUTLINE_CONFIG)
+        parsed = parse_json(response.text)
+        outline = Outline(**as_object(parsed.value, "slides"))
+    except Exception as e:
+        print(f"--- Outline generation failed, writing the deck in one call: {e} ---")
+        return None
+    if parsed.truncated:
+        outline.slides = outline.slides[:-1]
+    if not outline.slides:
+        print("--- The outline has no slides, writing the deck in one call. ---")
+        return None
+    for index, item in enumerate(outline.slides):
+        item.layout = "title_slide" if index == 0 else "bullet_points"
+    print(f"--- Outlined {len(outline.slides)} slides. ---")
+    return outline
+
+def fan_out(request: AnalysisResultPayload, outline: Outline) -> List["asyncio.Task"]:
+    """
+    One task per slide, in deck order, at most FAN_OUT_CONCURRENCY running at
+    a time. Slides the outline came up short of are written without a title.
+    """
+    titles = [item.title for item in outline.slides]
+    titles += [None] * (request.slide_count - len(titles))
+    semaphore = asyncio.Semaphore(FAN_OUT_CONCURRENCY)
+
+    async def write(index: int) -> Optional[Slide]:
+        async with semaphore:
+            return await write_slide(request, titles, index, "title_slide" if index == 0 else "bullet_points")
 
-        if not json_string:
-            raise ValueError("Failed to extract JSON from the AI's response.")
+    return [asyncio.create_task(write(index)) for index in range(len(titles))]
+
+# --- API Endpoint (Updated) ------------------------------------------------
+@app.post("/generate-content", response_model=ContentResult, response_model_exclude_none=True)
+async def generate_content(request: AnalysisResultPayload):
+    """
+    Generates the full presentation content (titles and bullet points)
+    in a single, efficient API call, now including language. Decks of
+    FAN_OUT_MIN_SLIDES or more are outlined first and their slides written
+    concurrently.
+    """
+    if not model:
+        raise HTTPException(status_code=503, detail="Vertex AI model not available.")
+
+    print(f"--- Generating content for topic: '{request.topic[:80]}...' in {request.language} ---")
+    if content_cache and not request.force_refresh:
+        slides, match = content_cache.get(request)
+        if slides is not None:
+            print(f"--- Serving {len(slides)} cached slides ({match} match). ---")
+            return ContentResult(slides=slides)
+    prompt = build_content_prompt(request)
+    try:
+        outline = await generate_outline(request) if use_fan_out(request) else None
+        if outline is not None:
+            with tracing.span("llm.fan_out", **{"slides.outlined": len(outline.slides)}):
+                slides = list(await asyncio.gather(*fan_out(request, outline)))
+        else:
+            # The whole deck is asked for again only when nothing in the response
+            # could be salvaged; otherwise just the broken slides are.
+            for attempt in range(2):
+                with tracing.span("llm.generate_content", kind="CLIENT", **{"llm.model": MODEL_NAME}), \
+                        metrics.model_call(MODEL_NAME, "generate_content"):
+                    response = await model.generate_content_async(prompt, generation_config=DECK_CONFIG)
+                with tracing.span("json.extract", **{"llm.response_chars": len(response.text)}):
+                    try:
+                        slides = parse_slides(response.text, request.slide_count)
+                        break
+                    except JSONRepairError as e:
+                        json_extraction_failures.inc()
+                        if attempt == 1:
+                            raise
+                        print(f"--- No slides in the AI's response, asking again: {e} ---")
+                        metrics.model_call_retries.inc(model=MODEL_NAME, operation="generate_content",
+                                                       error="JSONRepairError")
 
-        content_data = json.loads(json_string)
-        result = ContentResult(**content_data)
-        
-        print(f"--- Successfully generated content for {len(result.slides)} slides. ---")
+            broken = [index for index, slide in enumerate(slides) if slide is None]
+            if broken:
+                # A truncated response for a large deck can leave many slides to redo; cap them like fan_out.
+                semaphore = asyncio.Semaphore(FAN_OUT_CONCURRENCY)
+
+                async def regenerate(index: int) -> Optional[Slide]:
+                    async with semaphore:
+                        return await regenerate_slide(request, slides, index)
+
+                with tracing.span("llm.regenerate_slides", **{"slides.broken": len(broken)}):
+                    regenerated = await asyncio.gather(*(regenerate(index) for index in broken))
+                for index, slide in zip(broken, regenerated):
+                    slides[index] = slide
+        result = ContentResult(slides=[slide for slide in slides if slide is not None])
+        if not result.slides:
+            raise ValueError("No usable slides in the AI's response.")
+
+        missing = request.slide_count - len(result.slides)
+        if missing > 0:
+            # Short of the requested deck even after regenerating: say so, and keep it out of the cache.
+            print(f"--- Generated {len(result.slides)} of {request.slide_count} slides. ---")
+            result.missing_slides = missing
+        else:
+            print(f"--- Successfully generated content for {len(result.slides)} slides. ---")
+            if content_cache:
+                content_cache.put(request, [slide.dict(exclude_none=True) for slide in result.slides])
         return result
 
     except Exception as e:
@@ -125,4 +370,135 @@ async def generate_content(request: AnalysisResultPayload):
         raw_response_text = "N/A"
         if 'response' in locals() and hasattr(response, 'text'):
             raw_response_text = response.text
-        raise HTTPException(status_code=500, detail=f"Failed to generate content: {e}. Raw AI Response: {raw_response_text}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to generate content: {e}. Raw AI Response: {raw_response_text}")
+
+# --- Streaming Endpoint ------------------------------------------------------
+@app.post("/generate-content/stream")
+async def generate_content_stream(request: AnalysisResultPayload, http_request: Request):
+    """
+    Streams each slide as soon as the model has finished writing it, so the
+    first slide arrives in seconds instead of after the whole deck. Large
+    decks are outlined and fanned out as in /generate-content. Sends
+    NDJSON lines ({"event": ..., ...}), or Server-Sent Events when the client
+    accepts text/event-stream. Events: "slide" {"index", "slide"} per slide,
+    then "done" {"slides": count} or "error" {"detail"}.
+    """
+    if not model:
+        raise HTTPException(status_code=503, detail="Vertex AI model not available.")
+
+    print(f"--- Streaming content for topic: '{request.topic[:80]}...' in {request.language} ---")
+    prompt = build_content_prompt(request)
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    traceparent = tracing.current_traceparent()
+
+    def encode(event: str, data: dict) -> str:
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, **data}) + "\n"
+
+    async def cached_stream(slides):
+        for index, slide in enumerate(slides):
+            yield encode("slide", {"index": index, "slide": slide})
+        yield encode("done", {"slides": len(slides)})
+
+    def done(streamed: List[dict]) -> bytes:
+        # Only a full deck is cached; a short one says how many slides it is missing.
+        missing = request.slide_count - len(streamed)
+        if missing <= 0:
+            if content_cache:
+                content_cache.put(request, streamed)
+            return encode("done", {"slides": len(streamed)})
+        return encode("done", {"slides": len(streamed), "missing_slides": missing})
+
+    async def fanned_out_stream(outline: Outline, start: float):
+        # Slides are written concurrently but sent in deck order, each as soon
+        # as it and every slide before it are done.
+        tasks = fan_out(request, outline)
+        streamed = []
+        try:
+            for task in tasks:
+                slide = await task
+                if slide is None:
+                    continue
+                if not streamed:
+                    first_slide_latency.observe(time.perf_counter() - start)
+                streamed.append(slide.dict(exclude_none=True))
+                yield encode("slide", {"index": len(streamed) - 1, "slide": streamed[-1]})
+        finally:
+            for task in tasks:
+                task.cancel()  # The client went away; stop writing slides nobody will read.
+        if not streamed:
+            yield encode("error", {"detail": "None of the outlined slides could be written."})
+            return
+        print(f"--- Streamed {len(streamed)} of {request.slide_count} slides. ---")
+        yield done(streamed)
+
+    async def event_stream():
+        start = time.perf_counter()
+        outline = await generate_outline(request) if use_fan_out(request) else None
+        if outline is not None:
+            async for event in fanned_out_stream(outline, start):
+                yield event
+            return
+        parser = SlideStreamParser()
+        streamed = []
+        written: List[Optional[Slide]] = []
+        count = 0
+
+        async def usable(raw_slide) -> Optional[Slide]:
+            # A broken slide is regenerated in place, so the stream keeps the deck's order.
+            slide = valid_slide(raw_slide)
+            if slide is None:
+                slide = await regenerate_slide(request, written + [None], len(written))
+            written.append(slide)
+            return slide
+
+        try:
+            with tracing.span("llm.generate_content_stream", kind="CLIENT", parent=traceparent,
+                              **{"llm.model": MODEL_NAME}), \
+                    metrics.model_call(MODEL_NAME, "generate_content_stream"):
+                responses = await model.generate_content_async(prompt, generation_config=DECK_CONFIG, stream=True)
+                async for chunk in responses:
+                    for raw_slide in parser.feed(chunk.text):
+                        slide = await usable(raw_slide)
+                        if slide is None:
+                            continue
+                        if count == 0:
+                            first_slide_latency.observe(time.perf_counter() - start)
+                        streamed.append(slide.dict(exclude_none=True))
+                        yield encode("slide", {"index": count, "slide": streamed[-1]})
+                        count += 1
+            # Finish a slide the response stopped partway through, then any it never got to.
+            cut_short = parser.in_slide
+            while cut_short or len(written) < request.slide_count:
+                cut_short = False
+                slide = await usable(None)
+                if slide is not None:
+                    streamed.append(slide.dict(exclude_none=True))
+                    yield encode("slide", {"index": count, "slide": streamed[-1]})
+                    count += 1
+        except Exception as e:
+            print(f"--- CRITICAL ERROR in streamed Content Generation: {e} ---")
+            yield encode("error", {"detail": f"Failed to generate content: {e}"})
+            return
+        if count == 0:
+            json_extraction_failures.inc()
+            yield encode("error", {"detail": f"No slides found in the AI's response. Raw AI Response: {parser.text}"})
+            return
+        print(f"--- Streamed {count} of {request.slide_count} slides. ---")
+        yield done(streamed)
+
+    cached = None
+    if content_cache and not request.force_refresh:
+        cached, match = content_cache.get(request)
+        if cached is not None:
+            print(f"--- Streaming {len(cached)} cached slides ({match} match). ---")
+    stream = cached_stream(cached) if cached is not None else event_stream()
+    return StreamingResponse(stream, media_type="text/event-stream" if use_sse else "application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/content/cache/stats")
+async def content_cache_stats():
+    if content_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **content_cache.stats()}
@@ -0,0 +1,213 @@
+# metrics.py
+# Prometheus metrics shared by every FinDeck service (identical copy in each).
+# Counters, gauges and histograms live in process memory and are rendered
+# in the Prometheus text exposition format (0.0.4) on GET /metrics. An
+# update is a dict lookup and an add under a lock, cheap enough for the
+# hot path.
+#
+# Each gunicorn worker process keeps its own numbers; scrape every worker
+# (or run one per container) rather than summing through the load balancer.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Prometheus' default buckets, for request handling in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Model calls and whole-deck stages take seconds to minutes.
+SLOW_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_metrics: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket, sum].
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the duration of the block in seconds, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(cumulative)}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {_number(cumulative)}"
+
+
+class CallbackMetric(_Metric):
+    """
+    Reads its values when scraped, for numbers another object already
+    keeps (e.g. cache hit counts or queue depth). `read` returns one value,
+    or a dict of label-value tuples to values.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, read: Callable[[], object],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._read = read
+
+    def samples(self) -> Iterator[str]:
+        values = self._read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+def generate_latest() -> str:
+    return "".join(metric.render() for metric in _metrics)
+
+
+# --- HTTP metrics ---
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request.", ("method", "route", "status"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled.")
+
+
+# --- Model call metrics (Vertex AI) ---
+model_call_duration = Histogram(
+    "model_call_duration_seconds", "Latency of calls to AI models.", ("model", "operation"),
+    buckets=SLOW_LATENCY_BUCKETS)
+model_call_errors = Counter(
+    "model_call_errors_total", "Failed AI model calls, by exception type.", ("model", "operation", "error"))
+model_call_retries = Counter(
+    "model_call_retries_total", "AI model calls retried, by the error that caused the retry.",
+    ("model", "operation", "error"))
+
+
+@contextmanager
+def model_call(model: str, operation: str) -> Iterator[None]:
+    """Times a model call and counts its failures by exception type."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        model_call_errors.inc(model=model, operation=operation, error=type(e).__name__)
+        raise
+    finally:
+        model_call_duration.observe(time.perf_counter() - start, model=model, operation=operation)
+
+
+def instrument_app(app) -> None:
+    """Times every request by route template and serves GET /metrics."""
+    from fastapi.responses import PlainTextResponse
+
+    @app.middleware("http")
+    async def measure_requests(request, call_next):
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            http_requests_in_flight.dec()
+            route = request.scope.get("route")
+            http_request_duration.observe(time.perf_counter() - start, method=request.method,
+                                          route=route.path if route is not None else "unmatched", status=status)
+
+    async def metrics_endpoint():
+        return PlainTextResponse(generate_latest(), media_type=CONTENT_TYPE)
+
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Optional
 
 # --- Input Models ---
 
@@ -13,23 +13,44 @@ class AnalysisResultPayload(BaseModel):
     slide_count: int
     theme: str
     language: str
+    # Write a new deck even when a cached one matches this request.
+    force_refresh: bool = False
 
 # --- Output/Result Models ---
 
+class SlideData(BaseModel):
+    """The text of a slide; which fields are set depends on the layout."""
+    title: Optional[str] = None
+    subtitle: Optional[str] = None
+    items: Optional[List[str]] = None
+    points: Optional[List[str]] = None
+    message: Optional[str] = None
+
 class Slide(BaseModel):
     """
     Defines the NEW structure for a single slide's content,
     matching the layout-driven format from the AI.
     """
     layout: str
-    data: Dict[str, Any]
+    data: SlideData
     # The image field is optional and will be added later by other services.
     image_base64: Optional[str] = None
     
 
+class OutlineSlide(BaseModel):
+    """One entry of a deck outline: what the slide is called and how it is laid out."""
+    layout: str
+    title: str
+
+class Outline(BaseModel):
+    """The first, short call of a fanned-out generation; each slide is then written separately."""
+    slides: List[OutlineSlide]
+
 class ContentResult(BaseModel):
     """
     The root object that the /generate-content endpoint returns.
     It's a list of the new, layout-aware Slide objects.
     """
     slides: List[Slide]
+    # Set when fewer than the requested slide_count could be written; such decks are never cached.
+    missing_slides: Optional[int] = None
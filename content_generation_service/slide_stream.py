@@ -0,0 +1,101 @@
+# slide_stream.py
+# Incremental parser for a streamed model response of the form
+#   {"slides": [ {...}, {...}, ... ]}
+# possibly wrapped in markdown fences. Text is fed in as it arrives and each
+# slide object is returned as soon as its closing brace is seen, long before
+# the whole document is complete. A bare top-level array of slides works too.
+#
+# Only structure is tracked (nesting, strings and escapes), so each character
+# is looked at once; a finished slide is then decoded, and repaired if need
+# be, by structured_output.parse_model_json.
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from structured_output import JSONRepairError, parse_model_json
+
+logger = logging.getLogger(__name__)
+
+
+class SlideStreamParser:
+    def __init__(self, array_key: str = "slides"):
+        self.array_key = array_key
+        self.text = ""
+        self.failures = 0      # Slide objects that closed but could not be repaired into JSON.
+        self._pos = 0
+        self._stack: List[str] = []   # Open '{' and '[' from the document root.
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None   # Key whose value comes next in the innermost object.
+        self._array_depth: Optional[int] = None   # Stack depth inside the slides array.
+        self._slide_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Optional[Dict[str, Any]]]:
+        """
+        Adds text and returns the slide objects it completed, in order, with
+        None for each one that could not be decoded so the caller can replace it.
+        """
+        self.text += chunk
+        slides = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:pos]
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif char == ":":
+                self._key = self._last_string
+            elif char in "{[":
+                if not self._stack and char == "[" and self._array_depth is None:
+                    self._array_depth = 1  # The response is a bare array of slides.
+                elif (char == "[" and self._array_depth is None and self._stack == ["{"]
+                        and self._key == self.array_key):
+                    self._array_depth = 2
+                self._stack.append(char)
+                self._key = None
+                if char == "{" and len(self._stack) - 1 == self._array_depth:
+                    self._slide_start = pos
+            elif char in "}]":
+                if not self._stack:
+                    continue  # Stray text outside the document, e.g. after a markdown fence.
+                closed_depth = len(self._stack)
+                self._stack.pop()
+                if char == "}" and self._slide_start is not None and closed_depth - 1 == self._array_depth:
+                    slides.append(self._decode(text[self._slide_start:pos + 1]))
+                    self._slide_start = None
+            elif char == ",":
+                self._key = None
+        self._pos = len(text)
+        return slides
+
+    def _decode(self, raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            parsed = parse_model_json(raw)
+        except JSONRepairError as e:
+            self.failures += 1
+            logger.warning(f"A streamed slide is not valid JSON: {e}")
+            return None
+        if parsed.repairs:
+            logger.info(f"Repaired a streamed slide: {', '.join(parsed.repairs)}")
+        return parsed.value if isinstance(parsed.value, dict) else None
+
+    @property
+    def in_slide(self) -> bool:
+        """Whether a slide object has been opened but not yet closed, e.g. when the response was cut short."""
+        return self._slide_start is not None
+
+    @property
+    def complete(self) -> bool:
+        """Whether the slides array has been closed."""
+        return self._array_depth is not None and len(self._stack) < self._array_depth
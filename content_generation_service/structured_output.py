@@ -0,0 +1,179 @@
+# structured_output.py
+# Getting JSON out of Gemini reliably (identical copy in each service that
+# parses model output).
+#
+# response_schema() turns a pydantic model into the OpenAPI-style schema
+# Vertex AI accepts as GenerationConfig.response_schema, so the model is
+# constrained to that shape. repair_json() is the safety net for whatever
+# still comes back malformed: one pass over the text that skips prose and
+# markdown fences, stops at the end of the first balanced object or array,
+# drops trailing commas and closes a truncated document.
+
+import json
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Type
+
+from pydantic import BaseModel
+
+# Keywords Vertex AI's response_schema understands; everything else
+# pydantic emits (title, default, additionalProperties...) is dropped.
+_SCHEMA_KEYS = ("type", "format", "description", "enum", "items", "properties", "required", "nullable",
+                "minItems", "maxItems")
+
+
+# --- Response Schemas ---
+def response_schema(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    The model's JSON schema with $refs inlined and Optional[...] turned into
+    nullable. Properties named in `exclude` (fields other services fill in,
+    such as images) are left out at every level. Class docstrings are
+    internal notes, not part of the contract, so model-level descriptions
+    are dropped; field descriptions are kept.
+    """
+    schema = model.model_json_schema() if hasattr(model, "model_json_schema") else model.schema()
+    definitions = {name: _without_description(definition)
+                   for name, definition in {**schema.get("definitions", {}), **schema.get("$defs", {})}.items()}
+    return _convert(_without_description(schema), definitions, frozenset(exclude))
+
+
+def _without_description(node: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in node.items() if key != "description"}
+
+
+def _convert(node: Dict[str, Any], definitions: Dict[str, Any], exclude: frozenset) -> Dict[str, Any]:
+    if "$ref" in node:
+        return _convert(definitions[node["$ref"].rsplit("/", 1)[-1]], definitions, exclude)
+    if "allOf" in node and len(node["allOf"]) == 1:
+        return _convert({**node["allOf"][0], **{k: v for k, v in node.items() if k != "allOf"}}, definitions, exclude)
+    if "anyOf" in node:
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        converted = _convert(options[0], definitions, exclude) if options else {"type": "string"}
+        if len(options) < len(node["anyOf"]):
+            converted["nullable"] = True
+        return converted
+    converted = {key: node[key] for key in _SCHEMA_KEYS if key in node}
+    if "properties" in converted:
+        converted["properties"] = {name: _convert(prop, definitions, exclude)
+                                   for name, prop in converted["properties"].items() if name not in exclude}
+        if "required" in converted:
+            converted["required"] = [name for name in converted["required"] if name not in exclude]
+    if "items" in converted:
+        converted["items"] = _convert(converted["items"], definitions, exclude)
+    return converted
+
+
+# --- Tolerant Parsing ---
+class JSONRepairError(ValueError):
+    pass
+
+
+class RepairedJSON(NamedTuple):
+    value: Any
+    repairs: List[str]   # e.g. ["trailing_comma", "truncated"]; empty when the text was valid as found.
+    truncated: bool
+
+
+def _closing(stack: List[str]) -> str:
+    return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+def repair_json(text: str) -> RepairedJSON:
+    """
+    Parses the first JSON object or array in `text`, repairing it if needed.
+    Raises JSONRepairError when there is nothing to salvage.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise JSONRepairError("No JSON object or array in the model's response.")
+
+    out: List[str] = []
+    stack: List[str] = []
+    repairs: List[str] = []
+    # Output length and open brackets just before each ',' and after each
+    # opener: where a truncated document can be cut back to a whole value.
+    cut_points: List[tuple] = []
+    in_string = escaped = False
+    end = None
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char == "\n":
+                out[-1] = "\\n"  # Raw newlines are not allowed inside JSON strings.
+                if "newline_in_string" not in repairs:
+                    repairs.append("newline_in_string")
+            continue
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+            cut_points.append((len(out), list(stack)))
+        elif char in "}]":
+            # Drop a trailing comma: [1, 2,] -> [1, 2]
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                if "trailing_comma" not in repairs:
+                    repairs.append("trailing_comma")
+            if not stack:
+                break
+            opener = stack.pop()
+            out.append("}" if opener == "{" else "]")  # A mismatched closer takes the expected shape.
+            if not stack:
+                end = pos
+                break
+        elif char == ",":
+            cut_points.append((len(out), list(stack)))
+            out.append(char)
+        else:
+            out.append(char)
+
+    if end is not None:
+        candidate = "".join(out)
+        try:
+            return RepairedJSON(json.loads(candidate), repairs, False)
+        except json.JSONDecodeError as e:
+            raise JSONRepairError(f"Unrepairable JSON in the model's response: {e}") from e
+
+    # Truncated: close the open string and brackets; if the last value is
+    # incomplete ("tru", a key without a value...), cut back to the previous
+    # whole value and try again.
+    repairs.append("truncated")
+    head = "".join(out) + ('"' if in_string else "")
+    attempts = [(head, stack)] + [("".join(out[:length]), opened) for length, opened in reversed(cut_points)]
+    for body, opened in attempts:
+        try:
+            return RepairedJSON(json.loads(body.rstrip().rstrip(",") + _closing(opened)), repairs, True)
+        except json.JSONDecodeError:
+            continue
+    raise JSONRepairError("Truncated JSON in the model's response could not be closed.")
+
+
+def parse_model_json(text: str) -> RepairedJSON:
+    """repair_json, but skips the scan when the text is already clean JSON (the usual case in schema mode)."""
+    try:
+        return RepairedJSON(json.loads(text), [], False)
+    except json.JSONDecodeError:
+        return repair_json(text)
+
+
+def as_object(value: Any, list_key: Optional[str] = None) -> Any:
+    """
+    Undoes the usual ways a model reshapes the object it was asked for: a
+    bare list becomes {list_key: list}, or without list_key a one-item list
+    becomes its item.
+    """
+    if isinstance(value, list):
+        if list_key:
+            return {list_key: value}
+        if len(value) == 1 and isinstance(value[0], dict):
+            return value[0]
+    return value
@@ -0,0 +1,67 @@
+# bench_batch.py
+# Throughput of /batch/generate versus one /generate-full-presentation call
+# per deck, with a fake image service and local storage.
+#
+# Run from design_generation_service/:
+#   python benchmarks/bench_batch.py --decks 40 --slides 8
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--decks", type=int, default=40)
+    parser.add_argument("--slides", type=int, default=8)
+    parser.add_argument("--theme", default="forest")
+    parser.add_argument("--image-latency", type=float, default=0.2, help="Seconds per fake image-service request.")
+    args = parser.parse_args()
+
+    fakes.configure_environment()
+    logging.basicConfig(level=logging.ERROR)
+    image_service = fakes.FakeImageService(fakes.make_image(), latency_seconds=args.image_latency)
+    image_service.install()
+
+    import main as design_main
+    from fastapi.testclient import TestClient
+
+    def deck_requests():
+        return [{"slides": fakes.sample_slides(args.slides, f"Portfolio Company {i} - Q3 Update"), "theme": args.theme}
+                for i in range(args.decks)]
+
+    results = {}
+    with TestClient(design_main.app) as client:
+        start = time.perf_counter()
+        image_service.requests = image_service.images_served = 0
+        for request in deck_requests():
+            client.post("/generate-full-presentation", json=request).raise_for_status()
+        elapsed = time.perf_counter() - start
+        results["sequential"] = {"seconds": elapsed, "decks_per_minute": args.decks / elapsed * 60,
+                                 "image_requests": image_service.requests, "images_generated": image_service.images_served}
+
+        start = time.perf_counter()
+        image_service.requests = image_service.images_served = 0
+        failures = 0
+        with client.stream("POST", "/batch/generate", json={"requests": deck_requests()}) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line and json.loads(line).get("error"):
+                    failures += 1
+        elapsed = time.perf_counter() - start
+        results["batch"] = {"seconds": elapsed, "decks_per_minute": args.decks / elapsed * 60,
+                            "image_requests": image_service.requests, "images_generated": image_service.images_served,
+                            "failures": failures}
+
+    print(json.dumps({"decks": args.decks, "slides_per_deck": args.slides, "render_executor": design_main.RENDER_EXECUTOR,
+                      "render_workers": design_main.RENDER_WORKERS, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# bench_http_pool.py
+# Per-call latency of a request to another service with a fresh
+# httpx.AsyncClient per call (the old behaviour) versus the pooled,
+# keep-alive client the service now creates at startup.
+#
+# By default it targets a local HTTP/1.1 server, which only shows the TCP
+# connect cost. Point --url at a deployed service (e.g. its /metrics) to
+# include DNS and the TLS handshake:
+#   python benchmarks/bench_http_pool.py --calls 200
+#   python benchmarks/bench_http_pool.py --url https://image-generation-service-....run.app/metrics
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive.
+    disable_nagle_algorithm = True  # Headers and body are separate writes.
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_local_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/"
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {"p50_ms": statistics.median(ordered) * 1000,
+            "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+            "mean_ms": statistics.mean(ordered) * 1000}
+
+
+async def fresh_client_calls(url: str, calls: int) -> list:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            (await client.get(url)).raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def pooled_client_calls(url: str, calls: int) -> list:
+    import main as design_main
+
+    client = design_main.create_image_client()
+    try:
+        (await client.get(url)).raise_for_status()  # Open the connection once, as a running service would have.
+        timings = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            (await client.get(url)).raise_for_status()
+            timings.append(time.perf_counter() - start)
+        return timings
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Endpoint to GET; defaults to a local keep-alive server.")
+    parser.add_argument("--calls", type=int, default=100)
+    args = parser.parse_args()
+
+    fakes.configure_environment()
+    logging.basicConfig(level=logging.ERROR)
+    url = args.url or start_local_server()
+    fresh = summarize(asyncio.run(fresh_client_calls(url, args.calls)))
+    pooled = summarize(asyncio.run(pooled_client_calls(url, args.calls)))
+    print(json.dumps({"url": url, "calls": args.calls, "fresh_client": fresh, "pooled_client": pooled,
+                      "saved_per_call_ms": fresh["p50_ms"] - pooled["p50_ms"]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench_images.py
+# Deck size and render time with and without the image normalization stage.
+#
+# Run from design_generation_service/:
+#   python benchmarks/bench_images.py --slides 20 --distinct-images 4
+
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slides", type=int, default=20)
+    parser.add_argument("--distinct-images", type=int, default=4)
+    parser.add_argument("--image-size", default="1408x792", help="Source image WxH in pixels.")
+    parser.add_argument("--themes", default="minimalist,forest,sunset")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    fakes.configure_environment()
+    logging.basicConfig(level=logging.ERROR)
+    import renderer
+    from image_pipeline import image_normalizer_from_env
+    from main import THEME_MAP, DEFAULT_TEMPLATE
+    from models import Slide
+    from template_cache import TemplateCache
+
+    cache = TemplateCache(THEME_MAP, DEFAULT_TEMPLATE)
+    cache.load()
+    renderer.use_template_cache(cache)
+
+    width, height = (int(v) for v in args.image_size.split("x"))
+    images = [base64.b64encode(fakes.make_image(width, height)).decode("utf-8") for _ in range(args.distinct_images)]
+    slides = [Slide(**s) for s in fakes.sample_slides(args.slides)]
+    for i, slide in enumerate(slides[1:]):
+        slide.layout = ("image_left", "image_right")[i % 2]
+        slide.image_base64 = images[i % len(images)]
+
+    normalizer = image_normalizer_from_env()
+    report = []
+    for theme in args.themes.split(","):
+        template_path = cache.get(theme).path
+        row = {"theme": theme}
+        for label, active in (("original", None), ("normalized", normalizer)):
+            renderer.image_normalizer = active
+            timings, size = [], 0
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                size = len(renderer.render_deck(template_path, slides, "bench").pptx)
+                timings.append(time.perf_counter() - start)
+            row[label] = {"deck_bytes": size, "render_seconds": statistics.median(timings)}
+        report.append(row)
+
+    print(json.dumps({"slides": args.slides, "distinct_images": args.distinct_images, "image_size": args.image_size,
+                      "dpi": normalizer.dpi, "format": normalizer.fmt, "quality": normalizer.quality,
+                      "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
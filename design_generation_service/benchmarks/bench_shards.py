@@ -0,0 +1,82 @@
+# bench_shards.py
+# Wall-clock render time of one large deck as it is split across more
+# process workers (render shards + package merge) versus a single worker.
+# Speedup is bounded by the number of cores; the report includes cpu_count.
+#
+# Run from design_generation_service/:
+#   python benchmarks/bench_shards.py --slides 400 --workers 4
+
+import os
+import sys
+import json
+import time
+import asyncio
+import base64
+import logging
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slides", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--image-ratio", type=float, default=0.5)
+    parser.add_argument("--distinct-images", type=int, default=20)
+    parser.add_argument("--theme", default="forest")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    fakes.configure_environment()
+    os.environ["RENDER_EXECUTOR"] = "process"
+    os.environ["RENDER_WORKERS"] = str(args.workers)
+    os.environ["RENDER_QUEUE_DEPTH"] = str(2 * args.workers)
+    logging.basicConfig(level=logging.ERROR)
+    import main as design_main
+    from models import Slide
+
+    design_main.template_cache.load()
+    template_path = design_main.template_cache.get(args.theme).path
+    images = [base64.b64encode(fakes.make_image(1408, 792)).decode("utf-8") for _ in range(args.distinct_images)]
+    slides = [Slide(**s) for s in fakes.sample_slides(args.slides)]
+    every = round(1 / args.image_ratio) if args.image_ratio else 0
+    for i, slide in enumerate(slides[1:]):
+        if every and i % every == 0:
+            slide.layout = ("image_left", "image_right")[i % 2]
+            slide.image_base64 = images[i % len(images)]
+
+    async def timed_render(shards: int) -> float:
+        design_main.RENDER_SHARDS = shards
+        start = time.perf_counter()
+        deck = await design_main.render(template_path, slides, "bench")
+        elapsed = time.perf_counter() - start
+        if deck.pptx_path:
+            os.remove(deck.pptx_path)
+        return elapsed
+
+    async def run() -> list:
+        design_main.render_pool.start()
+        try:
+            # Spawn every worker and parse the templates before timing anything.
+            await timed_render(args.workers)
+            results, baseline = [], None
+            shard_counts = sorted({1, *(n for n in (2, 4, 8, 16) if n <= args.workers), args.workers})
+            for shards in shard_counts:
+                timings = [await timed_render(shards) for _ in range(args.rounds)]
+                seconds = statistics.median(timings)
+                baseline = baseline or seconds
+                results.append({"shards": shards, "render_seconds": seconds,
+                                "slides_per_second": args.slides / seconds, "speedup": baseline / seconds})
+            return results
+        finally:
+            design_main.render_pool.shutdown()
+
+    print(json.dumps({"slides": args.slides, "workers": args.workers, "cpu_count": os.cpu_count(),
+                      "image_ratio": args.image_ratio, "theme": args.theme, "results": asyncio.run(run())}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
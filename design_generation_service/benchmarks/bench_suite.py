@@ -0,0 +1,186 @@
+# bench_suite.py
+# Sweeps the design pipeline over slide count, image ratio, template and
+# image size with a fake image service and local storage, and writes one
+# JSON report to compare across releases.
+#
+# Each configuration runs in its own subprocess so peak RSS belongs to that
+# configuration alone. Two targets:
+#   endpoint  POST /generate-full-presentation (images, render, upload)
+#   render    renderer.render_deck only (template fill + save)
+#
+# Run from design_generation_service/:
+#   python benchmarks/bench_suite.py --output bench.json
+#   python benchmarks/bench_suite.py --slides 5,50 --image-ratios 0.5 --themes forest --rounds 3
+
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import platform
+import resource
+import itertools
+import statistics
+import subprocess
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+IMAGE_LAYOUT_CYCLE = ("image_left", "image_right", "sticker_left", "sticker_right")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux and bytes on macOS. Process-mode render
+    # workers are counted once they have exited.
+    scale = 1 if sys.platform == "darwin" else 1024
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage * scale
+
+
+def deck_slides(count: int, image_ratio: float, deck_title: str) -> List[dict]:
+    """sample_slides with an exact share of the content slides switched to image layouts, spread evenly."""
+    slides = fakes.sample_slides(count, deck_title)
+    content = len(slides) - 1
+    wanted = round(content * image_ratio)
+    for n in range(wanted):
+        slides[1 + n * content // wanted]["layout"] = IMAGE_LAYOUT_CYCLE[n % len(IMAGE_LAYOUT_CYCLE)]
+    return slides
+
+
+# --- Child: one configuration ---
+def run_config(config: Dict) -> Dict:
+    fakes.configure_environment(use_blob_store=config["blob_store"])
+    os.environ["RENDER_EXECUTOR"] = config["executor"]
+    logging.basicConfig(level=logging.ERROR)
+    width, height = (int(v) for v in config["image_size"].split("x"))
+    image = fakes.make_image(width, height)
+    latencies, deck_bytes = [], 0
+
+    if config["target"] == "endpoint":
+        fakes.FakeImageService(image, latency_seconds=config["image_latency"]).install()
+        import main as design_main
+        from fastapi.testclient import TestClient
+
+        # Keep the layouts chosen by deck_slides so image_ratio is exact.
+        design_main.strategically_add_image_layouts = lambda slides, rng: slides
+        design_main.strategically_add_sticker_layouts = lambda slides, rng: slides
+        with TestClient(design_main.app) as client:
+            for round_index in range(config["warmup"] + config["rounds"]):
+                request = {"theme": config["theme"],
+                           "slides": deck_slides(config["slides"], config["image_ratio"], f"Deck {round_index}")}
+                start = time.perf_counter()
+                response = client.post("/generate-full-presentation", json=request)
+                elapsed = time.perf_counter() - start
+                response.raise_for_status()
+                if round_index >= config["warmup"]:
+                    latencies.append(elapsed)
+                    path = response.json()["download_url"].split("/files/", 1)[1]
+                    deck_bytes = os.path.getsize(os.path.join(os.environ["LOCAL_STORAGE_DIR"], path))
+    else:
+        import renderer
+        from main import THEME_MAP, DEFAULT_TEMPLATE
+        from models import Slide
+        from template_cache import TemplateCache
+
+        cache = TemplateCache(THEME_MAP, DEFAULT_TEMPLATE)
+        cache.load()
+        renderer.use_template_cache(cache)
+        template_path = cache.get(config["theme"]).path
+        image_base64 = base64.b64encode(image).decode("utf-8")
+        slides = []
+        for data in deck_slides(config["slides"], config["image_ratio"], "Deck"):
+            slide = Slide(**data)
+            if slide.layout in IMAGE_LAYOUT_CYCLE:
+                slide.image_base64 = image_base64
+            slides.append(slide)
+        for round_index in range(config["warmup"] + config["rounds"]):
+            start = time.perf_counter()
+            deck = renderer.render_deck(template_path, slides, "bench")
+            elapsed = time.perf_counter() - start
+            if round_index >= config["warmup"]:
+                latencies.append(elapsed)
+                deck_bytes = len(deck.pptx)
+
+    median = statistics.median(latencies)
+    return {
+        **config,
+        "slides_per_second": config["slides"] / median,
+        "latency_seconds": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                            "p99": percentile(latencies, 99), "min": min(latencies), "max": max(latencies)},
+        "peak_rss_bytes": peak_rss_bytes(),
+        "deck_bytes": deck_bytes,
+    }
+
+
+# --- Parent: the sweep ---
+def _csv(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=_csv(str), default=["endpoint", "render"])
+    parser.add_argument("--slides", type=_csv(int), default=[5, 20, 100, 500])
+    parser.add_argument("--image-ratios", type=_csv(float), default=[0.0, 0.5, 1.0])
+    parser.add_argument("--themes", type=_csv(str), default=["minimalist", "forest"])
+    parser.add_argument("--image-sizes", type=_csv(str), default=["512x288", "1408x792"])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--executor", default="inline", help="RENDER_EXECUTOR for the endpoint target.")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="Seconds per fake image-service request.")
+    parser.add_argument("--blob-store", action="store_true", help="Send images through the local blob store.")
+    parser.add_argument("--output", help="Write the report here instead of stdout.")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_config:
+        print(json.dumps(run_config(json.loads(args.run_config))))
+        return
+
+    results = []
+    grid = list(itertools.product(args.targets, args.slides, args.image_ratios, args.themes, args.image_sizes))
+    for n, (target, slides, ratio, theme, image_size) in enumerate(grid, 1):
+        if ratio == 0 and image_size != args.image_sizes[0]:
+            continue  # Image size is irrelevant without images.
+        config = {"target": target, "slides": slides, "image_ratio": ratio, "theme": theme,
+                  "image_size": image_size, "rounds": args.rounds, "warmup": args.warmup,
+                  "executor": args.executor, "image_latency": args.image_latency, "blob_store": args.blob_store}
+        print(f"[{n}/{len(grid)}] {json.dumps(config)}", file=sys.stderr)
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-config", json.dumps(config)],
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            results.append({**config, "error": child.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "suite": "design_generation_service",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                     text=True, cwd=fakes.SERVICE_DIR).stdout.strip() or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
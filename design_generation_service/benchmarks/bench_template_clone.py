@@ -0,0 +1,85 @@
+# bench_template_clone.py
+# Per-template cost of getting a private copy of a template: parsing the
+# file from disk (no cache), re-parsing the cached bytes, deep-copying the
+# parsed prototype, and whatever CachedTemplate.open() picked at load. The
+# threaded columns run THREADS renders' worth of clones at once, with the
+# old per-template lock around deepcopy versus the lock-free open().
+#
+# Run from design_generation_service/:  python benchmarks/bench_template_clone.py
+
+import io
+import os
+import sys
+import copy
+import time
+import logging
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from pptx import Presentation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from template_cache import TemplateCache  # noqa: E402
+
+TEMPLATES = {
+    "minimalist": "templates/Dark.pptx",
+    "streamline": "templates/Streamline.pptx",
+    "forest": "templates/Forest.pptx",
+    "sunset": "templates/Sunset.pptx",
+    "orbit": "templates/Orbit.pptx",
+}
+ROUNDS = 7
+THREADS = 4
+CLONES_PER_THREAD = 4
+
+
+def median_ms(clone) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        clone()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def threaded_ms(clone) -> float:
+    """Wall-clock milliseconds for THREADS threads to make CLONES_PER_THREAD clones each."""
+    def work():
+        for _ in range(CLONES_PER_THREAD):
+            clone()
+    with ThreadPoolExecutor(THREADS) as pool:
+        start = time.perf_counter()
+        for future in [pool.submit(work) for _ in range(THREADS)]:
+            future.result()
+        return (time.perf_counter() - start) * 1000
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    cache = TemplateCache(TEMPLATES, TEMPLATES["minimalist"])
+    cache.load()
+    print(f"{'template':<12}{'path ms':>9}{'bytes ms':>10}{'deepcopy ms':>13}{'open ms':>9}{'picked':>10}"
+          f"{'locked x' + str(THREADS) + ' ms':>16}{'open x' + str(THREADS) + ' ms':>14}{'speedup':>9}")
+    for theme, path in TEMPLATES.items():
+        template = cache.get(theme)
+        with open(path, "rb") as f:
+            data = f.read()
+        lock = threading.Lock()
+
+        def locked_deepcopy():
+            with lock:
+                return copy.deepcopy(template._prototype)
+
+        from_path = median_ms(lambda: Presentation(path))
+        from_bytes = median_ms(lambda: Presentation(io.BytesIO(data)))
+        deepcopied = median_ms(lambda: copy.deepcopy(template._prototype))
+        opened = median_ms(template.open)
+        locked = threaded_ms(locked_deepcopy)
+        lock_free = threaded_ms(template.open)
+        print(f"{theme:<12}{from_path:>9.1f}{from_bytes:>10.1f}{deepcopied:>13.1f}{opened:>9.1f}"
+              f"{template.clone_method:>10}{locked:>16.1f}{lock_free:>14.1f}{locked / lock_free:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
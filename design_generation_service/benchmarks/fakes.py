@@ -0,0 +1,107 @@
+# fakes.py
+# Stand-ins for the design service's external dependencies so benchmarks run
+# offline: a fake image service answering with fixed-size images and a local
+# storage directory instead of GCS.
+#
+# Call `configure_environment()` before importing `main`.
+
+import io
+import os
+import sys
+import json
+import base64
+import asyncio
+import tempfile
+
+import httpx
+from PIL import Image
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_IMAGE_SERVICE_URL = "http://fake-image-service/generate-images"
+
+
+def configure_environment(work_dir: str = None, use_blob_store: bool = False) -> str:
+    """Points storage (and optionally the blob store) at a scratch directory."""
+    work_dir = work_dir or tempfile.mkdtemp(prefix="deck-bench-")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_DIR"] = os.path.join(work_dir, "storage")
+    os.environ["IMAGE_SERVICE_URL"] = FAKE_IMAGE_SERVICE_URL
+    # Benchmarks repeat identical requests; measure building decks, not cache hits.
+    os.environ["RESULT_CACHE"] = "off"
+    os.environ.setdefault("TRACE_EXPORTER", "off")
+    if use_blob_store:
+        os.environ["IMAGE_BLOB_STORE_DIR"] = os.path.join(work_dir, "blobs")
+    else:
+        os.environ.pop("IMAGE_BLOB_STORE_DIR", None)
+    if SERVICE_DIR not in sys.path:
+        sys.path.insert(0, SERVICE_DIR)
+    os.chdir(SERVICE_DIR)
+    return work_dir
+
+
+def make_image(width: int = 1408, height: int = 792, fmt: str = "PNG") -> bytes:
+    """A noisy gradient, so encoders can't shrink it to nothing."""
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, fmt)
+    return buf.getvalue()
+
+
+class FakeImageService:
+    """Answers /generate-images requests with one fixed image per slide."""
+
+    def __init__(self, image: bytes, latency_seconds: float = 0.0):
+        self.image = image
+        self.image_base64 = base64.b64encode(image).decode("utf-8")
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+        self.images_served = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        slides = payload["slides"]
+        digest = None
+        if payload.get("image_transport") == "blob":
+            from blob_store import LocalBlobStore, image_size
+            digest = LocalBlobStore(os.environ["IMAGE_BLOB_STORE_DIR"]).put(self.image)
+            width, height = image_size(self.image)
+        for slide in slides:
+            if digest:
+                slide.update(image_sha256=digest, image_width=width, image_height=height)
+            else:
+                slide["image_base64"] = self.image_base64
+        self.images_served += len(slides)
+        return httpx.Response(200, json={"slides_with_images": slides})
+
+    def install(self) -> None:
+        """Routes every httpx.AsyncClient created afterwards to this fake."""
+        service = self
+        original_client = getattr(httpx.AsyncClient, "_original_client", httpx.AsyncClient)
+
+        class _FakeImageClient(original_client):
+            _original_client = original_client
+
+            def __init__(self, *args, **kwargs):
+                kwargs["transport"] = httpx.MockTransport(service.handle)
+                super().__init__(*args, **kwargs)
+
+        httpx.AsyncClient = _FakeImageClient
+
+
+def sample_slides(count: int, deck_title: str = "Quarterly Portfolio Update"):
+    """A title slide plus `count - 1` bullet slides, as the content service emits them."""
+    slides = [{"layout": "title_slide", "data": {"title": deck_title, "subtitle": "Q3 FY25"}}]
+    for i in range(1, count):
+        slides.append({"layout": "bullet_points", "data": {
+            "title": f"Portfolio company {i}: key metrics",
+            "points": [
+                f"Revenue grew {10 + i % 7}% year on year driven by pricing",
+                "EBITDA margin expanded 150bps on procurement savings",
+                "Net working capital released $12m of cash",
+                "Leverage reduced to 2.1x, ahead of covenant plan",
+            ],
+        }})
+    return slides
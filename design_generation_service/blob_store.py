@@ -0,0 +1,177 @@
+# blob_store.py
+# Content-addressed store for generated images: blobs are keyed by the
+# SHA-256 of their bytes, so services exchange short hashes instead of
+# base64 payloads. The store is bounded by total bytes: past the cap, the
+# least recently used blobs (by mtime, which put and open refresh) are
+# deleted, except blobs younger than a minimum age, which an in-flight deck
+# may still be about to read. Keep in sync between image_generation_service
+# and design_generation_service.
+
+import os
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore(ABC):
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Stores `data` and returns its SHA-256 hex digest."""
+
+    @abstractmethod
+    def open(self, digest: str) -> mmap.mmap:
+        """Returns a read-only memory map of the blob. Callers must close it."""
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        ...
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blobs live at `<root>/<first two hex chars>/<digest>` on a local or
+    shared disk, up to `max_bytes` in total (0 = unbounded). Blobs used in
+    the last `min_age_seconds` are never evicted.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int = 0, min_age_seconds: float = 3600):
+        self.root_dir = os.path.abspath(root_dir)
+        self.max_bytes = max(0, max_bytes)
+        self.min_age_seconds = min_age_seconds
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # Bytes on disk, counted on the first put; other processes' writes are picked up at each eviction.
+        self._bytes: Optional[int] = None
+
+    def _path(self, digest: str) -> str:
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob digest '{digest}'.")
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if self._touch(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never map a partially written blob.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.max_bytes:
+            with self._lock:
+                if self._bytes is None:
+                    self._bytes = sum(size for _, size, _ in self._entries())
+                else:
+                    self._bytes += len(data)
+                over_budget = self._bytes > self.max_bytes
+            if over_budget:
+                self._evict()
+        return digest
+
+    def open(self, digest: str) -> mmap.mmap:
+        path = self._path(digest)
+        with open(path, "rb") as f:
+            image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._touch(path)
+        return image
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Marks the blob as recently used; False when it does not exist."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _entries(self):
+        """(path, size, mtime) of every stored blob."""
+        for directory, _, names in os.walk(self.root_dir):
+            for name in names:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Evicted by another process.
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self) -> None:
+        """Deletes least recently used blobs until the store is at 90% of its budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        cutoff = time.time() - self.min_age_seconds
+        removed = 0
+        for path, size, mtime in entries:
+            if total <= target or mtime > cutoff:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._bytes = total
+        if total > self.max_bytes:
+            logger.warning(f"Blob store holds {total} bytes, over its {self.max_bytes} byte cap, "
+                           f"all used in the last {self.min_age_seconds:.0f}s.")
+        logger.info(f"Blob store evicted {removed} blobs; {total} bytes remain.")
+
+
+def blob_store_from_env() -> Optional[BlobStore]:
+    """
+    Returns the configured store, or None when IMAGE_BLOB_STORE_DIR is unset.
+    IMAGE_BLOB_STORE_MB caps its size (0 = unbounded) and
+    IMAGE_BLOB_STORE_MIN_AGE_SECONDS protects recently used blobs.
+    """
+    root_dir = os.environ.get("IMAGE_BLOB_STORE_DIR")
+    if not root_dir:
+        return None
+    return LocalBlobStore(root_dir,
+                          max_bytes=int(float(os.environ.get("IMAGE_BLOB_STORE_MB", 2048)) * 1024 * 1024),
+                          min_age_seconds=float(os.environ.get("IMAGE_BLOB_STORE_MIN_AGE_SECONDS", 3600)))
+
+
+def image_size(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """Reads pixel dimensions from a PNG or JPEG header without decoding the image."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            segment_length = struct.unpack(">H", data[i + 2:i + 4])[0]
+            # SOF0-SOF15, excluding DHT (C4), JPG (C8) and DAC (CC).
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                return width, height
+            i += 2 + segment_length
+    return None, None
@@ -0,0 +1,73 @@
+# circuit_breaker.py
+# Stops calling a dependency that keeps failing. After `failure_threshold`
+# consecutive failures the breaker opens and calls are skipped for
+# `reset_seconds`; then one trial call is let through (half-open). Its
+# success closes the breaker, its failure opens it again.
+#
+# State is per worker process: each worker finds out on its own, within
+# `failure_threshold` calls, that the dependency is down.
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = CLOSED
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether to make the call now. In half-open state one trial call is
+        allowed at a time; a trial that never reports back is replaced after
+        `reset_seconds`.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_seconds:
+                return False
+            if self._trial_started is not None and now - self._trial_started < self.reset_seconds:
+                return False
+            self._state = HALF_OPEN
+            self._trial_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit '{self.name}' closed.")
+            self._state = CLOSED
+            self.failures = 0
+            self._trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self._state == HALF_OPEN or (self._state == CLOSED and self.failures >= self.failure_threshold):
+                logger.warning(f"Circuit '{self.name}' opened after {self.failures} consecutive failures; "
+                               f"skipping calls for {self.reset_seconds:.0f}s.")
+                self._state = OPEN
+                self.opened_at = time.monotonic()
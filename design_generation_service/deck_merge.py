@@ -0,0 +1,174 @@
+# deck_merge.py
+# Merges decks rendered in parallel from the same template ("shards") into
+# one package at the zip level. The template parts come from the first
+# shard. Every shard's slides are appended in order and renumbered, and
+# media are deduplicated by content and renamed so names from different
+# shards cannot collide. presentation.xml, its relationships and the
+# content types are rewritten to list the merged slides. Shards may be
+# spool files; only the first and the one being copied are open at a time.
+
+import io
+import re
+import hashlib
+import logging
+import posixpath
+import zipfile
+from contextlib import nullcontext
+from typing import IO, Dict, List, Tuple, Union
+
+from lxml import etree
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.oxml import parse_xml
+
+logger = logging.getLogger(__name__)
+
+_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_TYPES_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+_R_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_PRESENTATION = "ppt/presentation.xml"
+_PRESENTATION_RELS = "ppt/_rels/presentation.xml.rels"
+_CONTENT_TYPES = "[Content_Types].xml"
+# Already compressed; deflating them again costs time and saves nothing.
+_STORED_EXTENSIONS = ("jpeg", "jpg", "png", "gif")
+
+
+def _rels_path(member: str) -> str:
+    directory, name = posixpath.split(member)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def _resolve(source: str, target: str) -> str:
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+
+def _shard_slides(shard: zipfile.ZipFile) -> List[str]:
+    """Slide members of `shard` in presentation order."""
+    presentation = etree.fromstring(shard.read(_PRESENTATION))
+    rels = etree.fromstring(shard.read(_PRESENTATION_RELS))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+    return [_resolve(_PRESENTATION, targets[sld_id.get(_R_ID)])
+            for sld_id in presentation.iter("{*}sldId")]
+
+
+class _MediaTable:
+    """Assigns one merged name per distinct media blob."""
+
+    def __init__(self):
+        self.names_by_sha1: Dict[str, str] = {}
+        self.next_index = 1
+
+    def reserve(self, member: str, blob: bytes) -> None:
+        """Keeps a media member of the first shard under its own name."""
+        self.names_by_sha1.setdefault(hashlib.sha1(blob).hexdigest(), member)
+        match = re.search(r"(\d+)\.\w+$", member)
+        if match:
+            self.next_index = max(self.next_index, int(match.group(1)) + 1)
+
+    def name_for(self, member: str, blob: bytes) -> Tuple[str, bool]:
+        """Returns (merged name, whether it still has to be written)."""
+        sha1 = hashlib.sha1(blob).hexdigest()
+        if sha1 in self.names_by_sha1:
+            return self.names_by_sha1[sha1], False
+        ext = member.rsplit(".", 1)[-1]
+        name = f"ppt/media/image{self.next_index}.{ext}"
+        self.next_index += 1
+        self.names_by_sha1[sha1] = name
+        return name, True
+
+
+def _write(out: zipfile.ZipFile, member: str, blob: bytes) -> None:
+    stored = member.rsplit(".", 1)[-1].lower() in _STORED_EXTENSIONS
+    out.writestr(member, blob, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+
+
+def _open_shard(shard: Union[bytes, str]) -> zipfile.ZipFile:
+    return zipfile.ZipFile(io.BytesIO(shard) if isinstance(shard, bytes) else shard)
+
+
+def merge_decks(shards: List[Union[bytes, str]], file: Union[str, IO[bytes]]) -> int:
+    """
+    Writes the merged deck to `file` (a path or a writable binary file) and
+    returns its slide count. Each shard is the deck's bytes or a path to
+    it. All shards must be rendered from the same template and contain only
+    slides the renderer produces (layout and image relationships).
+    """
+    with _open_shard(shards[0]) as base:
+        return _merge(base, shards, file)
+
+
+def _merge(base: zipfile.ZipFile, shards: List[Union[bytes, str]], file: Union[str, IO[bytes]]) -> int:
+    base_slides = set(_shard_slides(base))
+    skipped = {_PRESENTATION, _PRESENTATION_RELS, _CONTENT_TYPES}
+    skipped.update(base_slides, (_rels_path(slide) for slide in base_slides))
+
+    presentation = parse_xml(base.read(_PRESENTATION))
+    presentation_rels = etree.fromstring(base.read(_PRESENTATION_RELS))
+    content_types = etree.fromstring(base.read(_CONTENT_TYPES))
+
+    # Drop the first shard's slide list; every shard's slides are re-added below.
+    for rel in list(presentation_rels):
+        if rel.get("Type") == RT.SLIDE:
+            presentation_rels.remove(rel)
+    if presentation.sldIdLst is not None:
+        presentation.remove(presentation.sldIdLst)
+    for override in list(content_types):
+        if override.get("ContentType") == CT.PML_SLIDE:
+            content_types.remove(override)
+    defaults = {d.get("Extension").lower() for d in content_types.iter(f"{{{_TYPES_NS}}}Default")}
+
+    rel_numbers = [int(m.group(1)) for m in (re.fullmatch(r"rId(\d+)", r.get("Id")) for r in presentation_rels) if m]
+    next_rel = max(rel_numbers, default=0) + 1
+    sld_id_list = presentation.get_or_add_sldIdLst()
+    media = _MediaTable()
+
+    slide_count = 0
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED, strict_timestamps=False) as out:
+        for member in base.namelist():
+            if member in skipped:
+                continue
+            blob = base.read(member)
+            if member.startswith("ppt/media/"):
+                media.reserve(member, blob)
+            _write(out, member, blob)
+
+        for index, source in enumerate(shards):
+            with nullcontext(base) if index == 0 else _open_shard(source) as shard:
+                # Extensions (e.g. jpeg) first used by a later shard need a Default entry too.
+                for default in list(etree.fromstring(shard.read(_CONTENT_TYPES)).iter(f"{{{_TYPES_NS}}}Default")):
+                    if default.get("Extension").lower() not in defaults:
+                        defaults.add(default.get("Extension").lower())
+                        content_types.insert(0, default)
+
+                for slide in _shard_slides(shard):
+                    slide_count += 1
+                    merged_slide = f"ppt/slides/slide{slide_count}.xml"
+                    slide_rels = etree.fromstring(shard.read(_rels_path(slide)))
+                    for rel in slide_rels:
+                        if rel.get("TargetMode") == "External":
+                            continue
+                        target = _resolve(slide, rel.get("Target"))
+                        if rel.get("Type") == RT.IMAGE:
+                            blob = shard.read(target)
+                            name, is_new = media.name_for(target, blob)
+                            if is_new:
+                                _write(out, name, blob)
+                            rel.set("Target", posixpath.relpath(name, "ppt/slides"))
+                        elif rel.get("Type") != RT.SLIDE_LAYOUT:
+                            raise ValueError(f"Cannot merge {slide}: unsupported relationship {rel.get('Type')}.")
+                    out.writestr(merged_slide, shard.read(slide))
+                    out.writestr(_rels_path(merged_slide), etree.tostring(slide_rels, xml_declaration=True,
+                                                                          encoding="UTF-8", standalone=True))
+
+                    rel_id = f"rId{next_rel}"
+                    next_rel += 1
+                    etree.SubElement(presentation_rels, f"{{{_RELS_NS}}}Relationship",
+                                     Id=rel_id, Type=RT.SLIDE, Target=f"slides/slide{slide_count}.xml")
+                    sld_id_list._add_sldId(id=255 + slide_count, rId=rel_id)
+                    etree.SubElement(content_types, f"{{{_TYPES_NS}}}Override",
+                                     PartName=f"/{merged_slide}", ContentType=CT.PML_SLIDE)
+
+        for member, element in ((_PRESENTATION, presentation), (_PRESENTATION_RELS, presentation_rels),
+                                (_CONTENT_TYPES, content_types)):
+            out.writestr(member, etree.tostring(element, xml_declaration=True, encoding="UTF-8", standalone=True))
+    logger.info(f"Merged {len(shards)} shards into {slide_count} slides and {len(media.names_by_sha1)} media files.")
+    return slide_count
@@ -0,0 +1,122 @@
+# deck_writer.py
+# Bounded-memory writer for very large decks. python-pptx keeps every slide
+# tree and image blob alive until prs.save, which then serializes them all
+# at once. StreamingDeckWriter instead writes each finished slide (and any
+# new media it uses) into the output zip immediately and strips the part
+# down to what the package still needs: its name, content type and
+# relationships. The template's own parts, presentation.xml and the content
+# types are written on close().
+#
+# Relies on python-pptx 1.x part internals (_element, _blob, lazyproperty
+# caches); see requirements.txt.
+
+import zipfile
+import logging
+from typing import IO, NamedTuple, Set, Union
+
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.package import Part
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.parts.image import ImagePart
+
+logger = logging.getLogger(__name__)
+
+# Instance attributes a written part keeps; everything else (the XML tree,
+# the image blob, cached wrapper objects holding either) is dropped.
+_PART_ATTRIBUTES = ("_partname", "_content_type", "_package", "_rels")
+
+
+class _WrittenPart(Part):
+    """A slide part already in the zip. Still listed in content types; never serialized again."""
+
+    @property
+    def blob(self) -> bytes:
+        raise RuntimeError(f"{self.partname} was already written by StreamingDeckWriter.")
+
+
+class _WrittenImage(NamedTuple):
+    """Stands in for pptx.parts.image.Image once the blob is gone; identifies the image only."""
+    sha1: str
+
+
+class _WrittenImagePart(ImagePart):
+    """
+    An image part already in the zip. Keeps its sha1, pixel size and dpi so
+    python-pptx can still deduplicate against it and size placeholders for a
+    later slide reusing the same image.
+    """
+
+    @property
+    def blob(self) -> bytes:
+        raise RuntimeError(f"{self.partname} was already written by StreamingDeckWriter.")
+
+    @property
+    def image(self) -> _WrittenImage:
+        return _WrittenImage(self.sha1)
+
+    @property
+    def _px_size(self):
+        return self._written_px_size
+
+    @property
+    def _dpi(self):
+        return self._written_dpi
+
+
+def _strip(part: Part, part_cls: type, **kept) -> None:
+    state = {name: part.__dict__[name] for name in _PART_ATTRIBUTES if name in part.__dict__}
+    part.__dict__.clear()
+    part.__dict__.update(state, **kept)
+    part.__class__ = part_cls
+
+
+class StreamingDeckWriter:
+    """
+    Streams `prs` into a zip at `file` (a path or a writable binary file).
+    Call write_slide() for each slide as soon as it is filled, then close().
+    A written slide must not be touched again.
+    """
+
+    def __init__(self, prs, file: Union[str, IO[bytes]]):
+        self.prs = prs
+        self._zip = zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED, strict_timestamps=False)
+        self._written: Set[str] = set()
+        self.slides_written = 0
+
+    def _write(self, part: Part) -> None:
+        self._zip.writestr(part.partname.membername, part.blob)
+        if part._rels:
+            self._zip.writestr(part.partname.rels_uri.membername, part.rels.xml)
+        self._written.add(part.partname)
+
+    def write_slide(self, slide) -> None:
+        part = slide.part
+        for rel in part.rels.values():
+            if rel.is_external or rel.reltype != RT.IMAGE:
+                continue
+            image_part = rel.target_part
+            if image_part.partname in self._written or not isinstance(image_part, ImagePart):
+                continue
+            sha1, px_size, dpi = image_part.sha1, image_part._px_size, image_part._dpi
+            self._write(image_part)
+            _strip(image_part, _WrittenImagePart, _filename=image_part._filename, sha1=sha1,
+                   _written_px_size=px_size, _written_dpi=dpi)
+        self._write(part)
+        _strip(part, _WrittenPart)
+        self.slides_written += 1
+
+    def close(self) -> None:
+        """Writes the remaining parts, package relationships and content types, and closes the zip."""
+        package = self.prs.part.package
+        parts = list(package.iter_parts())
+        for part in parts:
+            if part.partname not in self._written:
+                self._write(part)
+        self._zip.writestr(PACKAGE_URI.rels_uri.membername, package._rels.xml)
+        self._zip.writestr(CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        self._zip.close()
+
+    def abort(self) -> None:
+        self._zip.close()
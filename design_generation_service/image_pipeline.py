@@ -0,0 +1,103 @@
+# image_pipeline.py
+# Fits generated images to their picture placeholder before insertion:
+# center-crop to the placeholder's aspect ratio, downscale to its size at a
+# target DPI, and re-encode. Full-resolution Imagen PNGs otherwise inflate
+# every deck, prs.save, the upload and the user's download.
+
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+EMU_PER_INCH = 914400
+
+
+class ImageNormalizer:
+    """
+    `fmt` is "jpeg", "png" or "auto" (JPEG unless the image has transparency,
+    which JPEG cannot keep). Images are never upscaled.
+    """
+
+    def __init__(self, dpi: int = 150, fmt: str = "auto", quality: int = 85, threads: int = 4):
+        if fmt not in ("auto", "jpeg", "png"):
+            raise ValueError(f"Unknown image format '{fmt}'; expected 'auto', 'jpeg' or 'png'.")
+        self.dpi = dpi
+        self.fmt = fmt
+        self.quality = quality
+        self.threads = max(1, threads)
+
+    def target_pixels(self, width_emu: int, height_emu: int) -> Tuple[int, int]:
+        return (max(1, round(width_emu / EMU_PER_INCH * self.dpi)),
+                max(1, round(height_emu / EMU_PER_INCH * self.dpi)))
+
+    def normalize(self, source, width_emu: int, height_emu: int) -> bytes:
+        """`source` is image bytes or a binary file object; returns the re-encoded image."""
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        image.load()
+        target_w, target_h = self.target_pixels(width_emu, height_emu)
+
+        # Crop to the placeholder's aspect ratio (python-pptx would otherwise
+        # keep the hidden margins in the file and crop on display).
+        target_ratio = target_w / target_h
+        w, h = image.size
+        if w / h > target_ratio:
+            crop_w = round(h * target_ratio)
+            left = (w - crop_w) // 2
+            image = image.crop((left, 0, left + crop_w, h))
+        elif w / h < target_ratio:
+            crop_h = round(w / target_ratio)
+            top = (h - crop_h) // 2
+            image = image.crop((0, top, w, top + crop_h))
+        if image.width > target_w:
+            image = image.resize((target_w, target_h), Image.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        out = io.BytesIO()
+        if self.fmt == "png" or (self.fmt == "auto" and has_alpha):
+            image.save(out, "PNG", optimize=True)
+        else:
+            image.convert("RGB").save(out, "JPEG", quality=self.quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def normalize_batch(self, jobs: List[Tuple[Hashable, Callable, int, int]]) -> Dict[Hashable, Optional[bytes]]:
+        """
+        Normalizes many images concurrently (Pillow releases the GIL while
+        decoding, resizing and encoding). Each job is (key, open_source,
+        width_emu, height_emu), where `open_source` is a context manager
+        factory yielding the source image. Jobs sharing a key are processed
+        once. A failed image maps to None.
+        """
+        unique = {}
+        for key, open_source, width_emu, height_emu in jobs:
+            unique.setdefault(key, (open_source, width_emu, height_emu))
+
+        def run(key):
+            open_source, width_emu, height_emu = unique[key]
+            try:
+                with open_source() as source:
+                    return self.normalize(source, width_emu, height_emu) if source else None
+            except Exception as e:
+                logger.warning(f"Image normalization failed; the original image will be used. Error: {e}")
+                return None
+
+        if len(unique) <= 1:
+            return {key: run(key) for key in unique}
+        with ThreadPoolExecutor(max_workers=min(self.threads, len(unique))) as executor:
+            return dict(zip(unique, executor.map(run, unique)))
+
+
+def image_normalizer_from_env() -> Optional[ImageNormalizer]:
+    """Returns the configured normalizer, or None when IMAGE_NORMALIZE=0."""
+    if os.environ.get("IMAGE_NORMALIZE", "1") == "0":
+        return None
+    return ImageNormalizer(
+        dpi=int(os.environ.get("IMAGE_DPI", 150)),
+        fmt=os.environ.get("IMAGE_FORMAT", "auto"),
+        quality=int(os.environ.get("IMAGE_QUALITY", 85)),
+        threads=int(os.environ.get("IMAGE_NORMALIZE_THREADS", 4)),
+    )
@@ -0,0 +1,243 @@
+# jobs.py
+# Job registry and bounded background queue for asynchronous deck generation.
+
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from models import JobStatus
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("succeeded", "failed")
+
+
+# --- Job Stores ---
+class JobStore(ABC):
+    # Whether other processes write to this store too; their updates wake
+    # no watcher here, so JobRegistry.watch polls shared stores.
+    shared = False
+
+    @abstractmethod
+    def save(self, status: JobStatus) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        ...
+
+
+class InMemoryJobStore(JobStore):
+    """Keeps the most recent `max_jobs` jobs in this process."""
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, JobStatus]" = OrderedDict()
+
+    def save(self, status: JobStatus) -> None:
+        self._jobs[status.job_id] = status
+        self._jobs.move_to_end(status.job_id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        return self._jobs.get(job_id)
+
+
+class FileJobStore(JobStore):
+    """
+    One JSON file per job under `root_dir`. Survives restarts and can be
+    shared by gunicorn workers and replicas mounting the same volume. Each
+    new job prunes jobs not updated for `retention_seconds`, then the least
+    recently updated ones beyond `max_jobs`; file mtimes stand in for the
+    jobs' last update.
+    """
+
+    shared = True
+
+    def __init__(self, root_dir: str, max_jobs: int = 1000, retention_seconds: float = 86400):
+        self.root_dir = os.path.abspath(root_dir)
+        self.max_jobs = max_jobs
+        self.retention_seconds = retention_seconds
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.root_dir, f"{os.path.basename(job_id)}.json")
+
+    def save(self, status: JobStatus) -> None:
+        path = self._path(status.job_id)
+        is_new = not os.path.exists(path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".part")
+        with os.fdopen(fd, "w") as f:
+            json.dump(status.dict(), f)
+        os.replace(tmp_path, path)
+        if is_new:
+            self._prune()
+
+    def _prune(self) -> None:
+        entries = []
+        for entry in os.scandir(self.root_dir):
+            if entry.name.endswith((".json", ".part")):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass  # Pruned by another worker.
+        cutoff = time.time() - self.retention_seconds
+        expired = [path for mtime, path in entries if mtime < cutoff]
+        # Only whole job files count towards max_jobs; a young .part is another worker's save in progress.
+        kept = sorted((mtime, path) for mtime, path in entries if mtime >= cutoff and path.endswith(".json"))
+        for path in expired + [path for _, path in kept[:max(0, len(kept) - self.max_jobs)]]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        try:
+            with open(self._path(job_id)) as f:
+                return JobStatus(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+
+def job_store_from_env() -> JobStore:
+    """
+    JOB_STORE selects "memory" or "file" (JOB_STORE_DIR). Unset, it is "file"
+    whenever gunicorn runs more than one worker (WEB_CONCURRENCY > 1): each
+    worker has its own memory, so a job created on one worker would be
+    unknown to the others and its status requests would 404 half the time.
+    Either store keeps at most JOB_STORE_MAX_JOBS jobs; the file store also
+    drops jobs not updated for JOB_STORE_RETENTION_SECONDS.
+    """
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    backend = os.environ.get("JOB_STORE", "file" if workers > 1 else "memory")
+    if backend == "memory" and workers > 1:
+        logger.warning(f"JOB_STORE=memory with {workers} workers: job status requests that reach "
+                       "another worker will not find the job.")
+    if backend == "memory":
+        return InMemoryJobStore(int(os.environ.get("JOB_STORE_MAX_JOBS", 1000)))
+    if backend == "file":
+        return FileJobStore(os.environ.get("JOB_STORE_DIR", "jobs"), int(os.environ.get("JOB_STORE_MAX_JOBS", 1000)),
+                            float(os.environ.get("JOB_STORE_RETENTION_SECONDS", 24 * 3600)))
+    raise ValueError(f"Unknown JOB_STORE '{backend}'; expected 'memory' or 'file'.")
+
+
+# --- Registry ---
+class JobRegistry:
+    """Creates and updates job statuses and wakes up anyone watching a job."""
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    def create(self, job_id: str) -> JobStatus:
+        now = time.time()
+        status = JobStatus(job_id=job_id, created_at=now, updated_at=now)
+        self.store.save(status)
+        return status
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        return self.store.get(job_id)
+
+    def update(self, job_id: str, **changes) -> Optional[JobStatus]:
+        status = self.store.get(job_id)
+        if status is None:
+            return None
+        status = status.copy(update={**changes, "updated_at": time.time()})
+        self.store.save(status)
+        event = self._changed.pop(job_id, None)
+        if event:
+            event.set()
+        return status
+
+    async def watch(self, job_id: str, heartbeat: float = 15.0,
+                    poll: float = 1.0) -> AsyncIterator[Optional[JobStatus]]:
+        """
+        Yields the job's status whenever it changes, until it finishes.
+        Yields None after `heartbeat` seconds without a change. A shared
+        store is also re-read every `poll` seconds, to pick up updates
+        written by the worker or replica that is running the job.
+        """
+        last_update = None
+        last_yield = time.monotonic()
+        wait = min(poll, heartbeat) if self.store.shared else heartbeat
+        while True:
+            # Register before reading so an update in between still wakes us.
+            event = self._changed.setdefault(job_id, asyncio.Event())
+            status = self.store.get(job_id)
+            if status is None or status.state in TERMINAL_STATES:
+                self._changed.pop(job_id, None)
+            if status is None:
+                return
+            if status.updated_at != last_update:
+                last_update = status.updated_at
+                last_yield = time.monotonic()
+                yield status
+                if status.state in TERMINAL_STATES:
+                    return
+                continue
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_yield >= heartbeat:
+                    last_yield = time.monotonic()
+                    yield None
+
+
+# --- Background Queue ---
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class JobQueue:
+    """A bounded queue drained by a fixed number of asyncio worker tasks."""
+
+    def __init__(self, handler: Callable[..., Awaitable[None]], workers: int, max_queue: int):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, *args) -> None:
+        try:
+            self._queue.put_nowait(args)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self._queue.qsize()} jobs waiting).")
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            args = await self._queue.get()
+            try:
+                await self.handler(*args)
+            except asyncio.CancelledError:
+                if self._stopping:
+                    raise
+                # The job was cancelled from below (e.g. its render pool was
+                # restarted), not this worker; keep draining the queue.
+                logger.warning(f"Job worker {worker_id}: job was cancelled.")
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
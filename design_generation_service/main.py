@@ -2,34 +2,77 @@
 
 # --- Imports ---
 import os
+import json
 import uuid
+import time
+import asyncio
 import logging
-import tempfile
-import base64
-import io
 import random
-from typing import Dict, List, Tuple, Optional
+import importlib.util
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Tuple
 
 import httpx
 from fastapi import FastAPI, HTTPException
-from google.cloud import storage
-from pptx import Presentation
-from pptx.slide import Slide as PptxSlide
-from pptx.shapes.placeholder import SlidePlaceholder
-from pptx.enum.shapes import PP_PLACEHOLDER
-import urllib.parse
+from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 
 # Import your models from models.py
-from models import GenerationRequest, GenerationResponse, ImageServiceRequest, Slide
+from models import (GenerationRequest, GenerationResponse, ImageServiceRequest, Slide, JobCreated, JobStatus,
+                    BatchGenerationRequest, BatchDeckResult)
+from template_cache import TemplateCache
+from render_plans import IMAGE_LAYOUTS
+from worker_pool import WorkerPool, PoolSaturated
+from storage_backends import StorageBackend, LocalStorageBackend, storage_backend_from_env
+from jobs import JobRegistry, JobQueue, JobQueueFull, job_store_from_env
+from result_cache import request_fingerprint, planning_seed, result_cache_from_env
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+import renderer
+import tracing
+import metrics
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - [%(levelname)s] - %(message)s')
 logger = logging.getLogger(__name__)
-app = FastAPI(title="Design & Generation Service (python-pptx)")
-SERVICE_ACCOUNT_KEY_PATH = "sunlit-runway-472202-p8-75230f6c1db6.json"
-BUCKET_NAME = "finance-ppt-bot"
+# TRACE_EXPORTER selects "off" (default), "console" or "file" (TRACE_FILE); see tracing.py.
+tracing.init_tracing("design-generation-service")
 IMAGE_SERVICE_URL = os.environ.get("IMAGE_SERVICE_URL")
-storage_client = storage.Client.from_service_account_json(SERVICE_ACCOUNT_KEY_PATH)
+# By default each deck's images are one request, so the image service writes
+# all their prompts in one batched Gemini call and returns what is ready at
+# the deadline. IMAGE_REQUEST_CHUNK_SIZE > 0 opts into concurrent chunks of
+# that many slides instead: finer job progress (images n/m) and a failed
+# chunk costs only its own slides, at one prompt call per chunk.
+IMAGE_REQUEST_CHUNK_SIZE = int(os.environ.get("IMAGE_REQUEST_CHUNK_SIZE", 0))
+# One pooled client per worker process, kept alive between decks so image
+# requests reuse connections instead of paying a TCP/TLS handshake each.
+IMAGE_SERVICE_MAX_CONNECTIONS = int(os.environ.get("IMAGE_SERVICE_MAX_CONNECTIONS", 32))
+IMAGE_SERVICE_KEEPALIVE_CONNECTIONS = int(os.environ.get("IMAGE_SERVICE_KEEPALIVE_CONNECTIONS", 16))
+IMAGE_SERVICE_KEEPALIVE_SECONDS = float(os.environ.get("IMAGE_SERVICE_KEEPALIVE_SECONDS", 60))
+IMAGE_SERVICE_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("IMAGE_SERVICE_CONNECT_TIMEOUT_SECONDS", 10))
+IMAGE_SERVICE_TIMEOUT_SECONDS = float(os.environ.get("IMAGE_SERVICE_TIMEOUT_SECONDS", 300))
+# HTTP/2 multiplexes chunk requests over one connection; needs httpx[http2].
+IMAGE_SERVICE_HTTP2 = os.environ.get("IMAGE_SERVICE_HTTP2", "false").lower() in ("1", "true", "yes")
+# --- Deadlines & Image Fallback ---
+# Each deck has an end-to-end budget (GenerationRequest.deadline_seconds or
+# DECK_DEADLINE_SECONDS), counted from when generation starts. Images get
+# what is left after reserving DECK_RENDER_RESERVE_SECONDS for render and
+# upload. Image slides without an image by then are rendered with the
+# text-only bullet_points layout instead of failing the deck.
+DECK_DEADLINE_SECONDS = float(os.environ.get("DECK_DEADLINE_SECONDS", 120))
+DECK_RENDER_RESERVE_SECONDS = float(os.environ.get("DECK_RENDER_RESERVE_SECONDS", 30))
+# How long past its deadline to wait for the image service's partial answer.
+IMAGE_SERVICE_DEADLINE_GRACE_SECONDS = float(os.environ.get("IMAGE_SERVICE_DEADLINE_GRACE_SECONDS", 5))
+# After IMAGE_CIRCUIT_FAILURES failed image requests in a row, decks skip the
+# image service for IMAGE_CIRCUIT_RESET_SECONDS before trying it again.
+image_circuit = CircuitBreaker("image-service", int(os.environ.get("IMAGE_CIRCUIT_FAILURES", 5)),
+                               float(os.environ.get("IMAGE_CIRCUIT_RESET_SECONDS", 30)))
+# STORAGE_BACKEND selects "gcs" (default) or "local"; see storage_backends.py.
+storage_backend: StorageBackend = storage_backend_from_env()
+# Public base URL of this service, used to build preview links. When unset,
+# preview_url is a path relative to the service.
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")
+PREVIEW_CACHE_SIZE = int(os.environ.get("PREVIEW_CACHE_SIZE", 256))
 
 THEME_MAP = {
     "minimalist": "templates/Dark.pptx",
@@ -40,48 +83,159 @@ THEME_MAP = {
     "mystique": "templates/Mystique.pptx"
 }
 DEFAULT_TEMPLATE = "templates/Dark.pptx"
+template_cache = TemplateCache(THEME_MAP, DEFAULT_TEMPLATE)
 
-# --- UPDATED: New layouts added ---
-LAYOUT_MAP = {
-    "title_slide": 0, "bullet_points": 1, "image_left": 2,
-    "image_right": 3, "conclusion_slide": 0,
-    # --- ADDITIONS START HERE ---
-    "sticker_left": 4,
-    "sticker_right": 5
-    # --- ADDITIONS END HERE ---
-}
+# --- Layout Planning & Result Cache ---
+# "deterministic" seeds image/sticker layout choices from the request's
+# fingerprint, so identical requests get identical decks and can be served
+# from the result cache. "random" restores per-request variety and bypasses
+# the cache.
+LAYOUT_PLANNING = os.environ.get("LAYOUT_PLANNING", "deterministic")
+# RESULT_CACHE selects "memory" (default), "file" (RESULT_CACHE_DIR) or "off".
+result_cache = result_cache_from_env() if LAYOUT_PLANNING == "deterministic" else None
+
+# --- Worker Pools ---
+# Rendering is CPU-bound: "process" uses every core, "thread" only frees the
+# event loop, "inline" runs on the loop as before. Uploads are I/O-bound and
+# always use threads.
+RENDER_EXECUTOR = os.environ.get("RENDER_EXECUTOR", "process")
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_QUEUE_DEPTH = int(os.environ.get("RENDER_QUEUE_DEPTH", 16))
+RENDER_TIMEOUT_SECONDS = float(os.environ.get("RENDER_TIMEOUT_SECONDS", 120))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 4))
+UPLOAD_QUEUE_DEPTH = int(os.environ.get("UPLOAD_QUEUE_DEPTH", 16))
+UPLOAD_TIMEOUT_SECONDS = float(os.environ.get("UPLOAD_TIMEOUT_SECONDS", 120))
+
+render_pool = WorkerPool(
+    "render", RENDER_EXECUTOR, RENDER_WORKERS, RENDER_QUEUE_DEPTH, RENDER_TIMEOUT_SECONDS,
+    initializer=renderer.init_worker if RENDER_EXECUTOR == "process" else None,
+    initargs=(THEME_MAP, DEFAULT_TEMPLATE))
+upload_pool = WorkerPool("upload", "thread", UPLOAD_WORKERS, UPLOAD_QUEUE_DEPTH, UPLOAD_TIMEOUT_SECONDS)
+
+# With process workers, a deck of at least 2 * RENDER_SHARD_MIN_SLIDES
+# slides is split into up to RENDER_SHARDS slices rendered in parallel and
+# merged into one package (see deck_merge.py). Shards of decks at or above
+# LARGE_DECK_SLIDE_THRESHOLD are spooled to disk and merged one at a time.
+RENDER_SHARDS = int(os.environ.get("RENDER_SHARDS", RENDER_WORKERS))
+RENDER_SHARD_MIN_SLIDES = int(os.environ.get("RENDER_SHARD_MIN_SLIDES", 20))
+
+# --- Job API ---
+# JOB_STORE selects "memory" or "file" (JOB_STORE_DIR) persistence; "file"
+# is the default under more than one gunicorn worker (see job_store_from_env).
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", 32))
+job_registry = JobRegistry(job_store_from_env())
+
+# --- Metrics ---
+DECK_BYTES_BUCKETS = tuple(64 * 1024 * 4 ** n for n in range(8))  # 64 KiB .. 1 GiB
+DECK_SLIDES_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+image_request_duration = metrics.Histogram(
+    "image_service_request_duration_seconds", "Time for one request (or chunk) to the image service.",
+    ("outcome",), buckets=metrics.SLOW_LATENCY_BUCKETS)
+render_duration = metrics.Histogram(
+    "deck_render_duration_seconds", "Time to render a deck, including waiting for a render worker.",
+    buckets=metrics.SLOW_LATENCY_BUCKETS)
+upload_duration = metrics.Histogram(
+    "deck_upload_duration_seconds", "Time to upload a deck and its preview.", buckets=metrics.SLOW_LATENCY_BUCKETS)
+deck_bytes = metrics.Histogram("deck_size_bytes", "Size of rendered .pptx files.", buckets=DECK_BYTES_BUCKETS)
+deck_slides = metrics.Histogram("deck_slides", "Slides per rendered deck.", buckets=DECK_SLIDES_BUCKETS)
+image_fallback_slides = metrics.Counter(
+    "image_fallback_slides_total", "Image slides rendered text-only, by why the image was missing.", ("reason",))
+metrics.CallbackMetric(
+    "image_service_circuit_state", "1 for the image service circuit breaker's current state.", "gauge",
+    lambda: {(state,): int(image_circuit.state == state) for state in (CLOSED, OPEN, HALF_OPEN)}, ("state",))
+metrics.CallbackMetric(
+    "template_cache_lookups_total", "Template lookups by theme, by result.", "counter",
+    lambda: {("hit",): template_cache.hits, ("unknown_theme",): template_cache.unknown_themes}, ("result",))
+metrics.CallbackMetric(
+    "result_cache_lookups_total", "Finished-deck cache lookups, by result.", "counter",
+    lambda: {("hit",): result_cache.hits, ("miss",): result_cache.misses} if result_cache else {}, ("result",))
+metrics.CallbackMetric(
+    "worker_pool_pending", "Jobs running or queued in a worker pool.", "gauge",
+    lambda: {(pool.name,): pool.pending for pool in (render_pool, upload_pool)}, ("pool",))
+metrics.CallbackMetric("job_queue_depth", "Design jobs waiting for a job worker.", "gauge", lambda: job_queue.depth)
+
+# --- HTTP Client ---
+image_client: Optional[httpx.AsyncClient] = None
+
+def create_image_client() -> httpx.AsyncClient:
+    http2 = IMAGE_SERVICE_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("IMAGE_SERVICE_HTTP2 is set but the 'h2' package is missing; using HTTP/1.1.")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(IMAGE_SERVICE_TIMEOUT_SECONDS, connect=IMAGE_SERVICE_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(max_connections=IMAGE_SERVICE_MAX_CONNECTIONS,
+                            max_keepalive_connections=IMAGE_SERVICE_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=IMAGE_SERVICE_KEEPALIVE_SECONDS))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse every template once per worker; missing ones are reported here.
+    unavailable = template_cache.load()
+    if unavailable:
+        logger.warning(f"Themes falling back to {DEFAULT_TEMPLATE}: {', '.join(unavailable)}")
+    renderer.use_template_cache(template_cache)
+    global image_client
+    image_client = create_image_client()
+    render_pool.start()
+    upload_pool.start()
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    await image_client.aclose()
+    render_pool.shutdown()
+    upload_pool.shutdown()
+
+app = FastAPI(title="Design & Generation Service (python-pptx)", lifespan=lifespan)
+tracing.instrument_app(app)
+metrics.instrument_app(app)
+if isinstance(storage_backend, LocalStorageBackend):
+    os.makedirs(storage_backend.root_dir, exist_ok=True)
+    app.mount("/files", StaticFiles(directory=storage_backend.root_dir), name="files")
 
 # --- Helper Functions ---
-def get_placeholder(slide: PptxSlide, ph_type: PP_PLACEHOLDER) -> Optional[SlidePlaceholder]:
-    """
-    Finds a placeholder on a slide by its type.
-    Returns the placeholder shape or None if not found.
-    """
-    for shape in slide.placeholders:
-        if shape.placeholder_format.type == ph_type:
-            return shape
-    return None
-
-def upload_to_gcs(source_file_path: str, destination_blob_name: str, job_id: str) -> str:
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_path)
-    logger.info(f"[{job_id}] Upload complete. URL: {blob.public_url}")
-    return blob.public_url
-
-def strategically_add_image_layouts(slides: List[Slide]) -> List[Slide]:
+def upload_deck(deck: renderer.RenderedDeck, job_id: str) -> str:
+    """Stores the deck and its HTML preview side by side; returns the deck URL."""
+    with tracing.span("upload", **{"deck.job_id": job_id}), upload_duration.time():
+        return _upload_deck(deck, job_id)
+
+def _upload_deck(deck: renderer.RenderedDeck, job_id: str) -> str:
+    if deck.pptx_path:
+        try:
+            url = storage_backend.upload_file(deck.pptx_path, f"presentations/{job_id}.pptx")
+        finally:
+            os.remove(deck.pptx_path)
+    else:
+        url = storage_backend.upload_bytes(deck.pptx, f"presentations/{job_id}.pptx")
+    storage_backend.upload_bytes(deck.preview_html.encode("utf-8"), f"presentations/{job_id}.html",
+                                 content_type="text/html; charset=utf-8")
+    logger.info(f"[{job_id}] Upload complete. URL: {url}")
+    return url
+
+# Recently built previews, so the completion page is served from memory.
+preview_cache: "OrderedDict[str, str]" = OrderedDict()
+
+def cache_preview(job_id: str, preview_html: str) -> None:
+    preview_cache[job_id] = preview_html
+    preview_cache.move_to_end(job_id)
+    while len(preview_cache) > PREVIEW_CACHE_SIZE:
+        preview_cache.popitem(last=False)
+
+def strategically_add_image_layouts(slides: List[Slide], rng: random.Random) -> List[Slide]:
     if len(slides) <= 2: return slides
     content_slides_indices = [i for i, s in enumerate(slides) if s.layout == "bullet_points"]
     if not content_slides_indices: return slides
     num_slides_to_change = int(len(content_slides_indices) * 0.8)
     if num_slides_to_change == 0 and len(content_slides_indices) > 0: num_slides_to_change = 1
-    indices_to_change = random.sample(content_slides_indices, num_slides_to_change)
+    indices_to_change = rng.sample(content_slides_indices, num_slides_to_change)
     for i in indices_to_change:
-        slides[i].layout = random.choice(["image_left", "image_right"])
+        slides[i].layout = rng.choice(["image_left", "image_right"])
     return slides
 
 # --- NEW: Function to add sticker layouts for visual variety ---
-def strategically_add_sticker_layouts(slides: List[Slide]) -> List[Slide]:
+def strategically_add_sticker_layouts(slides: List[Slide], rng: random.Random) -> List[Slide]:
     """
     Takes slides that are still 'bullet_points' and randomly changes some
     to sticker layouts.
@@ -95,176 +249,411 @@ def strategically_add_sticker_layouts(slides: List[Slide]) -> List[Slide]:
     num_stickers_to_add = min(len(bullet_point_indices), 2)
     
     # Randomly select and change them
-    indices_to_change = random.sample(bullet_point_indices, num_stickers_to_add)
+    indices_to_change = rng.sample(bullet_point_indices, num_stickers_to_add)
     for i in indices_to_change:
-        slides[i].layout = random.choice(["sticker_left", "sticker_right"])
+        slides[i].layout = rng.choice(["sticker_left", "sticker_right"])
         
     return slides
 
 # --- UPDATED: Now identifies sticker layouts as needing images ---
 def identify_slides_for_imaging(slides: List[Slide]) -> Tuple[List[Slide], Dict[int, int]]:
     slides_needing_images, index_map = [], {}
-    layouts_needing_images = ["image_left", "image_right", "sticker_left", "sticker_right"]
     for i, slide in enumerate(slides):
-        if slide.layout in layouts_needing_images:
+        if slide.layout in IMAGE_LAYOUTS:
             index_map[i] = len(slides_needing_images)
             slides_needing_images.append(slide)
     return slides_needing_images, index_map
 
-def generate_html_preview(prs: Presentation) -> str:
-    html = ['<html><head><style>body{font-family:sans-serif;padding:2rem;} .slide{border:1px solid #ccc; padding:1rem; margin-bottom:1rem; border-radius:5px;}</style></head><body>']
-    html.append("<h1>Presentation Content Preview</h1>")
-    for i, slide in enumerate(prs.slides):
-        html.append(f'<div class="slide"><h2>Slide {i+1}</h2>')
-        for shape in slide.shapes:
-            if shape.has_text_frame:
-                html.append(f"<p>{shape.text.replace('**', '')}</p>")
-        html.append('</div>')
-    html.append('</body></html>')
-    return "".join(html)
+# --- Generation Pipeline ---
+ProgressCallback = Callable[..., None]
 
-# --- Main Endpoint ---
-@app.post("/generate-full-presentation", response_model=GenerationResponse)
-async def generate_full_presentation(request: GenerationRequest):
-    job_id = str(uuid.uuid4())
-    logger.info(f"[{job_id}] Received new presentation request with theme: '{request.theme}'.")
+def _ignore_progress(**changes) -> None:
+    pass
 
-    request.slides = [s for s in request.slides if s.data and ((s.data.title and s.data.title.strip()) or (s.data.subtitle and s.data.subtitle.strip()) or s.data.items or s.data.points)]
-    
-    # --- UPDATED: Call to the new sticker function ---
-    request.slides = strategically_add_image_layouts(request.slides)
-    request.slides = strategically_add_sticker_layouts(request.slides)
-    
-    slides_to_image, index_map = identify_slides_for_imaging(request.slides)
-    if slides_to_image:
+async def fetch_images(slides_to_image: List[Slide], job_id: str, theme: str,
+                       progress: ProgressCallback = _ignore_progress, fresh_images: bool = False,
+                       deadline: Optional[float] = None, fast_images: bool = False) -> None:
+    """
+    Asks the image service for images in the deck's `theme` and stores the
+    results on the given slides, in one request or in concurrent chunks
+    (IMAGE_REQUEST_CHUNK_SIZE), until `deadline` (a time.monotonic() value).
+    Never raises: requests that
+    fail, run out of time or are skipped by the circuit breaker leave their
+    slides without images.
+    """
+    if not slides_to_image:
+        return
+    # With a shared blob store the image service returns hashes, not base64.
+    image_transport = "blob" if renderer.blob_store else "base64"
+    chunk_size = IMAGE_REQUEST_CHUNK_SIZE if IMAGE_REQUEST_CHUNK_SIZE > 0 else len(slides_to_image)
+    images_done = 0
+    progress(stage="images", images_done=0, images_total=len(slides_to_image))
+
+    async def request_chunk(start: int) -> None:
+        nonlocal images_done
+        chunk = slides_to_image[start:start + chunk_size]
+        budget = None if deadline is None else deadline - time.monotonic()
+        if budget is not None and budget <= 0:
+            image_fallback_slides.inc(len(chunk), reason="deadline")
+            return
+        if not image_circuit.allow():
+            image_fallback_slides.inc(len(chunk), reason="circuit_open")
+            return
+        payload = ImageServiceRequest(slides=chunk, theme=theme, image_transport=image_transport,
+                                      fresh_images=fresh_images, deadline_seconds=budget,
+                                      fast_images=fast_images).dict()
+        request_start = time.perf_counter()
+        outcome = "error"
         try:
-            payload = ImageServiceRequest(slides=slides_to_image).dict()
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                response = await client.post(IMAGE_SERVICE_URL, json=payload)
+            with tracing.span("images.request", kind="CLIENT", **{"images.count": len(chunk)}):
+                response = await asyncio.wait_for(
+                    image_client.post(IMAGE_SERVICE_URL, json=payload, headers=tracing.inject()),
+                    None if budget is None else budget + IMAGE_SERVICE_DEADLINE_GRACE_SECONDS)
                 response.raise_for_status()
-                imaged_slides = response.json().get("slides_with_images", [])
-            original_indices = list(index_map.keys())
-            for i, imaged_slide_data in enumerate(imaged_slides):
-                request.slides[original_indices[i]].image_base64 = imaged_slide_data.get("image_base64")
+            outcome = "success"
         except Exception as e:
-            raise HTTPException(status_code=503, detail=f"Image Service error: {e}")
+            outcome = "timeout" if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else "error"
+            logger.warning(f"[{job_id}] Image request for {len(chunk)} slides failed ({outcome}): {e!r}")
+            image_circuit.record_failure()
+            image_fallback_slides.inc(len(chunk), reason=outcome)
+            return
+        finally:
+            image_request_duration.observe(time.perf_counter() - request_start, outcome=outcome)
+        image_circuit.record_success()
+        imaged_slides = response.json().get("slides_with_images", [])
+        for target, imaged_slide_data in zip(chunk, imaged_slides):
+            target.image_base64 = imaged_slide_data.get("image_base64")
+            target.image_sha256 = imaged_slide_data.get("image_sha256")
+            target.image_width = imaged_slide_data.get("image_width")
+            target.image_height = imaged_slide_data.get("image_height")
+            target.image_source = imaged_slide_data.get("image_source")
+        not_ready = sum(1 for slide in chunk if not (slide.image_base64 or slide.image_sha256))
+        if not_ready:
+            image_fallback_slides.inc(not_ready, reason="not_ready")
+        images_done += len(chunk)
+        progress(images_done=images_done)
 
-    try:
-        template_path = THEME_MAP.get(request.theme, DEFAULT_TEMPLATE)
-        logger.info(f"[{job_id}] Using template file: {template_path}")
-        if not os.path.exists(template_path):
-            logger.error(f"[{job_id}] Template file not found at {template_path}. Falling back to default.")
-            template_path = DEFAULT_TEMPLATE
-            if not os.path.exists(template_path):
-                raise HTTPException(status_code=500, detail="Default template file not found.")
-        
-        prs = Presentation(template_path)
-        
-        for slide_request in request.slides:
-            layout_index = LAYOUT_MAP.get(slide_request.layout)
-            if layout_index is None: continue
-            
-            if len(prs.slide_layouts) <= layout_index:
-                logger.warning(f"[{job_id}] Layout index {layout_index} not found. Skipping slide.")
-                continue
+    with tracing.span("images", **{"images.count": len(slides_to_image)}):
+        await asyncio.gather(*(request_chunk(start) for start in range(0, len(slides_to_image), chunk_size)))
 
-            slide = prs.slides.add_slide(prs.slide_layouts[layout_index])
-            data = slide_request.data
-            
-            title_ph = get_placeholder(slide, PP_PLACEHOLDER.TITLE)
-            if not title_ph:
-                title_ph = get_placeholder(slide, PP_PLACEHOLDER.CENTER_TITLE)
-            
-            if title_ph:
-                title_ph.text = data.title or ""
-            else:
-                logger.warning(f"[{job_id}] Layout index {layout_index} has no TITLE or CENTER_TITLE placeholder. Skipping title.")
-
-            if layout_index == 0: # Title Slide
-                subtitle_ph = get_placeholder(slide, PP_PLACEHOLDER.SUBTITLE)
-                if subtitle_ph:
-                    subtitle_ph.text = data.subtitle or ""
-                
-            elif layout_index == 1: # Bullet Points Slide
-                body_ph = get_placeholder(slide, PP_PLACEHOLDER.BODY)
-                if body_ph:
-                    tf = body_ph.text_frame
-                    tf.clear()
-                    bullets = [b.replace('**', '').strip() for b in (data.items or data.points or [])]
-                    if bullets:
-                        tf.text = bullets[0]
-                        for item in bullets[1:]: tf.add_paragraph().text = item
-                else:
-                    logger.warning(f"[{job_id}] Layout 1 is missing a BODY placeholder.")
-
-            elif layout_index in [2, 3]: # Image Slides
-                body_ph = get_placeholder(slide, PP_PLACEHOLDER.BODY)
-                if body_ph:
-                    tf = body_ph.text_frame
-                    tf.clear()
-                    bullets = [b.replace('**', '').strip() for b in (data.items or data.points or [])]
-                    if bullets:
-                        tf.text = bullets[0]
-                        for item in bullets[1:]: tf.add_paragraph().text = item
-                else:
-                    logger.warning(f"[{job_id}] Layout {layout_index} is missing a BODY placeholder.")
-                
-                if slide_request.image_base64:
-                    picture_ph = get_placeholder(slide, PP_PLACEHOLDER.PICTURE)
-                    if picture_ph:
-                        try:
-                            image_data = base64.b64decode(slide_request.image_base64)
-                            image_stream = io.BytesIO(image_data)
-                            picture_ph.insert_picture(image_stream)
-                        except Exception as e:
-                            logger.warning(f"[{job_id}] Failed to insert image: {e}")
-                    else:
-                        logger.warning(f"[{job_id}] Layout {layout_index} is missing a PICTURE placeholder.")
-
-            # --- ADDITIONS START HERE: Logic for new sticker layouts ---
-            elif layout_index in [4, 5]: # Sticker Left & Sticker Right Slides
-                body_ph = get_placeholder(slide, PP_PLACEHOLDER.BODY)
-                if body_ph:
-                    tf = body_ph.text_frame
-                    tf.clear()
-                    bullets = [b.replace('**', '').strip() for b in (data.items or data.points or [])]
-                    if bullets:
-                        tf.text = bullets[0]
-                        for item in bullets[1:]: tf.add_paragraph().text = item
-                else:
-                    logger.warning(f"[{job_id}] Layout {layout_index} is missing a BODY placeholder.")
-                
-                if slide_request.image_base64:
-                    picture_ph = get_placeholder(slide, PP_PLACEHOLDER.PICTURE)
-                    if picture_ph:
-                        try:
-                            image_data = base64.b64decode(slide_request.image_base64)
-                            image_stream = io.BytesIO(image_data)
-                            picture_ph.insert_picture(image_stream)
-                        except Exception as e:
-                            logger.warning(f"[{job_id}] Failed to insert sticker image: {e}")
-                    else:
-                        logger.warning(f"[{job_id}] Layout {layout_index} is missing a PICTURE placeholder for the sticker.")
-            # --- ADDITIONS END HERE ---
+def use_text_layouts_for_missing_images(slides: List[Slide]) -> int:
+    """Switches image slides that got no image to the text-only layout; returns how many."""
+    missing = [slide for slide in slides if slide.layout in IMAGE_LAYOUTS and not (slide.image_base64 or slide.image_sha256)]
+    for slide in missing:
+        slide.layout = "bullet_points"
+    return len(missing)
+
+def is_complete(slides: List[Slide], missing: int) -> bool:
+    """
+    Whether every image slide got a generated image. Other decks are not put
+    in the result cache, so a later request can still generate their images.
+    """
+    return not missing and not any(slide.image_source == "library" for slide in slides)
+
+def deck_deadline(*requests: GenerationRequest) -> float:
+    """The time.monotonic() value by which images must be ready, for the tightest of the given decks."""
+    budget = min(request.deadline_seconds or DECK_DEADLINE_SECONDS for request in requests)
+    return time.monotonic() + budget - DECK_RENDER_RESERVE_SECONDS
+
+def planning_rng(fingerprint: str) -> random.Random:
+    if LAYOUT_PLANNING == "deterministic":
+        return random.Random(planning_seed(fingerprint))
+    return random.Random()
+
+def prepare_slides(request: GenerationRequest, rng: random.Random) -> None:
+    """Drops empty slides and assigns image/sticker layouts."""
+    request.slides = [s for s in request.slides if s.data and ((s.data.title and s.data.title.strip()) or (s.data.subtitle and s.data.subtitle.strip()) or s.data.items or s.data.points)]
+    
+    # --- UPDATED: Call to the new sticker function ---
+    request.slides = strategically_add_image_layouts(request.slides, rng)
+    request.slides = strategically_add_sticker_layouts(request.slides, rng)
 
+def shard_slides(slides: List[Slide]) -> List[List[Slide]]:
+    """Splits a deck for parallel rendering; returns a single shard when splitting would not pay off."""
+    if render_pool.mode != "process":
+        return [slides]  # Threads share the GIL; splitting would only add merge work.
+    count = min(RENDER_SHARDS, render_pool.max_workers, len(slides) // max(1, RENDER_SHARD_MIN_SLIDES))
+    if count < 2:
+        return [slides]
+    size = -(-len(slides) // count)
+    return [slides[start:start + size] for start in range(0, len(slides), size)]
+
+async def render(template_path: str, slides: List[Slide], job_id: str, shard: bool = True) -> renderer.RenderedDeck:
+    shards = shard_slides(slides) if shard else [slides]
+    with tracing.span("render", **{"deck.job_id": job_id, "deck.slides": len(slides), "render.shards": len(shards)}):
+        with render_duration.time():
+            deck = await _render_shards(template_path, slides, shards, job_id)
+    deck_bytes.observe(os.path.getsize(deck.pptx_path) if deck.pptx_path else len(deck.pptx))
+    deck_slides.observe(len(slides))
+    return deck
+
+async def _render_shards(template_path: str, slides: List[Slide], shards: List[List[Slide]],
+                         job_id: str) -> renderer.RenderedDeck:
+    if len(shards) == 1:
+        return await render_pool.run(renderer.render_deck, template_path, slides, job_id)
+    logger.info(f"[{job_id}] Rendering {len(slides)} slides in {len(shards)} shards.")
+    # Shards of a large deck are streamed to spool files, so neither the workers nor the merge hold them in memory.
+    spool = len(slides) >= renderer.LARGE_DECK_SLIDE_THRESHOLD
+    rendered = await asyncio.gather(*(render_pool.run(renderer.render_shard, template_path, slice_, f"{job_id}-{i}",
+                                                      len(shards), spool)
+                                      for i, slice_ in enumerate(shards)), return_exceptions=True)
+    failed = [result for result in rendered if isinstance(result, BaseException)]
+    if failed:
+        renderer.discard_shards([result for result in rendered if isinstance(result, renderer.RenderedShard)])
+        raise failed[0]
+    return await render_pool.run(renderer.merge_shards, rendered, job_id)
+
+async def render_and_upload(request: GenerationRequest, job_id: str,
+                            progress: ProgressCallback = _ignore_progress, shard: bool = True) -> GenerationResponse:
+    progress(stage="rendering")
+    template = template_cache.get(request.theme)
+    logger.info(f"[{job_id}] Using template file: {template.path}")
+    try:
+        deck = await render(template.path, request.slides, job_id, shard)
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=f"Render capacity exhausted, retry later: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="PPTX generation timed out.")
     except Exception as e:
         logger.error(f"[{job_id}] PPTX generation failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"PPTX generation failed: {e}")
 
+    progress(stage="uploading")
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as tmp_pptx:
-            prs.save(tmp_pptx.name)
-            temp_pptx_path = tmp_pptx.name
-            
-            pptx_filename = f"{job_id}.pptx"
-            destination_blob = f"presentations/{pptx_filename}"
-            download_url = upload_to_gcs(temp_pptx_path, destination_blob, job_id)
-    finally:
-        if 'temp_pptx_path' in locals() and os.path.exists(temp_pptx_path):
-            os.remove(temp_pptx_path)
+        download_url = await upload_pool.run(upload_deck, deck, job_id)
+    except PoolSaturated as e:
+        if deck.pptx_path:
+            os.remove(deck.pptx_path)
+        raise HTTPException(status_code=503, detail=f"Upload capacity exhausted, retry later: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Presentation upload timed out.")
+    except Exception as e:
+        logger.error(f"[{job_id}] Upload failed: {e}", exc_info=True)
+        raise HTTPException(status_code=502, detail=f"Presentation upload failed: {e}")
     
-    encoded_url = urllib.parse.quote(download_url, safe='')
-    preview_url = f"https://docs.google.com/gview?url={encoded_url}&embedded=true"
+    cache_preview(job_id, deck.preview_html)
+    preview_url = f"{PUBLIC_BASE_URL}/preview/{job_id}"
 
     logger.info(f"✅ [{job_id}] Process complete. Returning URLs.")
-    return GenerationResponse(download_url=download_url, preview_url=preview_url)
\ No newline at end of file
+    return GenerationResponse(download_url=download_url, preview_url=preview_url)
+
+async def run_generation(request: GenerationRequest, job_id: str,
+                         progress: ProgressCallback = _ignore_progress) -> GenerationResponse:
+    """Images -> render -> upload. Stage changes are reported through `progress`."""
+    logger.info(f"[{job_id}] Received new presentation request with theme: '{request.theme}'.")
+    fingerprint = request_fingerprint(request)
+    if result_cache and not request.fresh_images:
+        cached = result_cache.get(fingerprint)
+        if cached:
+            logger.info(f"✅ [{job_id}] Identical deck already built ({fingerprint[:12]}). Returning cached URLs.")
+            return cached
+    image_deadline = deck_deadline(request)
+    prepare_slides(request, planning_rng(fingerprint))
+    slides_to_image, _ = identify_slides_for_imaging(request.slides)
+    await fetch_images(slides_to_image, job_id, request.theme, progress, request.fresh_images, image_deadline,
+                       request.fast_images)
+    missing = use_text_layouts_for_missing_images(request.slides)
+    if missing:
+        logger.warning(f"[{job_id}] {missing} slides got no image; using text-only layouts.")
+        progress(message=f"{missing} slides use text-only layouts because their images were not available.")
+    response = await render_and_upload(request, job_id, progress)
+    response.slides_without_images = missing
+    if result_cache and is_complete(request.slides, missing):
+        result_cache.put(fingerprint, response)
+    return response
+
+async def process_job(job_id: str, request: GenerationRequest, traceparent: str = None) -> None:
+    """Runs a queued job, continuing the trace of the request that submitted it."""
+    job_registry.update(job_id, state="running")
+    try:
+        with tracing.span("job", parent=traceparent, **{"deck.job_id": job_id}):
+            result = await run_generation(request, job_id, lambda **changes: job_registry.update(job_id, **changes))
+    except HTTPException as e:
+        job_registry.update(job_id, state="failed", error=str(e.detail))
+        return
+    except asyncio.CancelledError:
+        # A render pool restart (/templates/reload) or service shutdown; without
+        # this the job would stay "running" and its pollers would never stop.
+        logger.warning(f"[{job_id}] Job cancelled.")
+        job_registry.update(job_id, state="failed", error="Job was cancelled because the service restarted its "
+                                                          "workers; please submit it again.")
+        raise
+    except Exception as e:
+        logger.error(f"[{job_id}] Job failed: {e}", exc_info=True)
+        job_registry.update(job_id, state="failed", error=str(e))
+        return
+    job_registry.update(job_id, state="succeeded", stage="done", result=result)
+
+job_queue = JobQueue(process_job, JOB_WORKERS, JOB_QUEUE_DEPTH)
+
+# --- Main Endpoint ---
+@app.post("/generate-full-presentation", response_model=GenerationResponse)
+async def generate_full_presentation(request: GenerationRequest):
+    return await run_generation(request, str(uuid.uuid4()))
+
+# --- Job Endpoints ---
+@app.post("/jobs", response_model=JobCreated, status_code=202)
+async def create_job(request: GenerationRequest):
+    """Queues a deck for background generation and returns immediately."""
+    job_id = str(uuid.uuid4())
+    job_registry.create(job_id)
+    try:
+        job_queue.submit(job_id, request, tracing.current_traceparent())
+    except JobQueueFull as e:
+        job_registry.update(job_id, state="failed", error=str(e))
+        raise HTTPException(status_code=503, detail=f"Too many queued decks, retry later: {e}")
+    logger.info(f"[{job_id}] Job queued ({job_queue.depth} waiting).")
+    return JobCreated(job_id=job_id, status_url=f"/jobs/{job_id}", events_url=f"/jobs/{job_id}/events")
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    status = job_registry.get(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return status
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events stream of the job's status until it finishes."""
+    if job_registry.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def event_stream():
+        async for status in job_registry.watch(job_id):
+            if status is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {status.state}\ndata: {json.dumps(status.dict())}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Batch Endpoint ---
+BATCH_MAX_DECKS = int(os.environ.get("BATCH_MAX_DECKS", 100))
+
+def _image_key(slide: Slide) -> str:
+    return json.dumps(slide.data.dict(), sort_keys=True)
+
+@app.post("/batch/generate")
+async def generate_batch(batch: BatchGenerationRequest):
+    """
+    Generates many decks in one call. Image needs are deduplicated across
+    the whole batch and sent to the image service once; decks then render in
+    parallel and a BatchDeckResult is streamed (NDJSON) as each one finishes.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Batch contains no decks.")
+    if len(batch.requests) > BATCH_MAX_DECKS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_DECKS} decks.")
+    batch_id = str(uuid.uuid4())
+    logger.info(f"[{batch_id}] Received batch of {len(batch.requests)} decks.")
+
+    # Decks already built are answered from the result cache and skip everything below.
+    fingerprints = [request_fingerprint(request) for request in batch.requests]
+    cached: Dict[int, GenerationResponse] = {}
+    if result_cache:
+        for index, fingerprint in enumerate(fingerprints):
+            if batch.requests[index].fresh_images:
+                continue
+            response = result_cache.get(fingerprint)
+            if response:
+                cached[index] = response
+    pending = [(i, request) for i, request in enumerate(batch.requests) if i not in cached]
+    if cached:
+        logger.info(f"[{batch_id}] {len(cached)} decks served from the result cache.")
+
+    image_deadline = deck_deadline(*(request for _, request in pending)) if pending else None
+    for index, request in pending:
+        prepare_slides(request, planning_rng(fingerprints[index]))
+
+    # Identical slide content across decks of the same theme needs only one image.
+    slides_by_key: Dict[Tuple[str, str], List[Slide]] = {}
+    for _, request in pending:
+        for slide in identify_slides_for_imaging(request.slides)[0]:
+            slides_by_key.setdefault((request.theme, _image_key(slide)), []).append(slide)
+    unique_by_theme: Dict[str, List[Slide]] = {}
+    for (theme, _), group in slides_by_key.items():
+        unique_by_theme.setdefault(theme, []).append(group[0])
+    logger.info(f"[{batch_id}] {sum(map(len, slides_by_key.values()))} image slides, {len(slides_by_key)} unique.")
+    # Shared images are regenerated if any deck that uses them asked for fresh ones.
+    # Library images only when every deck asked for fast mode.
+    fresh_images = any(request.fresh_images for _, request in pending)
+    fast_images = bool(pending) and all(request.fast_images for _, request in pending)
+    await asyncio.gather(*(fetch_images(unique_slides, batch_id, theme, fresh_images=fresh_images,
+                                        deadline=image_deadline, fast_images=fast_images)
+                           for theme, unique_slides in unique_by_theme.items()))
+    for first, *duplicates in slides_by_key.values():
+        for slide in duplicates:
+            slide.image_base64, slide.image_sha256 = first.image_base64, first.image_sha256
+            slide.image_width, slide.image_height = first.image_width, first.image_height
+            slide.image_source = first.image_source
+    missing_images = {index: use_text_layouts_for_missing_images(request.slides) for index, request in pending}
+
+    # Keep this batch from overflowing the render queue on its own.
+    render_slots = asyncio.Semaphore(render_pool.max_workers)
+
+    async def build_deck(index: int, request: GenerationRequest) -> BatchDeckResult:
+        job_id = f"{batch_id}-{index}"
+        started = time.perf_counter()
+        async with render_slots:
+            try:
+                # Decks already render in parallel with each other; sharding would only add merges.
+                result = await render_and_upload(request, job_id, shard=False)
+                result.slides_without_images = missing_images[index]
+                if result_cache and is_complete(request.slides, result.slides_without_images):
+                    result_cache.put(fingerprints[index], result)
+                return BatchDeckResult(index=index, job_id=job_id, result=result,
+                                       elapsed_seconds=time.perf_counter() - started)
+            except HTTPException as e:
+                return BatchDeckResult(index=index, job_id=job_id, error=str(e.detail),
+                                       elapsed_seconds=time.perf_counter() - started)
+
+    tasks = [asyncio.create_task(build_deck(i, request)) for i, request in pending]
+
+    async def result_stream():
+        for index, response in cached.items():
+            yield json.dumps(BatchDeckResult(index=index, job_id=f"{batch_id}-{index}", result=response,
+                                             elapsed_seconds=0.0).dict()) + "\n"
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps((await finished).dict()) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+# --- Preview Endpoint ---
+@app.get("/preview/{job_id}", response_class=HTMLResponse)
+async def get_preview(job_id: str):
+    """Serves the HTML preview stored next to the deck. Job ids are never reused, so it is cacheable."""
+    preview_html = preview_cache.get(job_id)
+    if preview_html is None:
+        stored = await asyncio.to_thread(storage_backend.download_bytes, f"presentations/{os.path.basename(job_id)}.html")
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Preview not found.")
+        preview_html = stored.decode("utf-8")
+        cache_preview(job_id, preview_html)
+    return HTMLResponse(preview_html, headers={"Cache-Control": "public, max-age=86400, immutable"})
+
+# --- Template Cache Admin ---
+@app.get("/templates/stats")
+async def template_cache_stats():
+    return template_cache.stats()
+
+@app.post("/templates/reload")
+async def reload_templates():
+    """Re-reads any template file that changed on disk since it was cached."""
+    try:
+        unavailable = template_cache.reload()
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if render_pool.mode == "process":
+        # Process workers hold their own caches; fresh workers re-parse.
+        render_pool.restart()
+    if result_cache:
+        # Cached decks may have been built from the old templates.
+        result_cache.clear()
+    return {"unavailable_themes": unavailable, **template_cache.stats()}
+
+@app.get("/results/stats")
+async def result_cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
@@ -15,15 +15,64 @@ class Slide(BaseModel):
     layout: str
     data: SlideData
     image_base64: Optional[str] = None
+    # Set instead of image_base64 when images travel through the blob store.
+    image_sha256: Optional[str] = None
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    # Where the image came from: "generated", "cache" or "library".
+    image_source: Optional[str] = None
 
 # --- Models for API communication ---
 class GenerationRequest(BaseModel):
     slides: List[Slide]
     theme: str # ✅ NEW: Field to specify the chosen theme identifier
+    # Regenerate every image instead of reusing ones made for the same content.
+    fresh_images: bool = False
+    # End-to-end budget for the deck; defaults to DECK_DEADLINE_SECONDS.
+    deadline_seconds: Optional[float] = None
+    # Use ready-made library images instead of generating new ones.
+    fast_images: bool = False
 
 class ImageServiceRequest(BaseModel):
     slides: List[Slide]
+    # The deck's theme; part of the image service's prompt and cache keys.
+    theme: str = "professional"
+    image_transport: str = "base64"
+    fresh_images: bool = False
+    deadline_seconds: Optional[float] = None
+    fast_images: bool = False
 
 class GenerationResponse(BaseModel):
     download_url: str
-    preview_url: str
\ No newline at end of file
+    preview_url: str
+    # Image slides rendered with their text-only layout because no image was ready.
+    slides_without_images: int = 0
+
+# --- Models for the asynchronous job API ---
+class JobCreated(BaseModel):
+    job_id: str
+    status_url: str
+    events_url: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    state: str = "queued"      # queued | running | succeeded | failed
+    stage: str = "queued"      # queued | images | rendering | uploading | done
+    images_done: int = 0
+    images_total: int = 0
+    message: Optional[str] = None
+    result: Optional[GenerationResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+# --- Models for batch generation ---
+class BatchGenerationRequest(BaseModel):
+    requests: List[GenerationRequest]
+
+class BatchDeckResult(BaseModel):
+    index: int
+    job_id: str
+    result: Optional[GenerationResponse] = None
+    error: Optional[str] = None
+    elapsed_seconds: float
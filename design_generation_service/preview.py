@@ -0,0 +1,107 @@
+# preview.py
+# Builds a self-contained HTML preview from an in-memory Presentation:
+# slide text plus downscaled image thumbnails inlined as data URIs. Each
+# distinct image is embedded once, as a CSS class named after its hash, and
+# every slide showing it refers to that class.
+
+import io
+import os
+import html
+import base64
+import logging
+from typing import Dict, List, NamedTuple
+
+from PIL import Image
+from pptx import Presentation
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_THUMBNAIL_WIDTH = int(os.environ.get("PREVIEW_THUMBNAIL_WIDTH", 320))
+# Each distinct thumbnail adds tens of KB; past this many, new images are left out.
+PREVIEW_MAX_IMAGES = int(os.environ.get("PREVIEW_MAX_IMAGES", 100))
+
+PREVIEW_STYLE = (
+    "body{font-family:sans-serif;padding:2rem;} "
+    ".slide{border:1px solid #ccc; padding:1rem; margin-bottom:1rem; border-radius:5px; overflow:auto;} "
+    ".slide .thumb{float:right; width:40%; margin:0 0 1rem 1rem; border-radius:3px; "
+    "background-size:cover; background-repeat:no-repeat;}"
+)
+
+
+class Thumbnail(NamedTuple):
+    data_uri: str
+    width: int
+    height: int
+
+
+def _thumbnail(blob: bytes, width: int) -> Thumbnail:
+    image = Image.open(io.BytesIO(blob))
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    image.convert("RGB").save(out, "JPEG", quality=70)
+    return Thumbnail("data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii"),
+                     image.width, image.height)
+
+
+def _thumbnail_class(sha1: str) -> str:
+    return f"t{sha1[:16]}"
+
+
+def preview_document(slide_bodies: List[str], thumbnails: Dict[str, Thumbnail]) -> str:
+    """
+    Wraps per-slide HTML bodies, in order, into the preview page, with one
+    style rule per thumbnail (keyed by image sha1) the bodies refer to.
+    """
+    rules = "".join(
+        f".{_thumbnail_class(sha1)}{{background-image:url({thumb.data_uri}); max-width:{thumb.width}px; "
+        f"aspect-ratio:{thumb.width}/{thumb.height};}}"
+        for sha1, thumb in thumbnails.items())
+    parts = [f'<html><head><meta charset="utf-8"><style>{PREVIEW_STYLE}{rules}</style></head><body>',
+             "<h1>Presentation Content Preview</h1>"]
+    for number, body in enumerate(slide_bodies, 1):
+        parts.append(f'<div class="slide"><h2>Slide {number}</h2>{body}</div>')
+    parts.append('</body></html>')
+    return "".join(parts)
+
+
+class PreviewBuilder:
+    """
+    Accumulates preview HTML one slide at a time, so large decks can drop
+    each slide once it is written. `slides` holds one HTML body per slide
+    and `thumbnails` the images they show, by sha1; bodies from several
+    builders can be concatenated and passed to preview_document with their
+    thumbnails merged.
+    """
+
+    def __init__(self, thumbnail_width: int = PREVIEW_THUMBNAIL_WIDTH, max_images: int = PREVIEW_MAX_IMAGES):
+        self.thumbnail_width = thumbnail_width
+        self.max_images = max_images
+        self.slides: List[str] = []
+        self.thumbnails: Dict[str, Thumbnail] = {}
+
+    def add_slide(self, slide) -> None:
+        parts = []
+        for shape in slide.shapes:
+            try:
+                image = getattr(shape, "image", None)
+                if image is not None and image.sha1 not in self.thumbnails and len(self.thumbnails) < self.max_images:
+                    self.thumbnails[image.sha1] = _thumbnail(image.blob, self.thumbnail_width)
+                if image is not None and image.sha1 in self.thumbnails:
+                    parts.append(f'<div class="thumb {_thumbnail_class(image.sha1)}" role="img"></div>')
+            except Exception as e:
+                logger.warning(f"Skipping preview thumbnail on slide {len(self.slides) + 1}: {e}")
+            if shape.has_text_frame and shape.text.strip():
+                lines = shape.text.replace('**', '').splitlines()
+                parts.append(f"<p>{'<br>'.join(html.escape(line) for line in lines)}</p>")
+        self.slides.append("".join(parts))
+
+    def html(self) -> str:
+        return preview_document(self.slides, self.thumbnails)
+
+
+def generate_html_preview(prs: Presentation, thumbnail_width: int = PREVIEW_THUMBNAIL_WIDTH) -> str:
+    builder = PreviewBuilder(thumbnail_width)
+    for slide in prs.slides:
+        builder.add_slide(slide)
+    return builder.html()
@@ -0,0 +1,150 @@
+# render_plans.py
+# Compiles each template's slide layouts into render plans once, so filling a
+# slide is a direct placeholder lookup instead of per-slide type scans.
+
+import io
+import logging
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional, Union
+
+from pptx import Presentation
+from pptx.enum.shapes import PP_PLACEHOLDER
+from pptx.slide import Slide as PptxSlide, SlideLayout
+
+logger = logging.getLogger(__name__)
+
+# Raw image bytes or a readable, seekable binary file (e.g. an mmap'd blob).
+ImageSource = Union[bytes, BinaryIO]
+
+# --- Fill Strategies ---
+FILL_TITLE_SUBTITLE = "title_subtitle"
+FILL_BULLETS = "bullets"
+FILL_BULLETS_PICTURE = "bullets_picture"
+
+
+class LayoutSpec(NamedTuple):
+    layout_index: int
+    fill: str
+
+
+# Logical layout name -> template layout index and how to fill it.
+# New layouts are added here as data; no render code changes are needed.
+LAYOUT_SPECS: Dict[str, LayoutSpec] = {
+    "title_slide": LayoutSpec(0, FILL_TITLE_SUBTITLE),
+    "bullet_points": LayoutSpec(1, FILL_BULLETS),
+    "image_left": LayoutSpec(2, FILL_BULLETS_PICTURE),
+    "image_right": LayoutSpec(3, FILL_BULLETS_PICTURE),
+    "conclusion_slide": LayoutSpec(0, FILL_TITLE_SUBTITLE),
+    "sticker_left": LayoutSpec(4, FILL_BULLETS_PICTURE),
+    "sticker_right": LayoutSpec(5, FILL_BULLETS_PICTURE),
+}
+
+IMAGE_LAYOUTS = frozenset(name for name, spec in LAYOUT_SPECS.items() if spec.fill == FILL_BULLETS_PICTURE)
+
+
+class RenderPlan(NamedTuple):
+    """Placeholder idx values resolved from one template layout."""
+    layout_name: str
+    layout_index: int
+    fill: str
+    title_idx: Optional[int]
+    subtitle_idx: Optional[int]
+    body_idx: Optional[int]
+    picture_idx: Optional[int]
+    # Picture placeholder size in EMU, used to fit images before insertion.
+    picture_width: Optional[int] = None
+    picture_height: Optional[int] = None
+
+    def render(self, slide: PptxSlide, data, image: Optional[ImageSource] = None) -> None:
+        placeholders = {ph.placeholder_format.idx: ph for ph in slide.placeholders}
+        _FILLERS[self.fill](self, placeholders, data, image)
+
+
+# --- Plan Compilation ---
+def _first(layout: SlideLayout, *ph_types: PP_PLACEHOLDER):
+    for ph_type in ph_types:
+        for ph in layout.placeholders:
+            if ph.placeholder_format.type == ph_type:
+                return ph
+    return None
+
+
+def _first_idx(layout: SlideLayout, *ph_types: PP_PLACEHOLDER) -> Optional[int]:
+    ph = _first(layout, *ph_types)
+    return ph.placeholder_format.idx if ph is not None else None
+
+
+def compile_render_plans(prs: Presentation, template_name: str = "",
+                         specs: Dict[str, LayoutSpec] = LAYOUT_SPECS) -> Dict[str, RenderPlan]:
+    """Builds a render plan for every logical layout the template supports."""
+    layouts: List[SlideLayout] = list(prs.slide_layouts)
+    plans: Dict[str, RenderPlan] = {}
+    for name, spec in specs.items():
+        if spec.layout_index >= len(layouts):
+            logger.warning(f"{template_name}: layout index {spec.layout_index} for '{name}' not found. Slides using it will be skipped.")
+            continue
+        layout = layouts[spec.layout_index]
+        picture = _first(layout, PP_PLACEHOLDER.PICTURE)
+        plan = RenderPlan(
+            layout_name=name,
+            layout_index=spec.layout_index,
+            fill=spec.fill,
+            title_idx=_first_idx(layout, PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE),
+            subtitle_idx=_first_idx(layout, PP_PLACEHOLDER.SUBTITLE),
+            body_idx=_first_idx(layout, PP_PLACEHOLDER.BODY),
+            picture_idx=picture.placeholder_format.idx if picture is not None else None,
+            picture_width=picture.width if picture is not None else None,
+            picture_height=picture.height if picture is not None else None,
+        )
+        if plan.title_idx is None:
+            logger.warning(f"{template_name}: layout {spec.layout_index} ('{name}') has no TITLE or CENTER_TITLE placeholder.")
+        if spec.fill != FILL_TITLE_SUBTITLE and plan.body_idx is None:
+            logger.warning(f"{template_name}: layout {spec.layout_index} ('{name}') is missing a BODY placeholder.")
+        if spec.fill == FILL_BULLETS_PICTURE and plan.picture_idx is None:
+            logger.warning(f"{template_name}: layout {spec.layout_index} ('{name}') is missing a PICTURE placeholder.")
+        plans[name] = plan
+    return plans
+
+
+# --- Fillers ---
+def _fill_title(plan: RenderPlan, placeholders, data) -> None:
+    if plan.title_idx is not None:
+        placeholders[plan.title_idx].text = data.title or ""
+
+
+def _fill_bullets(plan: RenderPlan, placeholders, data) -> None:
+    if plan.body_idx is None:
+        return
+    tf = placeholders[plan.body_idx].text_frame
+    tf.clear()
+    bullets = [b.replace('**', '').strip() for b in (data.items or data.points or [])]
+    if bullets:
+        tf.text = bullets[0]
+        for item in bullets[1:]: tf.add_paragraph().text = item
+
+
+def _fill_title_subtitle(plan: RenderPlan, placeholders, data, image: Optional[ImageSource]) -> None:
+    _fill_title(plan, placeholders, data)
+    if plan.subtitle_idx is not None:
+        placeholders[plan.subtitle_idx].text = data.subtitle or ""
+
+
+def _fill_bullets_only(plan: RenderPlan, placeholders, data, image: Optional[ImageSource]) -> None:
+    _fill_title(plan, placeholders, data)
+    _fill_bullets(plan, placeholders, data)
+
+
+def _fill_bullets_picture(plan: RenderPlan, placeholders, data, image: Optional[ImageSource]) -> None:
+    _fill_title(plan, placeholders, data)
+    _fill_bullets(plan, placeholders, data)
+    if image and plan.picture_idx is not None:
+        try:
+            placeholders[plan.picture_idx].insert_picture(image if hasattr(image, "read") else io.BytesIO(image))
+        except Exception as e:
+            logger.warning(f"Failed to insert image on '{plan.layout_name}' slide: {e}")
+
+
+_FILLERS: Dict[str, Callable] = {
+    FILL_TITLE_SUBTITLE: _fill_title_subtitle,
+    FILL_BULLETS: _fill_bullets_only,
+    FILL_BULLETS_PICTURE: _fill_bullets_picture,
+}
@@ -0,0 +1,298 @@
+# renderer.py
+# Render core: fills a cached template with slides and saves the deck.
+# Holds no FastAPI or storage state so it can run inside pool workers.
+
+import io
+import os
+import mmap
+import base64
+import logging
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from pptx import Presentation
+
+import tracing
+from models import Slide
+from template_cache import CachedTemplate, TemplateCache
+from blob_store import blob_store_from_env
+from image_pipeline import image_normalizer_from_env
+from preview import PREVIEW_MAX_IMAGES, PreviewBuilder, Thumbnail, generate_html_preview, preview_document
+from deck_writer import StreamingDeckWriter
+from deck_merge import merge_decks
+
+logger = logging.getLogger(__name__)
+
+# Template cache used by render jobs in this process. Thread and inline pools
+# share the app's cache; each process-pool worker builds its own.
+_template_cache: Optional[TemplateCache] = None
+
+# Shared content-addressed image store; None when IMAGE_BLOB_STORE_DIR is unset.
+blob_store = blob_store_from_env()
+# Fits images to their placeholder before insertion; None when IMAGE_NORMALIZE=0.
+image_normalizer = image_normalizer_from_env()
+
+# Decks with at least this many slides are streamed to a spool file slide by
+# slide (see deck_writer.py) instead of being built and saved in memory.
+LARGE_DECK_SLIDE_THRESHOLD = int(os.environ.get("LARGE_DECK_SLIDE_THRESHOLD", 150))
+# Slides whose images are normalized together in large-deck mode.
+LARGE_DECK_WINDOW = int(os.environ.get("LARGE_DECK_WINDOW", 32))
+# Where large decks are spooled; defaults to the system temp dir.
+LARGE_DECK_SPOOL_DIR = os.environ.get("LARGE_DECK_SPOOL_DIR") or None
+
+
+class RenderedDeck(NamedTuple):
+    """A rendered deck: in memory, or spooled to `pptx_path` for large decks."""
+    pptx: Optional[bytes]
+    preview_html: str
+    pptx_path: Optional[str] = None
+
+
+class RenderedShard(NamedTuple):
+    """One slice of a sharded deck, in memory or spooled to `pptx_path`; see render_shard and merge_shards."""
+    pptx: Optional[bytes]
+    preview_slides: List[str]
+    preview_thumbnails: Dict[str, Thumbnail]
+    pptx_path: Optional[str] = None
+
+
+def use_template_cache(cache: TemplateCache) -> None:
+    global _template_cache
+    _template_cache = cache
+
+
+def init_worker(theme_map: Dict[str, str], default_template: str) -> None:
+    """Process-pool initializer: parses the templates once per worker."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - [%(levelname)s] - %(message)s')
+    cache = TemplateCache(theme_map, default_template)
+    cache.load()
+    use_template_cache(cache)
+
+
+def decode_image(image_base64: Optional[str], job_id: str) -> Optional[bytes]:
+    if not image_base64:
+        return None
+    try:
+        return base64.b64decode(image_base64)
+    except Exception as e:
+        logger.warning(f"[{job_id}] Failed to decode image: {e}")
+        return None
+
+
+@contextmanager
+def open_slide_image(slide: Slide, job_id: str) -> Iterator[Optional[Union[bytes, mmap.mmap]]]:
+    """
+    Yields the slide's image: a memory map of the blob for blob-store
+    references, otherwise the decoded base64 payload.
+    """
+    if not slide.image_sha256:
+        yield decode_image(slide.image_base64, job_id)
+        return
+    if blob_store is None:
+        logger.warning(f"[{job_id}] Slide references image {slide.image_sha256} but IMAGE_BLOB_STORE_DIR is not set.")
+        yield None
+        return
+    try:
+        image = blob_store.open(slide.image_sha256)
+    except (OSError, ValueError) as e:
+        logger.warning(f"[{job_id}] Failed to open image blob {slide.image_sha256}: {e}")
+        yield None
+        return
+    try:
+        yield image
+    finally:
+        image.close()
+
+
+def normalize_slide_images(template: CachedTemplate, slides: List[Slide], job_id: str,
+                           recent: Optional["OrderedDict"] = None, recent_size: int = 0) -> Dict[int, bytes]:
+    """
+    Resizes and re-encodes every slide image for its picture placeholder in
+    one batch. Returns slide index -> image bytes for the images that were
+    normalized. Identical sources for the same placeholder size are processed
+    once and come out byte-identical, so python-pptx stores them as a single
+    media part. `recent`, when given, is an LRU of results carried across
+    calls for the same deck, holding at most `recent_size` images.
+    """
+    jobs, keys_by_slide = [], {}
+    for i, slide_request in enumerate(slides):
+        plan = template.plans.get(slide_request.layout)
+        if not (slide_request.image_sha256 or slide_request.image_base64):
+            continue
+        if plan is None or plan.picture_idx is None or not plan.picture_width or not plan.picture_height:
+            continue
+        source_key = slide_request.image_sha256 or hash(slide_request.image_base64)
+        key = (source_key, plan.picture_width, plan.picture_height)
+        keys_by_slide[i] = key
+        if recent is not None and key in recent:
+            continue
+        jobs.append((key, lambda s=slide_request: open_slide_image(s, job_id), plan.picture_width, plan.picture_height))
+    normalized = image_normalizer.normalize_batch(jobs)
+    if recent is not None:
+        for key in keys_by_slide.values():
+            if key in recent:
+                recent.move_to_end(key)
+                normalized[key] = recent[key]
+            else:
+                recent[key] = normalized.get(key)
+        while len(recent) > recent_size:
+            recent.popitem(last=False)
+    return {i: normalized[key] for i, key in keys_by_slide.items() if normalized.get(key)}
+
+
+def fill_slides(prs: Presentation, template: CachedTemplate, slides: List[Slide], job_id: str,
+                on_slide: Optional[Callable] = None, window: Optional[int] = None) -> None:
+    """
+    Adds and fills a slide per request. Images are normalized `window`
+    slides at a time (all at once by default); `on_slide` is called with
+    each slide as soon as it is filled.
+    """
+    step = window or max(1, len(slides))
+    # Images repeated across windows are normalized once while they stay in this LRU.
+    recent = OrderedDict() if step < len(slides) else None
+    for start in range(0, len(slides), step):
+        chunk = slides[start:start + step]
+        images = normalize_slide_images(template, chunk, job_id, recent, 2 * step) if image_normalizer else {}
+        for i, slide_request in enumerate(chunk):
+            plan = template.plans.get(slide_request.layout)
+            if plan is None: continue
+            slide = prs.slides.add_slide(prs.slide_layouts[plan.layout_index])
+            if i in images:
+                plan.render(slide, slide_request.data, images[i])
+            else:
+                with open_slide_image(slide_request, job_id) as image:
+                    plan.render(slide, slide_request.data, image)
+            if on_slide:
+                on_slide(slide)
+
+
+def render_presentation(template: CachedTemplate, slides: List[Slide], job_id: str) -> Presentation:
+    with tracing.span("render.fill", **{"deck.slides": len(slides)}):
+        prs = template.open()
+        fill_slides(prs, template, slides, job_id)
+    return prs
+
+
+def render_large_deck(template: CachedTemplate, slides: List[Slide], job_id: str) -> RenderedDeck:
+    """
+    Streams the deck to a spool file as it is filled, so memory stays flat
+    however many slides there are. The caller owns (and removes) the file.
+    """
+    preview = PreviewBuilder()
+    path = _spool_deck(template, slides, job_id, preview)
+    return RenderedDeck(pptx=None, preview_html=preview.html(), pptx_path=path)
+
+
+def _spool_deck(template: CachedTemplate, slides: List[Slide], job_id: str, preview: PreviewBuilder) -> str:
+    """Fills the template slide by slide into a new spool file, adding each slide to `preview`; returns its path."""
+    prs = template.open()
+    fd, path = tempfile.mkstemp(prefix=f"{job_id}-", suffix=".pptx", dir=LARGE_DECK_SPOOL_DIR)
+    os.close(fd)
+    writer = StreamingDeckWriter(prs, path)
+
+    def write_slide(slide) -> None:
+        preview.add_slide(slide)
+        writer.write_slide(slide)
+
+    try:
+        with tracing.span("render.stream", **{"deck.slides": len(slides)}):
+            fill_slides(prs, template, slides, job_id, on_slide=write_slide, window=LARGE_DECK_WINDOW)
+            writer.close()
+    except BaseException:
+        writer.abort()
+        os.remove(path)
+        raise
+    logger.info(f"[{job_id}] Streamed {writer.slides_written} slides ({os.path.getsize(path)} bytes) to {path}.")
+    return path
+
+
+def render_deck(template_path: str, slides: List[Slide], job_id: str) -> RenderedDeck:
+    """
+    Renders the deck, serializes it into memory and builds its HTML preview.
+    Decks of LARGE_DECK_SLIDE_THRESHOLD slides or more go through
+    render_large_deck instead.
+    """
+    if _template_cache is None:
+        raise RuntimeError("Renderer has no template cache; call use_template_cache or init_worker first.")
+    template = _template_cache.by_path(template_path)
+    if len(slides) >= LARGE_DECK_SLIDE_THRESHOLD:
+        return render_large_deck(template, slides, job_id)
+    prs = render_presentation(template, slides, job_id)
+    buffer = io.BytesIO()
+    with tracing.span("render.save") as save_span:
+        prs.save(buffer)
+        save_span.set_attribute("deck.bytes", buffer.tell())
+    logger.info(f"[{job_id}] Rendered {len(prs.slides)} slides ({buffer.tell()} bytes).")
+    with tracing.span("render.preview"):
+        preview_html = generate_html_preview(prs)
+    return RenderedDeck(pptx=buffer.getvalue(), preview_html=preview_html)
+
+
+def render_shard(template_path: str, slides: List[Slide], job_id: str, shard_count: int,
+                 spool: bool = False) -> RenderedShard:
+    """
+    Renders one slice of a deck split across workers. Each shard is a
+    complete deck built from the same cached template; merge_shards joins
+    them. The preview image budget is split between the shards. With
+    `spool`, the shard is streamed to a spool file like a large deck, so
+    neither the worker nor the merge holds it in memory.
+    """
+    if _template_cache is None:
+        raise RuntimeError("Renderer has no template cache; call use_template_cache or init_worker first.")
+    template = _template_cache.by_path(template_path)
+    preview = PreviewBuilder(max_images=PREVIEW_MAX_IMAGES // shard_count)
+    if spool:
+        path = _spool_deck(template, slides, job_id, preview)
+        return RenderedShard(pptx=None, preview_slides=preview.slides, preview_thumbnails=preview.thumbnails,
+                             pptx_path=path)
+    prs = render_presentation(template, slides, job_id)
+    with tracing.span("render.preview"):
+        for slide in prs.slides:
+            preview.add_slide(slide)
+    buffer = io.BytesIO()
+    with tracing.span("render.save"):
+        prs.save(buffer)
+    return RenderedShard(pptx=buffer.getvalue(), preview_slides=preview.slides, preview_thumbnails=preview.thumbnails)
+
+
+def merge_shards(shards: List[RenderedShard], job_id: str) -> RenderedDeck:
+    """
+    Merges rendered shards, in order, into one deck (spooled to disk for
+    large decks). Spooled shards are removed once merged.
+    """
+    try:
+        with tracing.span("render.merge", **{"render.shards": len(shards)}):
+            return _merge_shards(shards, job_id)
+    finally:
+        discard_shards(shards)
+
+
+def discard_shards(shards: List[RenderedShard]) -> None:
+    """Removes the spool files of rendered shards."""
+    for shard in shards:
+        if shard.pptx_path:
+            try:
+                os.remove(shard.pptx_path)
+            except OSError as e:
+                logger.warning(f"Could not remove shard spool file {shard.pptx_path}: {e}")
+
+
+def _merge_shards(shards: List[RenderedShard], job_id: str) -> RenderedDeck:
+    preview_html = preview_document([body for shard in shards for body in shard.preview_slides],
+                                    {sha1: thumb for shard in shards for sha1, thumb in shard.preview_thumbnails.items()})
+    if sum(len(shard.preview_slides) for shard in shards) >= LARGE_DECK_SLIDE_THRESHOLD:
+        fd, path = tempfile.mkstemp(prefix=f"{job_id}-", suffix=".pptx", dir=LARGE_DECK_SPOOL_DIR)
+        os.close(fd)
+        try:
+            slide_count = merge_decks([shard.pptx_path or shard.pptx for shard in shards], path)
+        except BaseException:
+            os.remove(path)
+            raise
+        logger.info(f"[{job_id}] Merged {len(shards)} shards: {slide_count} slides ({os.path.getsize(path)} bytes).")
+        return RenderedDeck(pptx=None, preview_html=preview_html, pptx_path=path)
+    buffer = io.BytesIO()
+    slide_count = merge_decks([shard.pptx_path or shard.pptx for shard in shards], buffer)
+    logger.info(f"[{job_id}] Merged {len(shards)} shards: {slide_count} slides ({buffer.tell()} bytes).")
+    return RenderedDeck(pptx=buffer.getvalue(), preview_html=preview_html)
@@ -0,0 +1,185 @@
+# result_cache.py
+# Finished decks keyed by a normalized hash of the request. Layout planning
+# is seeded from the same hash, so an identical request would produce the
+# same deck anyway; a hit returns the stored URLs without calling the image
+# service, rendering or uploading again.
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from models import GenerationRequest, GenerationResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def request_fingerprint(request: GenerationRequest) -> str:
+    """
+    sha256 of the request's slide content and theme. Whitespace differences
+    and unset fields do not change it; image fields are ignored.
+    """
+    slides = [
+        {"layout": slide.layout,
+         "data": {k: _normalize(v) for k, v in slide.data.dict().items() if v not in (None, "", [])}}
+        for slide in request.slides
+    ]
+    canonical = json.dumps({"theme": request.theme.strip().lower(), "slides": slides},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def planning_seed(fingerprint: str) -> int:
+    return int(fingerprint[:16], 16)
+
+
+# --- Cache Backends ---
+class ResultCache(ABC):
+    """Maps a request fingerprint to the response of the deck built for it."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[GenerationResponse]:
+        response = self._get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds}
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[GenerationResponse]:
+        ...
+
+    @abstractmethod
+    def put(self, key: str, response: GenerationResponse) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class InMemoryResultCache(ResultCache):
+    """Least recently used entries in this process."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400):
+        super().__init__(max_entries, ttl_seconds)
+        self._entries: "OrderedDict[str, Tuple[float, GenerationResponse]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[GenerationResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: GenerationResponse) -> None:
+        self._entries[key] = (time.time(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class FileResultCache(ResultCache):
+    """
+    One JSON file per entry under `root_dir`. Survives restarts and can be
+    shared by replicas mounting the same volume. File mtimes double as the
+    entries' age and recency; the oldest files go first when over capacity.
+    """
+
+    def __init__(self, root_dir: str, max_entries: int = 1000, ttl_seconds: float = 86400):
+        super().__init__(max_entries, ttl_seconds)
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, f"{os.path.basename(key)}.json")
+
+    def _get(self, key: str) -> Optional[GenerationResponse]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - stored["stored_at"] > self.ttl_seconds:
+            self._remove(path)
+            return None
+        os.utime(path)
+        return GenerationResponse(**stored["response"])
+
+    def put(self, key: str, response: GenerationResponse) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".part")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"stored_at": time.time(), "response": response.dict()}, f)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def clear(self) -> None:
+        for name in os.listdir(self.root_dir):
+            if name.endswith(".json"):
+                self._remove(os.path.join(self.root_dir, name))
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.root_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def result_cache_from_env() -> Optional[ResultCache]:
+    """Returns the configured cache, or None when RESULT_CACHE=off."""
+    backend = os.environ.get("RESULT_CACHE", "memory")
+    max_entries = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 1000))
+    ttl_seconds = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 24 * 3600))
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return InMemoryResultCache(max_entries, ttl_seconds)
+    if backend == "file":
+        return FileResultCache(os.environ.get("RESULT_CACHE_DIR", "result_cache"), max_entries, ttl_seconds)
+    raise ValueError(f"Unknown RESULT_CACHE '{backend}'; expected 'memory', 'file' or 'off'.")
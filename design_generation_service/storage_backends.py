@@ -0,0 +1,146 @@
+# storage_backends.py
+# Pluggable destinations for finished decks. Decks are handed over as bytes,
+# so nothing touches the local disk unless the local backend is selected.
+
+import io
+import os
+import shutil
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import IO, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PPTX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+
+class StorageBackend(ABC):
+    """Stores an object under `destination` and returns a URL to fetch it."""
+
+    @abstractmethod
+    def upload_bytes(self, data: bytes, destination: str, content_type: str = PPTX_CONTENT_TYPE) -> str:
+        ...
+
+    @abstractmethod
+    def upload_file(self, path: str, destination: str, content_type: str = PPTX_CONTENT_TYPE) -> str:
+        """Like upload_bytes, for objects spooled to a local file."""
+
+    @abstractmethod
+    def download_bytes(self, destination: str) -> Optional[bytes]:
+        """Returns the stored object, or None if it does not exist."""
+
+
+class GCSStorageBackend(StorageBackend):
+    """
+    Google Cloud Storage. Uses the service-account key file when present and
+    application default credentials otherwise. Objects of at least
+    `resumable_threshold` bytes are sent as a chunked, resumable upload.
+    """
+
+    def __init__(self, bucket_name: str, service_account_key_path: Optional[str] = None,
+                 resumable_threshold: int = 8 * 1024 * 1024, chunk_size: int = 4 * 1024 * 1024):
+        self.bucket_name = bucket_name
+        self.service_account_key_path = service_account_key_path
+        self.resumable_threshold = resumable_threshold
+        # GCS requires resumable chunks to be a multiple of 256 KiB.
+        self.chunk_size = max(1, chunk_size // (256 * 1024)) * 256 * 1024
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _bucket(self):
+        # Built on first use, not at import, so the module loads without credentials.
+        with self._lock:
+            if self._client is None:
+                from google.cloud import storage
+                if self.service_account_key_path and os.path.exists(self.service_account_key_path):
+                    self._client = storage.Client.from_service_account_json(self.service_account_key_path)
+                else:
+                    self._client = storage.Client()
+        return self._client.bucket(self.bucket_name)
+
+    def upload_bytes(self, data: bytes, destination: str, content_type: str = PPTX_CONTENT_TYPE) -> str:
+        blob = self._bucket().blob(destination)
+        if len(data) >= self.resumable_threshold:
+            blob.chunk_size = self.chunk_size
+            blob.upload_from_file(io.BytesIO(data), size=len(data), content_type=content_type)
+        else:
+            blob.upload_from_string(data, content_type=content_type)
+        return blob.public_url
+
+    def upload_file(self, path: str, destination: str, content_type: str = PPTX_CONTENT_TYPE) -> str:
+        blob = self._bucket().blob(destination)
+        if os.path.getsize(path) >= self.resumable_threshold:
+            blob.chunk_size = self.chunk_size
+        blob.upload_from_filename(path, content_type=content_type)
+        return blob.public_url
+
+    def download_bytes(self, destination: str) -> Optional[bytes]:
+        from google.api_core.exceptions import NotFound
+        try:
+            return self._bucket().blob(destination).download_as_bytes()
+        except NotFound:
+            return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """Writes objects under `root_dir`; URLs are `public_base_url/<destination>`."""
+
+    def __init__(self, root_dir: str, public_base_url: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.public_base_url = public_base_url.rstrip("/")
+
+    def _path(self, destination: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, destination))
+        if not path.startswith(self.root_dir + os.sep):
+            raise ValueError(f"Destination '{destination}' escapes the storage root.")
+        return path
+
+    def upload_bytes(self, data: bytes, destination: str, content_type: str = PPTX_CONTENT_TYPE) -> str:
+        return self._store(destination, lambda f: f.write(data))
+
+    def upload_file(self, path: str, destination: str, content_type: str = PPTX_CONTENT_TYPE) -> str:
+        def copy(f):
+            with open(path, "rb") as source:
+                shutil.copyfileobj(source, f)
+        return self._store(destination, copy)
+
+    def _store(self, destination: str, write: Callable[[IO[bytes]], object]) -> str:
+        path = self._path(destination)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a half-written deck.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return f"{self.public_base_url}/{destination}"
+
+    def download_bytes(self, destination: str) -> Optional[bytes]:
+        try:
+            with open(self._path(destination), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+def storage_backend_from_env() -> StorageBackend:
+    backend = os.environ.get("STORAGE_BACKEND", "gcs")
+    if backend == "gcs":
+        return GCSStorageBackend(
+            bucket_name=os.environ.get("GCS_BUCKET", "finance-ppt-bot"),
+            service_account_key_path=os.environ.get("GCS_SERVICE_ACCOUNT_KEY", "sunlit-runway-472202-p8-75230f6c1db6.json"),
+            resumable_threshold=int(os.environ.get("GCS_RESUMABLE_THRESHOLD_BYTES", 8 * 1024 * 1024)),
+            chunk_size=int(os.environ.get("GCS_CHUNK_SIZE_BYTES", 4 * 1024 * 1024)),
+        )
+    if backend == "local":
+        return LocalStorageBackend(
+            root_dir=os.environ.get("LOCAL_STORAGE_DIR", "storage"),
+            public_base_url=os.environ.get("LOCAL_STORAGE_PUBLIC_URL", "http://localhost:8080/files"),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'; expected 'gcs' or 'local'.")
@@ -0,0 +1,160 @@
+# template_cache.py
+# Parses every theme template once and hands out isolated copies per request.
+
+import io
+import os
+import copy
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from pptx import Presentation
+
+from render_plans import RenderPlan, compile_render_plans
+
+logger = logging.getLogger(__name__)
+
+
+# Rounds of each clone method timed when a template is loaded.
+CALIBRATION_ROUNDS = 3
+
+
+class CachedTemplate:
+    """
+    A template read once at startup; `open()` returns a private copy.
+    `plans` maps each logical layout name to its compiled render plan.
+
+    There are two ways to make the copy and which one is faster depends on
+    the template: deep-copying the parsed prototype skips XML parsing but
+    walks every object, while re-opening the cached file bytes skips the
+    disk read but parses again. Both are timed at load and `clone_method`
+    records the winner (benchmarks/bench_template_clone.py compares them).
+    Neither takes a lock: once the render plans are compiled the prototype
+    is only ever read, so concurrent deep copies of it are safe.
+    """
+
+    def __init__(self, path: str, prototype: Presentation, mtime: float, data: bytes):
+        self.path = path
+        self.mtime = mtime
+        self.plans: Dict[str, RenderPlan] = compile_render_plans(prototype, path)
+        self._prototype = prototype
+        self._bytes = data
+        self.clone_method, self.clone_ms = self._calibrate()
+
+    def _deepcopy(self) -> Presentation:
+        return copy.deepcopy(self._prototype)
+
+    def _from_bytes(self) -> Presentation:
+        return Presentation(io.BytesIO(self._bytes))
+
+    def _calibrate(self):
+        timings = {}
+        for name, clone in (("deepcopy", self._deepcopy), ("bytes", self._from_bytes)):
+            best = float("inf")
+            for _ in range(CALIBRATION_ROUNDS):
+                start = time.perf_counter()
+                clone()
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best * 1000
+        method = min(timings, key=timings.get)
+        logger.info(f"{os.path.basename(self.path)}: cloning by {method} "
+                    f"(deepcopy {timings['deepcopy']:.1f} ms, bytes {timings['bytes']:.1f} ms).")
+        return method, timings
+
+    def open(self) -> Presentation:
+        return self._deepcopy() if self.clone_method == "deepcopy" else self._from_bytes()
+
+
+class TemplateCache:
+    """
+    Loads and validates all THEME_MAP templates up front.
+    Themes whose template is missing or unreadable are reported once at load
+    time and resolved to the default template from then on.
+    """
+
+    def __init__(self, theme_map: Dict[str, str], default_template: str):
+        self.theme_map = dict(theme_map)
+        self.default_template = default_template
+        self.hits = 0
+        self.unknown_themes = 0   # Lookups of a theme not in THEME_MAP, served the default template.
+        self._by_path: Dict[str, CachedTemplate] = {}
+        self._by_theme: Dict[str, CachedTemplate] = {}
+        self._default: Optional[CachedTemplate] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_template(path: str) -> CachedTemplate:
+        mtime = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        prototype = Presentation(io.BytesIO(data))
+        if len(prototype.slide_layouts) == 0:
+            raise ValueError(f"Template '{path}' has no slide layouts.")
+        return CachedTemplate(path, prototype, mtime, data)
+
+    def load(self) -> List[str]:
+        """
+        (Re)builds the cache from disk. Returns the list of themes that could
+        not be loaded and were aliased to the default template.
+        """
+        by_path: Dict[str, CachedTemplate] = {}
+        for path in sorted(set(self.theme_map.values()) | {self.default_template}):
+            previous = self._by_path.get(path)
+            try:
+                if previous and os.path.getmtime(path) == previous.mtime:
+                    by_path[path] = previous
+                    continue
+                by_path[path] = self._load_template(path)
+                logger.info(f"Template cached: {path}")
+            except Exception as e:
+                logger.error(f"Template '{path}' could not be loaded: {e}")
+
+        default = by_path.get(self.default_template)
+        if default is None:
+            raise RuntimeError(f"Default template '{self.default_template}' could not be loaded.")
+
+        by_theme, unavailable = {}, []
+        for theme, path in self.theme_map.items():
+            entry = by_path.get(path)
+            if entry is None:
+                unavailable.append(theme)
+                logger.error(f"Theme '{theme}' is unavailable ({path}); requests will use {self.default_template}.")
+                entry = default
+            by_theme[theme] = entry
+
+        with self._lock:
+            self._by_path, self._by_theme, self._default = by_path, by_theme, default
+        return unavailable
+
+    def reload(self) -> List[str]:
+        """Re-reads templates whose file changed on disk since the last load."""
+        logger.info("Reloading template cache.")
+        return self.load()
+
+    def get(self, theme: str) -> CachedTemplate:
+        if self._default is None:
+            raise RuntimeError("Template cache has not been loaded.")
+        entry = self._by_theme.get(theme)
+        with self._lock:
+            if entry is None:
+                self.unknown_themes += 1
+            else:
+                self.hits += 1
+        return entry or self._default
+
+    def by_path(self, path: str) -> CachedTemplate:
+        """Looks up an already-resolved template without touching the counters."""
+        if self._default is None:
+            raise RuntimeError("Template cache has not been loaded.")
+        return self._by_path.get(path, self._default)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "hits": self.hits,
+            "unknown_themes": self.unknown_themes,
+            "templates": {path: {"clone_method": entry.clone_method,
+                                 "clone_ms": {name: round(ms, 1) for name, ms in entry.clone_ms.items()}}
+                          for path, entry in sorted(self._by_path.items())},
+            "themes": {theme: entry.path for theme, entry in self._by_theme.items()},
+        }
@@ -0,0 +1,105 @@
+# worker_pool.py
+# Runs blocking stages (PPTX rendering, uploads) off the event loop with a
+# bounded queue and per-job timeouts.
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+POOL_MODES = ("inline", "thread", "process")
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool already has its maximum number of queued jobs."""
+
+
+class WorkerPool:
+    """
+    Executes callables in a thread or process pool.
+    `max_workers` jobs run at once and at most `max_queue` more may wait;
+    anything beyond that is rejected with PoolSaturated instead of piling up.
+    "inline" mode runs jobs directly on the event loop (no isolation).
+    """
+
+    def __init__(self, name: str, mode: str, max_workers: int, max_queue: int, timeout: float,
+                 initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        if mode not in POOL_MODES:
+            raise ValueError(f"Unknown pool mode '{mode}' for {name}; expected one of {POOL_MODES}.")
+        self.name = name
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        if self.mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=self.name,
+                initializer=self._initializer, initargs=self._initargs)
+        elif self.mode == "process":
+            # spawn: forking a process that already runs an event loop and
+            # threads is unsafe.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=self._initializer, initargs=self._initargs)
+        elif self._initializer:
+            self._initializer(*self._initargs)
+        logger.info(f"Worker pool '{self.name}' started: mode={self.mode}, workers={self.max_workers}, queue={self.max_queue}")
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def restart(self) -> None:
+        """Replaces the workers, e.g. so process workers re-run their initializer."""
+        self.shutdown()
+        self.start()
+
+    async def run(self, fn: Callable, *args: Any, timeout: Optional[float] = None) -> Any:
+        if self._pending >= self.max_workers + self.max_queue:
+            raise PoolSaturated(f"{self.name} queue is full ({self._pending} jobs pending).")
+        self._pending += 1
+        if self.mode == "inline":
+            try:
+                return fn(*args)
+            finally:
+                self._pending -= 1
+        loop = asyncio.get_running_loop()
+        # Executors don't carry contextvars; pass the trace context explicitly.
+        job = functools.partial(tracing.call_in_trace, tracing.current_traceparent(), fn, *args)
+        try:
+            future = self._executor.submit(job)
+        except BaseException:
+            self._pending -= 1
+            raise
+        # The slot is freed when the job itself finishes, not when the caller
+        # stops waiting: on timeout the caller gets an error right away, but a
+        # worker still runs the abandoned job before taking the next one.
+        future.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Runs on an executor thread; the counter belongs to the event loop.
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            pass  # The loop is closed; nobody is left to submit jobs.
+
+    def _decrement(self) -> None:
+        self._pending -= 1
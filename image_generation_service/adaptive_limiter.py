@@ -0,0 +1,213 @@
+# adaptive_limiter.py
+# AIMD concurrency limit for a quota-bound API (Imagen). Each success raises
+# the limit by 1/limit, so about one extra slot per limit's worth of
+# successes; an overload error (e.g. ResourceExhausted) halves it. Only calls
+# started after the last cut can cut again, so the rejections of one burst
+# count as a single signal.
+#
+# The limit and the slots in use live in a LimiterState backend, so several
+# processes or replicas can share one quota budget. Slots are time-limited
+# leases: a worker that dies holding one frees it when the lease expires.
+# Backends that block (file locks, network round trips) are driven from a
+# single helper thread, never from the event loop.
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import random
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+# --- State Backends ---
+class LimiterState(ABC):
+    """
+    Holds {"limit": float, "leases": {lease id: start time}, "last_decrease": ts}.
+    A shared backend (e.g. Redis) only has to apply `update` atomically.
+    """
+
+    # Whether transact() can block (on a lock held by another process, or I/O).
+    blocking = False
+
+    @abstractmethod
+    def transact(self, update: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Applies update(state) atomically, persists the state and returns update's result."""
+
+
+class InProcessLimiterState(LimiterState):
+    """State for one process; every worker process gets its own budget."""
+
+    def __init__(self, initial_limit: float):
+        self._state = {"limit": initial_limit, "leases": {}, "last_decrease": 0.0}
+        self._lock = threading.Lock()
+
+    def transact(self, update):
+        with self._lock:
+            return update(self._state)
+
+
+class FileLimiterState(LimiterState):
+    """
+    State in a JSON file guarded by flock, shared by every process that can
+    see the file: gunicorn workers, or replicas on a shared volume. A local
+    stand-in for a networked store.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, initial_limit: float):
+        self.path = os.path.abspath(path)
+        self.initial_limit = initial_limit
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def transact(self, update):
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {"limit": self.initial_limit, "leases": {}, "last_decrease": 0.0}
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# --- Limiter ---
+class AdaptiveLimiter:
+    def __init__(self, state: LimiterState, min_limit: int, max_limit: int,
+                 overload_errors: Tuple[Type[BaseException], ...], lease_seconds: float = 300.0,
+                 decrease_factor: float = 0.5, poll_seconds: float = 0.05):
+        self.state = state
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.overload_errors = overload_errors
+        self.lease_seconds = lease_seconds
+        self.decrease_factor = decrease_factor
+        self.poll_seconds = poll_seconds
+        # One thread, so a blocking backend's transactions run in submission order.
+        self._executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="limiter") if state.blocking else None)
+        self._last_snapshot = {"limit": 0, "in_flight": 0}
+
+    def _snapshot_of(self, state: Dict[str, Any]) -> Dict[str, float]:
+        now = time.time()
+        return {"limit": int(state["limit"]),
+                "in_flight": sum(1 for start in state["leases"].values() if start + self.lease_seconds > now)}
+
+    def _observing(self, update: Callable[[Dict[str, Any]], Any]) -> Callable[[Dict[str, Any]], Any]:
+        def observed(state):
+            result = update(state)
+            self._last_snapshot = self._snapshot_of(state)
+            return result
+
+        return observed
+
+    async def _transact(self, update: Callable[[Dict[str, Any]], Any]) -> Any:
+        observed = self._observing(update)
+        if self._executor is None:
+            return self.state.transact(observed)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.state.transact, observed)
+
+    async def _try_acquire(self) -> Any:
+        lease = uuid.uuid4().hex
+
+        def update(state):
+            now = time.time()
+            state["leases"] = {k: start for k, start in state["leases"].items() if start + self.lease_seconds > now}
+            if len(state["leases"]) >= int(state["limit"]):
+                return None
+            state["leases"][lease] = now
+            return lease
+
+        try:
+            return await self._transact(update)
+        except asyncio.CancelledError:
+            if self._executor is not None:
+                # The helper thread may still take the slot; queued behind it, this gives it back.
+                self._executor.submit(self.state.transact,
+                                      self._observing(lambda state: state["leases"].pop(lease, None)))
+            raise
+
+    async def _release(self, lease: str, outcome: str) -> None:
+        def update(state):
+            started = state["leases"].pop(lease, None)
+            limit = state["limit"]
+            if outcome == "success":
+                state["limit"] = min(self.max_limit, limit + 1 / limit)
+            elif outcome == "overload" and (started is None or started > state["last_decrease"]):
+                state["limit"] = max(self.min_limit, limit * self.decrease_factor)
+                state["last_decrease"] = time.time()
+            return limit, state["limit"]
+
+        before, after = await self._transact(update)
+        if int(after) != int(before):
+            logger.info(f"Adaptive limit {'raised' if after > before else 'cut'} from {int(before)} to {int(after)}.")
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Waits for a free slot and holds it for the block; the block's outcome adjusts the limit."""
+        lease = await self._try_acquire()
+        while lease is None:
+            # Other processes release slots too, so there is nothing to await; poll with jitter.
+            await asyncio.sleep(self.poll_seconds * random.uniform(0.5, 1.5))
+            lease = await self._try_acquire()
+        outcome = "error"
+        try:
+            yield
+            outcome = "success"
+        except self.overload_errors:
+            outcome = "overload"
+            raise
+        finally:
+            await self._release(lease, outcome)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Current limit and slots in use, for metrics. A blocking backend is
+        not read here: it reports the state seen by this process's last
+        transaction.
+        """
+        if self._executor is not None:
+            return dict(self._last_snapshot)
+        return self.state.transact(self._snapshot_of)
+
+
+def backoff_seconds(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with equal jitter: half fixed, half random, so retries spread out."""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def limiter_from_env(overload_errors: Tuple[Type[BaseException], ...]) -> AdaptiveLimiter:
+    """
+    IMAGEN_CONCURRENCY_MIN/_MAX/_INITIAL bound the limit. IMAGEN_LIMITER_STATE
+    selects "memory" (per process, default) or "file" (IMAGEN_LIMITER_FILE),
+    which shares one budget between every process using the file.
+    """
+    min_limit = int(os.environ.get("IMAGEN_CONCURRENCY_MIN", 1))
+    max_limit = int(os.environ.get("IMAGEN_CONCURRENCY_MAX", 8))
+    initial = float(os.environ.get("IMAGEN_CONCURRENCY_INITIAL", 2))
+    initial = min(max(initial, min_limit), max_limit)
+    backend = os.environ.get("IMAGEN_LIMITER_STATE", "memory")
+    if backend == "file":
+        state = FileLimiterState(os.environ.get("IMAGEN_LIMITER_FILE", "/tmp/imagen-limiter.json"), initial)
+    elif backend == "memory":
+        state = InProcessLimiterState(initial)
+    else:
+        raise ValueError(f"Unknown IMAGEN_LIMITER_STATE '{backend}'; expected 'memory' or 'file'.")
+    return AdaptiveLimiter(state, min_limit, max_limit, overload_errors,
+                           lease_seconds=float(os.environ.get("IMAGEN_LEASE_SECONDS", 300)))
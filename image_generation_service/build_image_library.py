@@ -0,0 +1,90 @@
+# build_image_library.py
+# Builds the image library served by image_library.py from a folder of
+# source images. Keywords come from each file name ("coins-stack-savings.jpg")
+# plus an optional sidecar text file of extra keywords ("coins-stack-savings.txt").
+# Every image is center-cropped and resized to each --size, so the service
+# only reads files. Needs Pillow (in requirements.txt).
+#
+# The default sizes cover the picture placeholders of the bundled templates
+# at the design service's 150 DPI: near-square ones, and Dark's portrait one.
+#   python build_image_library.py ./library-src ./image_library
+#   python build_image_library.py ./library-src ./image_library --size 1088x1088 --size 832x1088
+
+import os
+import re
+import json
+import argparse
+import logging
+
+from PIL import Image, ImageOps
+
+from image_library import keywords
+
+logger = logging.getLogger(__name__)
+
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+DEFAULT_SIZES = ["1088x1088", "832x1088"]
+
+
+def parse_size(size: str):
+    match = re.fullmatch(r"(\d+)x(\d+)", size)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Size '{size}' is not WIDTHxHEIGHT.")
+    return size
+
+
+def image_keywords(source_dir: str, name: str) -> list:
+    stem = os.path.splitext(name)[0]
+    words = keywords(stem.replace("-", " ").replace("_", " "))
+    sidecar = os.path.join(source_dir, stem + ".txt")
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            words += keywords(f.read())
+    return sorted(set(words))
+
+
+def build(source_dir: str, out_dir: str, sizes: list, quality: int = 85) -> dict:
+    images = []
+    for name in sorted(os.listdir(source_dir)):
+        if not name.lower().endswith(SOURCE_EXTENSIONS):
+            continue
+        image_id = re.sub(r"[^a-z0-9]+", "-", os.path.splitext(name)[0].lower()).strip("-")
+        words = image_keywords(source_dir, name)
+        if not words:
+            logger.warning(f"Skipping {name}: no keywords in its name or sidecar file.")
+            continue
+        os.makedirs(os.path.join(out_dir, image_id), exist_ok=True)
+        with Image.open(os.path.join(source_dir, name)) as source:
+            source = ImageOps.exif_transpose(source).convert("RGB")
+            files = {}
+            for size in sizes:
+                width, height = map(int, size.split("x"))
+                relative = f"{image_id}/{size}.jpg"
+                ImageOps.fit(source, (width, height), Image.LANCZOS).save(
+                    os.path.join(out_dir, relative), "JPEG", quality=quality, optimize=True)
+                files[size] = relative
+        images.append({"id": image_id, "keywords": words, "files": files})
+        logger.info(f"{image_id}: {', '.join(words)}")
+    manifest = {"sizes": sizes, "images": images}
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the keyword-indexed image library.")
+    parser.add_argument("source_dir")
+    parser.add_argument("out_dir")
+    parser.add_argument("--size", action="append", type=parse_size, dest="sizes",
+                        help=f"WIDTHxHEIGHT to store; repeatable (default: {', '.join(DEFAULT_SIZES)}).")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG quality.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    os.makedirs(args.out_dir, exist_ok=True)
+    manifest = build(args.source_dir, args.out_dir, args.sizes or DEFAULT_SIZES, args.quality)
+    print(f"Wrote {len(manifest['images'])} images at {', '.join(manifest['sizes'])} to {args.out_dir}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# image_cache.py
+# Generated images keyed by a normalized hash of what they were generated
+# from: slide title, slide content, theme, model and aspect ratio. A hit
+# skips both the prompt-writing Gemini call and the Imagen call.
+#
+# Two tiers: an in-memory LRU bounded by total bytes, in front of a
+# size-bounded directory that survives restarts and is shared by every
+# worker process on the host. Disk entries are evicted least recently
+# used first (by mtime, which a hit refreshes).
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace and case, so trivially different slide text maps to the same key."""
+    return " ".join(text.split()).casefold()
+
+
+def image_cache_key(title: str, content: List[str], theme: str, model: str, aspect_ratio: str) -> str:
+    """sha256 of the image inputs; case and whitespace differences do not change it."""
+    canonical = json.dumps({"title": normalize_text(title), "content": [normalize_text(c) for c in content],
+                            "theme": normalize_text(theme), "model": model, "aspect_ratio": aspect_ratio},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    `memory_max_bytes` of recently used images in memory, backed by up to
+    `disk_max_bytes` under `disk_dir` (no disk tier when disk_dir is None).
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.memory_max_bytes = max(0, memory_max_bytes)
+        self.disk_dir = os.path.abspath(disk_dir) if disk_dir else None
+        self.disk_max_bytes = max(0, disk_max_bytes)
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    # --- Memory tier ---
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    # --- Disk tier ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _disk_entries(self):
+        """(path, size, mtime) of every cached file."""
+        for directory, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Evicted by another worker.
+                yield path, stat.st_size, stat.st_mtime
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used.
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so other workers never read a partial image.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Deletes least recently used files until the tier is at 90% of its budget."""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+        logger.info(f"Image cache evicted {removed} files from disk; {total} bytes remain.")
+
+    # --- Public API ---
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+        data = self._read_disk(key) if self.disk_dir else None
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        if self.disk_dir and self.disk_max_bytes:
+            try:
+                self._write_disk(key, data)
+            except OSError as e:
+                logger.warning(f"Could not write image {key[:12]} to the disk cache: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "memory_entries": len(self._memory), "memory_bytes": self._memory_bytes,
+                    "memory_max_bytes": self.memory_max_bytes, "disk_dir": self.disk_dir,
+                    "disk_bytes": self._disk_bytes, "disk_max_bytes": self.disk_max_bytes}
+
+
+def image_cache_from_env() -> Optional[ImageCache]:
+    """
+    IMAGE_CACHE=off disables caching. IMAGE_CACHE_MEMORY_MB sizes the memory
+    tier; IMAGE_CACHE_DIR and IMAGE_CACHE_DISK_MB enable the disk tier.
+    """
+    if os.environ.get("IMAGE_CACHE", "on").lower() == "off":
+        return None
+    return ImageCache(
+        memory_max_bytes=int(float(os.environ.get("IMAGE_CACHE_MEMORY_MB", 256)) * 1024 * 1024),
+        disk_dir=os.environ.get("IMAGE_CACHE_DIR") or None,
+        disk_max_bytes=int(float(os.environ.get("IMAGE_CACHE_DISK_MB", 2048)) * 1024 * 1024))
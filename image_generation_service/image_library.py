@@ -0,0 +1,128 @@
+# image_library.py
+# A small library of ready-made images (charts, coins, skylines, networks...)
+# matched to slides by keyword. It answers instantly: as the fallback when
+# Imagen fails or runs out of time, or in place of Imagen in fast mode.
+#
+# The library directory is written by build_image_library.py:
+#   manifest.json                 {"sizes": [...], "images": [{"id", "keywords", "files"}]}
+#   <image id>/<width>x<height>.jpg
+# Each image is stored pre-cropped at the sizes the templates need, so
+# serving one is a file read. The keyword index is built in memory at startup.
+
+import os
+import re
+import json
+import math
+import zlib
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in into is it its of on or our that the their this to was
+    were will with your you we how what why when which who than then more most over under about across
+""".split())
+# Title words say more about the slide than bullet text.
+TITLE_WEIGHT = 2.0
+
+
+def keywords(text: str) -> List[str]:
+    """Lowercase words without stopwords, plural 's' stripped, so 'Stocks' matches 'stock'."""
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) < 3 or word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+class LibraryImage(NamedTuple):
+    id: str
+    keywords: Set[str]
+    files: Dict[str, str]  # "<width>x<height>" -> path relative to the library directory
+
+
+class ImageLibrary:
+    """
+    Inverted index from keyword to images. `match` scores every image that
+    shares a keyword with the slide by the summed IDF of the shared words,
+    so rare, specific words ("mortgage") outweigh common ones ("market").
+    """
+
+    def __init__(self, root_dir: str, images: List[LibraryImage], size: Optional[str] = None):
+        self.root_dir = os.path.abspath(root_dir)
+        self.images = images
+        self.size = size
+        self._index: Dict[str, List[int]] = defaultdict(list)
+        for position, image in enumerate(images):
+            for word in image.keywords:
+                self._index[word].append(position)
+        self._idf = {word: math.log(1 + len(images) / len(postings)) for word, postings in self._index.items()}
+
+    @classmethod
+    def load(cls, root_dir: str, size: Optional[str] = None) -> "ImageLibrary":
+        with open(os.path.join(root_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        images = [LibraryImage(entry["id"], {w for k in entry["keywords"] for w in keywords(k)}, entry["files"])
+                  for entry in manifest["images"]]
+        # Serve the requested size, else the first size the library was built with.
+        size = size if size in manifest.get("sizes", []) else (manifest.get("sizes") or [None])[0]
+        return cls(root_dir, images, size)
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def stats(self) -> dict:
+        return {"images": len(self.images), "keywords": len(self._index), "size": self.size}
+
+    def match(self, title: str, content: Iterable[str], avoid: Set[str] = frozenset()) -> Optional[LibraryImage]:
+        """
+        The best-scoring image for the slide, or None when no keyword matches.
+        Among equal scores the choice is stable per slide title. Images in
+        `avoid` (e.g. already used in this deck) give way to an unused one
+        scoring at least half as well.
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        for weight, text in [(TITLE_WEIGHT, title)] + [(1.0, line) for line in content]:
+            for word in set(keywords(text)):
+                for position in self._index.get(word, ()):
+                    scores[position] += weight * self._idf[word]
+        if not scores:
+            return None
+        salt = zlib.crc32(title.encode("utf-8"))
+        ranked = sorted(scores, key=lambda p: (-scores[p], zlib.crc32(self.images[p].id.encode("utf-8")) ^ salt))
+        best = scores[ranked[0]]
+        for position in ranked:
+            if scores[position] < best / 2:
+                break
+            if self.images[position].id not in avoid:
+                return self.images[position]
+        return self.images[ranked[0]]
+
+    def read(self, image: LibraryImage) -> bytes:
+        relative = image.files.get(self.size) or next(iter(image.files.values()))
+        with open(os.path.join(self.root_dir, relative), "rb") as f:
+            return f.read()
+
+
+def image_library_from_env() -> Optional[ImageLibrary]:
+    """
+    IMAGE_LIBRARY_DIR points at a library built by build_image_library.py;
+    IMAGE_LIBRARY_SIZE picks which of its sizes to serve. None when unset or
+    missing, in which case slides without a generated image get none.
+    """
+    root_dir = os.environ.get("IMAGE_LIBRARY_DIR")
+    if not root_dir:
+        return None
+    try:
+        library = ImageLibrary.load(root_dir, os.environ.get("IMAGE_LIBRARY_SIZE"))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Image library at {root_dir} could not be loaded: {e}")
+        return None
+    logger.info(f"Image library loaded: {len(library)} images, {len(library._index)} keywords, size {library.size}.")
+    return library
@@ -1,17 +1,26 @@
 import os
+import json
+import time
 import base64
 import asyncio
 import logging
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
 
 from fastapi import FastAPI, HTTPException
 from google.api_core.exceptions import ResourceExhausted
 import vertexai
 from vertexai.preview.vision_models import ImageGenerationModel
-from vertexai.generative_models import GenerativeModel
+from vertexai.generative_models import GenerationConfig, GenerativeModel
 
 # Import the Pydantic models
 from models import ImageGenerationRequest, ImageServiceResponse, Slide
+from blob_store import blob_store_from_env, image_size
+from image_cache import image_cache_key, image_cache_from_env, normalize_text
+from adaptive_limiter import backoff_seconds, limiter_from_env
+from image_library import image_library_from_env
+import tracing
+import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -19,8 +28,15 @@ app = FastAPI(
     title="Image Generation Service",
     description="Generates images for presentation slides based on provided content."
 )
+# TRACE_EXPORTER selects "off" (default), "console" or "file" (TRACE_FILE); see tracing.py.
+tracing.init_tracing("image-generation-service")
+tracing.instrument_app(app)
+metrics.instrument_app(app)
 
 # --- Initialize Vertex AI ---
+IMAGE_MODEL_NAME = "imagen-3.0-generate-002"
+TEXT_MODEL_NAME = "gemini-2.5-flash"
+IMAGE_ASPECT_RATIO = "16:9"
 try:
     PROJECT_ID = os.environ.get("GCP_PROJECT")
     LOCATION = "us-central1"
@@ -29,8 +45,8 @@ try:
 
     vertexai.init(project=PROJECT_ID, location=LOCATION)
     
-    image_model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-002")
-    text_model = GenerativeModel("gemini-2.5-flash")
+    image_model = ImageGenerationModel.from_pretrained(IMAGE_MODEL_NAME)
+    text_model = GenerativeModel(TEXT_MODEL_NAME)
     
     logging.info("✅ Vertex AI models initialized successfully.")
 except Exception as e:
@@ -38,13 +54,33 @@ except Exception as e:
     image_model = None
     text_model = None
 
+# Shared content-addressed image store; None when IMAGE_BLOB_STORE_DIR is unset.
+blob_store = blob_store_from_env()
+# Previously generated images by slide content and theme; None when IMAGE_CACHE=off.
+# See image_cache.py for the memory and disk tier settings.
+image_cache = image_cache_from_env()
+if image_cache:
+    metrics.CallbackMetric(
+        "image_cache_lookups_total", "Image cache lookups, by the tier that answered.", "counter",
+        lambda: {("memory_hit",): image_cache.memory_hits, ("disk_hit",): image_cache.disk_hits,
+                 ("miss",): image_cache.misses}, ("result",))
+# Ready-made images matched to slides by keyword; None when IMAGE_LIBRARY_DIR
+# is unset (see image_library.py, built by build_image_library.py).
+# IMAGE_LIBRARY_MODE "fallback" (default) fills slides that got no generated
+# image; "fast" skips Gemini and Imagen for every request; "off" disables it.
+IMAGE_LIBRARY_MODE = os.environ.get("IMAGE_LIBRARY_MODE", "fallback")
+image_library = image_library_from_env() if IMAGE_LIBRARY_MODE != "off" else None
+image_library_lookups = metrics.Counter(
+    "image_library_lookups_total", "Image library lookups for slides without a generated image, by result.",
+    ("result",))
+
 # --- REMOVED: assess_image_necessity function is no longer needed ---
 
 def extract_content_from_slide(slide: Slide) -> Tuple[str, List[str]]:
     """Intelligently extracts the title and content from a slide."""
     data = slide.data
     title = data.title or "Untitled"
-    content_list = data.points or data.items or []
+    content_list = list(data.points or data.items or [])
     
     if data.subtitle:
         content_list.insert(0, data.subtitle)
@@ -53,8 +89,9 @@ def extract_content_from_slide(slide: Slide) -> Tuple[str, List[str]]:
         
     return title, [item for item in content_list if item]
 
-async def generate_image_prompt(slide_title: str, slide_content: List[str], theme: str) -> str:
-    """Uses Gemini to generate a concise and effective image prompt."""
+async def generate_image_prompt(slide_title: str, slide_content: List[str], theme: str,
+                                memo_key: Optional[Tuple] = None) -> str:
+    """Uses Gemini to generate a concise and effective image prompt, memoized under `memo_key` if given."""
     if not text_model:
         return f"A professional, {theme}-themed image about {slide_title}"
     
@@ -71,78 +108,297 @@ async def generate_image_prompt(slide_title: str, slide_content: List[str], them
     Example Output: Minimalist glowing data charts and graphs on a clean background.
     """
     try:
-        response = await text_model.generate_content_async(prompt_template)
+        with tracing.span("llm.image_prompt", kind="CLIENT", **{"llm.model": TEXT_MODEL_NAME}), \
+                metrics.model_call(TEXT_MODEL_NAME, "image_prompt"):
+            response = await text_model.generate_content_async(prompt_template)
         clean_prompt = response.text.strip().replace('"', '')
         logging.info(f"Generated prompt for '{slide_title}': '{clean_prompt}'")
+        if memo_key:
+            remember_prompt(memo_key, clean_prompt)
         return clean_prompt
     except Exception as e:
         logging.error(f"Error generating prompt for '{slide_title}': {e}")
         return f"A high-quality, {theme}-themed abstract image about {slide_title}"
 
-# Limit concurrent calls to the image generation API to avoid quota errors
-MAX_CONCURRENT_IMAGES = 1
-image_gen_semaphore = asyncio.Semaphore(MAX_CONCURRENT_IMAGES)
+# --- Batched image prompts ---
+# "batched" writes the prompts for up to IMAGE_PROMPT_BATCH_SIZE slides in
+# one Gemini call, falling back to generate_image_prompt only for slides
+# the reply leaves out; "per_slide" makes one call per slide.
+IMAGE_PROMPT_MODE = os.environ.get("IMAGE_PROMPT_MODE", "batched")
+IMAGE_PROMPT_BATCH_SIZE = int(os.environ.get("IMAGE_PROMPT_BATCH_SIZE", 20))
+# Prompts already written, by normalized (title, content, theme).
+IMAGE_PROMPT_MEMO_SIZE = int(os.environ.get("IMAGE_PROMPT_MEMO_SIZE", 4096))
+prompt_memo: "OrderedDict[Tuple, str]" = OrderedDict()
+prompt_memo_lookups = metrics.Counter(
+    "image_prompt_memo_lookups_total", "Image prompt memo lookups, by result.", ("result",))
+prompt_fallbacks = metrics.Counter(
+    "image_prompt_fallbacks_total", "Slides whose prompt fell back to a single-slide call.")
+
+def prompt_memo_key(title: str, content: List[str], theme: str) -> Tuple:
+    return normalize_text(title), tuple(normalize_text(c) for c in content), normalize_text(theme)
+
+def remember_prompt(key: Tuple, prompt: str) -> None:
+    prompt_memo[key] = prompt
+    prompt_memo.move_to_end(key)
+    while len(prompt_memo) > IMAGE_PROMPT_MEMO_SIZE:
+        prompt_memo.popitem(last=False)
+
+async def request_prompt_batch(slides: List[Tuple[str, List[str]]], theme: str) -> Dict[int, str]:
+    """One Gemini call for several slides; returns the prompts it produced, by position in `slides`."""
+    slide_lines = "\n".join(
+        json.dumps({"index": i, "title": title, "content": "; ".join(content)}, ensure_ascii=False)
+        for i, (title, content) in enumerate(slides))
+    prompt_template = f"""
+    For each presentation slide below, create a short, professional, and visually clear image prompt (under 15 words).
+    Each image should be a simple, clean, and abstract visual metaphor for that slide's core concept.
+    Avoid text, complex scenes, or people's faces. Focus on minimalist, corporate aesthetics.
+
+    Theme: "{theme}"
+    Slides (one JSON object per line):
+    {slide_lines}
+
+    Respond with a JSON array containing one object per slide: {{"index": <slide index>, "prompt": "<image prompt>"}}.
+    Example item: {{"index": 0, "prompt": "Minimalist glowing data charts and graphs on a clean background."}}
+    """
+    with tracing.span("llm.image_prompts", kind="CLIENT", **{"llm.model": TEXT_MODEL_NAME, "slides": len(slides)}), \
+            metrics.model_call(TEXT_MODEL_NAME, "image_prompts"):
+        response = await text_model.generate_content_async(
+            prompt_template, generation_config=GenerationConfig(response_mime_type="application/json"))
+    items = json.loads(response.text)
+    if not isinstance(items, list):
+        raise ValueError(f"Expected a JSON array of prompts, got {type(items).__name__}.")
+    prompts = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+            continue
+        index = item.get("index")
+        if isinstance(index, int) and 0 <= index < len(slides) and item["prompt"].strip():
+            prompts[index] = item["prompt"].strip().replace('"', '')
+    return prompts
+
+async def generate_image_prompts(slides: List[Tuple[str, List[str]]], theme: str) -> List[str]:
+    """Image prompts for (title, content) pairs: memoized ones first, then batched calls, then per slide."""
+    keys = [prompt_memo_key(title, content, theme) for title, content in slides]
+    prompts: List[Optional[str]] = [prompt_memo.get(key) for key in keys]
+    for prompt in prompts:
+        prompt_memo_lookups.inc(result="miss" if prompt is None else "hit")
+    # Identical slides in one request share a single prompt.
+    missing: Dict[Tuple, List[int]] = {}
+    for i, (key, prompt) in enumerate(zip(keys, prompts)):
+        if prompt is None:
+            missing.setdefault(key, []).append(i)
+    todo = [positions[0] for positions in missing.values()]
+
+    if IMAGE_PROMPT_MODE == "batched" and text_model and todo:
+        batches = [todo[start:start + IMAGE_PROMPT_BATCH_SIZE] for start in range(0, len(todo), IMAGE_PROMPT_BATCH_SIZE)]
+        replies = await asyncio.gather(*(request_prompt_batch([slides[i] for i in batch], theme) for batch in batches),
+                                       return_exceptions=True)
+        for batch, reply in zip(batches, replies):
+            if isinstance(reply, Exception):
+                logging.warning(f"Batched prompt generation for {len(batch)} slides failed: {reply}")
+                continue
+            for position, prompt in reply.items():
+                prompts[batch[position]] = prompt
+                remember_prompt(keys[batch[position]], prompt)
+        todo = [i for i in todo if prompts[i] is None]
+        prompt_fallbacks.inc(len(todo))
+        if todo:
+            logging.info(f"Writing {len(todo)} image prompts one slide at a time.")
 
-async def generate_single_image(prompt: str) -> str:
-    """Generates a single image with concurrency limiting and retry logic."""
+    singles = await asyncio.gather(*(generate_image_prompt(*slides[i], theme, memo_key=keys[i]) for i in todo))
+    for i, prompt in zip(todo, singles):
+        prompts[i] = prompt
+
+    for positions in missing.values():
+        for i in positions[1:]:
+            prompts[i] = prompts[positions[0]]
+    logging.info(f"Image prompts for {len(slides)} slides: {len(slides) - sum(map(len, missing.values()))} memoized.")
+    return prompts
+
+# Concurrent Imagen calls adapt to quota: more on success, fewer on
+# ResourceExhausted (see adaptive_limiter.py for the settings). Retries
+# back off without holding a slot, so other decks keep generating.
+IMAGEN_MAX_ATTEMPTS = int(os.environ.get("IMAGEN_MAX_ATTEMPTS", 3))
+IMAGEN_QUOTA_BACKOFF_SECONDS = float(os.environ.get("IMAGEN_QUOTA_BACKOFF_SECONDS", 20))
+IMAGEN_ERROR_BACKOFF_SECONDS = float(os.environ.get("IMAGEN_ERROR_BACKOFF_SECONDS", 2))
+IMAGEN_BACKOFF_CAP_SECONDS = float(os.environ.get("IMAGEN_BACKOFF_CAP_SECONDS", 120))
+image_limiter = limiter_from_env(overload_errors=(ResourceExhausted,))
+image_limiter_wait = metrics.Histogram(
+    "imagen_limiter_wait_seconds", "Time an image waits for a free Imagen slot.",
+    buckets=metrics.SLOW_LATENCY_BUCKETS)
+metrics.CallbackMetric(
+    "imagen_concurrency", "Adaptive Imagen concurrency limit and slots in use.", "gauge",
+    lambda: {(name,): value for name, value in image_limiter.snapshot().items()}, ("value",))
+
+async def generate_single_image(prompt: str) -> bytes:
+    """Generates a single image with adaptive concurrency limiting and retry logic."""
     if not image_model:
         raise HTTPException(status_code=503, detail="Imagen model not available.")
     
-    async with image_gen_semaphore:
-        for attempt in range(3):
-            try:
+    for attempt in range(IMAGEN_MAX_ATTEMPTS):
+        try:
+            wait_start = time.perf_counter()
+            async with image_limiter.slot():
+                image_limiter_wait.observe(time.perf_counter() - wait_start)
                 # Run the blocking function in a separate thread
-                response = await asyncio.to_thread(
-                    image_model.generate_images,
-                    prompt=prompt, 
-                    number_of_images=1, 
-                    aspect_ratio="16:9"
-                )
-                return base64.b64encode(response[0]._image_bytes).decode("utf-8")
-            except ResourceExhausted as e:
-                logging.warning(f"Quota exceeded on attempt {attempt + 1}. Retrying... Error: {e}")
-                await asyncio.sleep(20 * (attempt + 1))
-            except Exception as e:
-                logging.warning(f"Image generation attempt {attempt + 1} failed. Retrying... Error: {e}")
-                await asyncio.sleep(2 * (attempt + 1))
-        
-        raise HTTPException(status_code=500, detail=f"Failed to generate image for prompt '{prompt}' after retries.")
+                with tracing.span("imagen.generate", kind="CLIENT", **{"imagen.attempt": attempt + 1}), \
+                        metrics.model_call(IMAGE_MODEL_NAME, "generate_image"):
+                    response = await asyncio.to_thread(
+                        image_model.generate_images,
+                        prompt=prompt, 
+                        number_of_images=1, 
+                        aspect_ratio=IMAGE_ASPECT_RATIO
+                    )
+            return response[0]._image_bytes
+        except ResourceExhausted as e:
+            error, base_delay = "ResourceExhausted", IMAGEN_QUOTA_BACKOFF_SECONDS
+            logging.warning(f"Quota exceeded on attempt {attempt + 1}. Error: {e}")
+        except Exception as e:
+            error, base_delay = type(e).__name__, IMAGEN_ERROR_BACKOFF_SECONDS
+            logging.warning(f"Image generation attempt {attempt + 1} failed. Error: {e}")
+        if attempt + 1 < IMAGEN_MAX_ATTEMPTS:
+            metrics.model_call_retries.inc(model=IMAGE_MODEL_NAME, operation="generate_image", error=error)
+            await asyncio.sleep(backoff_seconds(attempt, base_delay, IMAGEN_BACKOFF_CAP_SECONDS))
     
+    raise HTTPException(status_code=500, detail=f"Failed to generate image for prompt '{prompt}' after retries.")
+
+async def generate_and_cache(prompt: str, cache_key: str) -> Optional[bytes]:
+    """Generates an image and stores it in the image cache; None when generation fails."""
+    try:
+        image_bytes = await generate_single_image(prompt)
+    except Exception as e:
+        logging.warning(f"No image for prompt '{prompt[:80]}': {getattr(e, 'detail', e)}")
+        return None
+    if image_cache:
+        await asyncio.to_thread(image_cache.put, cache_key, image_bytes)
+    return image_bytes
+
+# --- Deadlines ---
+# A request's deadline_seconds is how long the caller will wait. The response
+# is sent this much earlier, to leave time for encoding and transfer.
+IMAGE_DEADLINE_MARGIN_SECONDS = float(os.environ.get("IMAGE_DEADLINE_MARGIN_SECONDS", 2))
+# With the image cache on, images still generating at the deadline keep
+# running and are cached, so a retry of the same deck finds them ready.
+background_images: Set[asyncio.Task] = set()
+images_past_deadline = metrics.Counter(
+    "images_past_deadline_total", "Images not ready by the caller's deadline, by the step that ran out of time.",
+    ("step",))
+
+def attach_image(slide: Slide, image_bytes: bytes, use_blob_store: bool) -> None:
+    """Stores the image on the slide, either inline as base64 or as a blob reference."""
+    if use_blob_store:
+        with tracing.span("blob_store.put", **{"image.bytes": len(image_bytes)}):
+            slide.image_sha256 = blob_store.put(image_bytes)
+        slide.image_width, slide.image_height = image_size(image_bytes)
+    else:
+        slide.image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+
 @app.post("/generate-images", response_model=ImageServiceResponse)
 async def generate_images(request: ImageGenerationRequest):
     """
     Receives a list of slides, generates an image for each one, and returns
-    the updated list of slides with the 'image_base64' field populated.
+    the updated list of slides with the 'image_base64' field populated, or
+    'image_sha256' and dimensions when the blob transport is requested.
+    With a deadline, slides whose image is not ready in time get a library
+    image instead, or none. Fast mode uses only the cache and the library,
+    as does every request while the AI models are unavailable, if there is
+    a library to fall back on.
     """
-    if not image_model or not text_model:
-        raise HTTPException(status_code=503, detail="AI models are not available.")
-    
-    # Step 1: Generate all image prompts in parallel
-    prompt_generation_tasks = []
-    for slide in request.slides:
-        title, content = extract_content_from_slide(slide)
-        prompt_generation_tasks.append(generate_image_prompt(title, content, request.theme))
+    use_blob_store = request.image_transport == "blob" and blob_store is not None
+    if request.image_transport == "blob" and blob_store is None:
+        logging.warning("Blob transport requested but IMAGE_BLOB_STORE_DIR is not set. Falling back to base64.")
+
+    deadline = None
+    if request.deadline_seconds is not None:
+        deadline = time.monotonic() + max(0.0, request.deadline_seconds - IMAGE_DEADLINE_MARGIN_SECONDS)
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
     
-    image_prompts = await asyncio.gather(*prompt_generation_tasks, return_exceptions=True)
-
-    # Step 2: Generate all images in parallel
-    image_generation_tasks = []
-    for prompt in image_prompts:
-        if isinstance(prompt, Exception):
-            # If prompt generation failed, we can't generate an image
-            image_generation_tasks.append(asyncio.sleep(0, result=None)) # Placeholder for failed prompt
-        else:
-            image_generation_tasks.append(generate_single_image(prompt))
-            
-    images_base64 = await asyncio.gather(*image_generation_tasks, return_exceptions=True)
-
-    # Step 3: Populate the original slide objects with the generated images
+    # Step 1: Reuse images already generated for the same content and theme,
+    # unless the caller asked for fresh ones.
+    slide_contents = [extract_content_from_slide(slide) for slide in request.slides]
+    cache_keys = [image_cache_key(title, content, request.theme, IMAGE_MODEL_NAME, IMAGE_ASPECT_RATIO)
+                  for title, content in slide_contents]
+    images = [None] * len(request.slides)
+    if image_cache and not request.fresh_images:
+        images = await asyncio.gather(*(asyncio.to_thread(image_cache.get, key) for key in cache_keys))
+    sources = ["cache" if image else None for image in images]
+    pending = [i for i, image in enumerate(images) if image is None]
+    if len(pending) < len(images):
+        logging.info(f"Image cache served {len(images) - len(pending)} of {len(images)} images.")
+    if request.fast_images or IMAGE_LIBRARY_MODE == "fast":
+        pending = []
+    if pending and (not image_model or not text_model):
+        # Only slides that would need Gemini and Imagen depend on the models.
+        if not image_library:
+            raise HTTPException(status_code=503, detail="AI models are not available.")
+        logging.warning(f"AI models are not available; {len(pending)} slides get library images only.")
+        pending = []
+
+    # Step 2: Write image prompts for the rest (batched, memoized)
+    try:
+        image_prompts = await asyncio.wait_for(
+            generate_image_prompts([slide_contents[i] for i in pending], request.theme), remaining())
+    except asyncio.TimeoutError:
+        logging.warning(f"Deadline reached while writing image prompts for {len(pending)} slides.")
+        images_past_deadline.inc(len(pending), step="prompts")
+        image_prompts = [None] * len(pending)
+
+    # Step 3: Generate their images in parallel, until the deadline
+    tasks = {i: asyncio.create_task(generate_and_cache(prompt, cache_keys[i]))
+             for i, prompt in zip(pending, image_prompts) if prompt and not isinstance(prompt, Exception)}
+    late = set()
+    if tasks:
+        _, late = await asyncio.wait(tasks.values(), timeout=remaining())
+    for i, task in tasks.items():
+        if task not in late:
+            images[i] = task.result()
+            sources[i] = "generated" if images[i] else None
+    if late:
+        logging.warning(f"Deadline reached with {len(late)} images still generating; answering without them.")
+        images_past_deadline.inc(len(late), step="images")
+        for task in late:
+            if image_cache:
+                background_images.add(task)
+                task.add_done_callback(background_images.discard)
+            else:
+                task.cancel()
+
+    # Step 4: Fill the slides still without an image from the image library,
+    # preferring images not already used in this request
+    if image_library:
+        used = set()
+        for i in [i for i, image in enumerate(images) if not image]:
+            match = image_library.match(*slide_contents[i], avoid=used)
+            image_library_lookups.inc(result="hit" if match else "miss")
+            if match:
+                used.add(match.id)
+                images[i] = await asyncio.to_thread(image_library.read, match)
+                sources[i] = "library"
+
+    # Step 5: Populate the original slide objects with the images
     updated_slides = []
     for i, slide in enumerate(request.slides):
-        base64_image = images_base64[i]
-        if base64_image and not isinstance(base64_image, Exception):
-            slide.image_base64 = base64_image
+        image_bytes = images[i]
+        if image_bytes:
+            await asyncio.to_thread(attach_image, slide, image_bytes, use_blob_store)
+            slide.image_source = sources[i]
         updated_slides.append(slide)
 
-    logging.info(f"✅ Successfully processed images for {len(updated_slides)} slides.")
-    return ImageServiceResponse(slides_with_images=updated_slides)
\ No newline at end of file
+    logging.info(f"✅ Processed images for {len(updated_slides)} slides; "
+                 f"{sum(1 for image in images if image)} have one.")
+    return ImageServiceResponse(slides_with_images=updated_slides)
+
+@app.get("/library/stats")
+async def image_library_stats():
+    """Whether an image library is loaded (the UI offers fast mode only then), and its size."""
+    if image_library is None:
+        return {"enabled": False, "mode": IMAGE_LIBRARY_MODE}
+    return {"enabled": True, "mode": IMAGE_LIBRARY_MODE, **image_library.stats()}
+
+@app.get("/images/cache/stats")
+async def image_cache_stats():
+    if image_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **image_cache.stats()}
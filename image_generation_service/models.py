@@ -14,11 +14,27 @@ class Slide(BaseModel):
     layout: str
     data: SlideData
     image_base64: Optional[str] = None
+    # Set instead of image_base64 when images travel through the blob store.
+    image_sha256: Optional[str] = None
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    # Where the image came from: "generated", "cache" or "library".
+    image_source: Optional[str] = None
 
 # Request received by this service
 class ImageGenerationRequest(BaseModel):
     slides: List[Slide]
     theme: str = "professional"
+    # "base64" embeds images in the response; "blob" writes them to the shared
+    # blob store and returns only image_sha256 and dimensions.
+    image_transport: str = "base64"
+    # Skip the image cache and generate every image again.
+    fresh_images: bool = False
+    # Seconds the caller will wait. Slides whose image is not ready by then
+    # come back without one; see generate_images.
+    deadline_seconds: Optional[float] = None
+    # Use only cached and image library images; no Gemini or Imagen calls.
+    fast_images: bool = False
 
 # Response sent by this service
 class ImageServiceResponse(BaseModel):
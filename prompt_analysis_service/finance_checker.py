@@ -5,6 +5,8 @@ import vertexai
 from vertexai.generative_models import GenerativeModel
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+import tracing
+import metrics
 
 # --- Pydantic Models --------------------------------------------------------
 
@@ -82,7 +84,9 @@ async def is_finance_topic(user_prompt: str) -> bool:
     full_prompt = f'{system_prompt}\nUser Request: "{user_prompt}"'
 
     try:
-        response = await model.generate_content_async(full_prompt)
+        with tracing.span("llm.finance_check", kind="CLIENT", **{"llm.model": "gemini-2.5-flash"}), \
+                metrics.model_call("gemini-2.5-flash", "finance_check"):
+            response = await model.generate_content_async(full_prompt)
         last_line = response.text.strip().lower().splitlines()[-1]
         final_answer = last_line.replace("response:", "").strip()
         print(f"Finance check for '{user_prompt[:40]}...': {final_answer}")
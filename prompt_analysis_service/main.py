@@ -1,13 +1,15 @@
 import os
-import json
-import re
 from fastapi import FastAPI, HTTPException
+from pydantic import ValidationError
 from models import UserPromptRequest, AnalysisResult
 from finance_checker import is_finance_topic
+from structured_output import JSONRepairError, as_object, parse_model_json, response_schema
+import tracing
+import metrics
 
 # MODIFIED: Import Vertex AI libraries
 import vertexai
-from vertexai.generative_models import GenerativeModel
+from vertexai.generative_models import GenerationConfig, GenerativeModel
 
 # MODIFIED: Initialize Vertex AI
 # Make sure to set your project and location in your environment
@@ -18,16 +20,36 @@ vertexai.init(project=PROJECT_ID, location=LOCATION)
 model = GenerativeModel("gemini-2.5-flash")
 
 app = FastAPI()
+# TRACE_EXPORTER selects "off" (default), "console" or "file" (TRACE_FILE); see tracing.py.
+tracing.init_tracing("prompt-analysis-service")
+tracing.instrument_app(app)
+metrics.instrument_app(app)
+json_extraction_failures = metrics.Counter(
+    "json_extraction_failures_total", "Model responses that could not be parsed into request details.")
+json_parses = metrics.Counter(
+    "model_json_parses_total", "Model responses parsed as JSON, by result (clean, repaired or failed).",
+    ["result"])
 
-def extract_json_from_string(text: str) -> str:
-    match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-    if match:
-        return match.group(1)
-    # Fallback for non-fenced JSON
-    match = re.search(r'(\{.*?\})', text, re.DOTALL)
-    if match:
-        return match.group(1)
-    return ""
+# Gemini answers in JSON mode constrained to AnalysisResult's shape; a
+# response that still cannot be repaired or validated is asked for again
+# up to ANALYSIS_RETRIES times.
+ANALYSIS_CONFIG = GenerationConfig(response_mime_type="application/json",
+                                   response_schema=response_schema(AnalysisResult))
+ANALYSIS_RETRIES = int(os.environ.get("ANALYSIS_RETRIES", 1))
+
+def parse_analysis(text: str) -> AnalysisResult:
+    try:
+        parsed = parse_model_json(text)
+    except JSONRepairError:
+        json_parses.inc(result="failed")
+        raise
+    json_parses.inc(result="repaired" if parsed.repairs else "clean")
+    if parsed.repairs:
+        print(f"--- PROMPT ANALYSIS SERVICE: Repaired the model's JSON: {', '.join(parsed.repairs)} ---")
+    value = as_object(parsed.value)
+    if not isinstance(value, dict):
+        raise JSONRepairError("The model's response is not a JSON object.")
+    return AnalysisResult(**value)
 
 @app.post("/analyze", response_model=AnalysisResult)
 async def analyze_prompt(request: UserPromptRequest):
@@ -46,28 +68,35 @@ async def analyze_prompt(request: UserPromptRequest):
     - slide_count: The number of slides requested as an integer. If not specified, default to 7.
     - target_audience: The intended audience. If not mentioned, default to "Knowledgeable Audience".
 
-    Your entire response MUST be only the JSON object, enclosed in ```json ... ```.
+    Your entire response MUST be only the JSON object.
 
     User Request: "{request.prompt}"
     """
 
     try:
-        # --- ADDED LOGGING ---
-        print("--- PROMPT ANALYSIS SERVICE: Sending request to Vertex AI... ---")
-        response = await model.generate_content_async(extraction_prompt)
-        
-        # --- ADDED LOGGING ---
-        print(f"--- PROMPT ANALYSIS SERVICE: Raw response from Vertex AI: ---\n{response.text}\n--------------------")
-        
-        json_string = extract_json_from_string(response.text)
+        for attempt in range(ANALYSIS_RETRIES + 1):
+            # --- ADDED LOGGING ---
+            print("--- PROMPT ANALYSIS SERVICE: Sending request to Vertex AI... ---")
+            with tracing.span("llm.extract_details", kind="CLIENT", **{"llm.model": "gemini-2.5-flash"}), \
+                    metrics.model_call("gemini-2.5-flash", "extract_details"):
+                response = await model.generate_content_async(extraction_prompt, generation_config=ANALYSIS_CONFIG)
 
-        if not json_string:
-             print("--- PROMPT ANALYSIS SERVICE: ERROR - Failed to extract JSON from AI response. ---")
-             raise ValueError("Failed to extract JSON from the model's response.")
+            # --- ADDED LOGGING ---
+            print(f"--- PROMPT ANALYSIS SERVICE: Raw response from Vertex AI: ---\n{response.text}\n--------------------")
 
-        extracted_data = json.loads(json_string)
-        print("--- PROMPT ANALYSIS SERVICE: Successfully parsed JSON. Returning data. ---")
-        return AnalysisResult(**extracted_data)
+            with tracing.span("json.extract", **{"llm.response_chars": len(response.text)}):
+                try:
+                    result = parse_analysis(response.text)
+                except (JSONRepairError, TypeError, ValidationError) as e:
+                    print(f"--- PROMPT ANALYSIS SERVICE: ERROR - Unusable JSON in AI response: {e} ---")
+                    json_extraction_failures.inc()
+                    if attempt == ANALYSIS_RETRIES:
+                        raise
+                    metrics.model_call_retries.inc(model="gemini-2.5-flash", operation="extract_details",
+                                                   error=type(e).__name__)
+                    continue
+            print("--- PROMPT ANALYSIS SERVICE: Successfully parsed JSON. Returning data. ---")
+            return result
 
     except Exception as e:
         print(f"--- PROMPT ANALYSIS SERVICE: CRITICAL ERROR in try block: {e} ---")
@@ -0,0 +1,246 @@
+# tracing.py
+# Request tracing shared by every FinDeck service (identical copy in each).
+# Spans follow the OpenTelemetry data model and are exported as OTLP/JSON,
+# one ExportTraceServiceRequest per line, which the OpenTelemetry
+# Collector's otlpjsonfile receiver (or any OTLP/JSON consumer) can ingest.
+# Context crosses HTTP hops in the W3C `traceparent` header.
+#
+# TRACE_EXPORTER selects "off" (default), "console" (stdout) or "file"
+# (TRACE_FILE). The service name is OTEL_SERVICE_NAME, else the one passed
+# to init_tracing. Finished spans are queued and written by a background
+# thread, so request handlers never block on stdout or the file; when more
+# than TRACE_QUEUE_SIZE spans are waiting, new ones are dropped.
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import secrets
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "off")
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_QUEUE_SIZE = int(os.environ.get("TRACE_QUEUE_SIZE", 10000))
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_SPAN_KINDS = {"INTERNAL": 1, "SERVER": 2, "CLIENT": 3}
+_export_lock = threading.Lock()
+
+
+class SpanContext(NamedTuple):
+    """Identifies a span, possibly one in another process or service."""
+    trace_id: str
+    span_id: str
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("current_span", default=None)
+
+
+def init_tracing(service_name: str) -> None:
+    # Via the environment so spawned worker processes report the same name.
+    os.environ.setdefault("OTEL_SERVICE_NAME", service_name)
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+def current_traceparent() -> Optional[str]:
+    context = _current.get()
+    return f"00-{context.trace_id}-{context.span_id}-01" if context else None
+
+
+def current_trace_id() -> Optional[str]:
+    context = _current.get()
+    return context.trace_id if context else None
+
+
+def inject(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Returns `headers` plus the current span's traceparent, for an outgoing request."""
+    headers = dict(headers or {})
+    traceparent = current_traceparent()
+    if traceparent:
+        headers["traceparent"] = traceparent
+    return headers
+
+
+class Span:
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str], kind: str,
+                 attributes: Dict[str, Any]):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.events: List[dict] = []
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.context.trace_id}-{self.context.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        self.events.append({"name": "exception", "timeUnixNano": str(time.time_ns()), "attributes": _attributes(
+            {"exception.type": type(error).__name__, "exception.message": str(error)})})
+
+
+@contextmanager
+def span(name: str, kind: str = "INTERNAL", parent: Optional[str] = None, trace_id: Optional[str] = None,
+         **attributes: Any) -> Iterator[Span]:
+    """
+    Records a span around the block. The parent is, in order: the
+    `parent` traceparent (e.g. from an incoming request), the current
+    span, or none. A root span joins trace `trace_id` when given.
+    """
+    parent_context = parse_traceparent(parent) or _current.get()
+    if parent_context:
+        context, parent_id = SpanContext(parent_context.trace_id, secrets.token_hex(8)), parent_context.span_id
+    else:
+        context, parent_id = SpanContext(trace_id or new_trace_id(), secrets.token_hex(8)), None
+    current = Span(name, context, parent_id, kind, attributes)
+    token = _current.set(context)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        _export(current)
+
+
+def call_in_trace(traceparent: Optional[str], fn: Callable, *args: Any) -> Any:
+    """Calls fn(*args) as a child of `traceparent`; used to carry context into pool threads and processes."""
+    context = parse_traceparent(traceparent)
+    if context is None:
+        return fn(*args)
+    token = _current.set(context)
+    try:
+        return fn(*args)
+    finally:
+        _current.reset(token)
+
+
+def instrument_app(app) -> None:
+    """Adds a SERVER span per request, continuing the caller's trace when it sends traceparent."""
+
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        with span(f"{request.method} {request.url.path}", kind="SERVER", parent=request.headers.get("traceparent"),
+                  **{"http.method": request.method, "http.target": request.url.path}) as server_span:
+            response = await call_next(request)
+            route = request.scope.get("route")
+            if route is not None:
+                server_span.name = f"{request.method} {route.path}"
+            server_span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                server_span.error = f"HTTP {response.status_code}"
+            response.headers["traceparent"] = server_span.traceparent
+            return response
+
+
+# --- Export ---
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(values: Dict[str, Any]) -> List[dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in values.items() if value is not None]
+
+
+def _otlp(finished: Span) -> dict:
+    record = {
+        "traceId": finished.context.trace_id,
+        "spanId": finished.context.span_id,
+        "name": finished.name,
+        "kind": _SPAN_KINDS.get(finished.kind, 1),
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": _attributes(finished.attributes),
+        "events": finished.events,
+        "status": {"code": 2, "message": finished.error} if finished.error else {},
+    }
+    if finished.parent_id:
+        record["parentSpanId"] = finished.parent_id
+    service_name = os.environ.get("OTEL_SERVICE_NAME", "unknown_service")
+    return {"resourceSpans": [{
+        "resource": {"attributes": _attributes({"service.name": service_name})},
+        "scopeSpans": [{"scope": {"name": "findeck.tracing"}, "spans": [record]}],
+    }]}
+
+
+_export_queue: "queue.Queue[str]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_writer_pid: Optional[int] = None
+dropped_spans = 0
+
+
+def _write_spans(lines: "queue.Queue[str]") -> None:
+    # Line-buffered O_APPEND writes, one per span, so worker processes can share the file.
+    out = open(TRACE_FILE, "a", buffering=1) if TRACE_EXPORTER == "file" else sys.stdout
+    while True:
+        line = lines.get()
+        try:
+            out.write(line)
+            out.flush()
+        except Exception:
+            pass  # Tracing must never take the service down.
+        finally:
+            lines.task_done()
+
+
+def _flush(lines: "queue.Queue[str]", timeout: float = 2.0) -> None:
+    """Gives the writer a moment to drain at exit."""
+    deadline = time.monotonic() + timeout
+    while lines.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _start_writer() -> None:
+    # Once per process: a forked worker inherits the queue but not the thread.
+    global _export_queue, _writer_pid
+    with _export_lock:
+        if _writer_pid == os.getpid():
+            return
+        if _writer_pid is not None:
+            _export_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        _writer_pid = os.getpid()
+        threading.Thread(target=_write_spans, args=(_export_queue,), name="trace-exporter", daemon=True).start()
+        atexit.register(_flush, _export_queue)
+
+
+def _export(finished: Span) -> None:
+    global dropped_spans
+    if TRACE_EXPORTER == "off":
+        return
+    if _writer_pid != os.getpid():
+        _start_writer()
+    try:
+        _export_queue.put_nowait(json.dumps(_otlp(finished), separators=(",", ":")) + "\n")
+    except queue.Full:
+        dropped_spans += 1
@@ -10,11 +10,40 @@ from streamlit_sortables import sort_items
 import streamlit.components.v1 as components
 # --- NEW: Import themes from the separate file ---
 from themes import THEMES
+import tracing
 
 # --- Configuration ---
 DESIGN_URL = os.environ.get("DESIGN_SERVICE_URL", "https://design-generation-service-799115974158.asia-south1.run.app")
 ANALYSIS_URL = os.environ.get("ANALYSIS_SERVICE_URL", "https://prompt-analysis-service-799115974158.asia-south1.run.app")
 CONTENT_URL = os.environ.get("CONTENT_SERVICE_URL", "https://content-generation-service-799115974158.asia-south1.run.app")
+# Only asked whether it has an image library (for fast mode); fast mode is hidden when unset.
+IMAGE_URL = os.environ.get("IMAGE_SERVICE_URL", "").rstrip("/").removesuffix("/generate-images")
+# Every service call for one deck shares a trace, started when the topic is submitted.
+# TRACE_EXPORTER selects "off" (default), "console" or "file" (TRACE_FILE); see tracing.py.
+tracing.init_tracing("streamlit-ui")
+# Keep-alive connections to the backend services, reused across reruns and user sessions.
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
+
+@st.cache_resource
+def http_session():
+    """One requests.Session per UI process; the services set no cookies, so sharing it is safe."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=60)
+def image_library_available():
+    """Whether the image service has an image library loaded; fast mode gives decks no images without one."""
+    if not IMAGE_URL:
+        return False
+    try:
+        response = http_session().get(f"{IMAGE_URL}/library/stats", timeout=5)
+        response.raise_for_status()
+        return bool(response.json().get("enabled"))
+    except Exception:
+        return False
 
 # --- REMOVED: The large THEMES list is now in themes.py ---
 
@@ -38,6 +67,12 @@ if 'final_presentation' not in st.session_state:
     st.session_state.final_presentation = {}
 if 'selected_theme' not in st.session_state:
     st.session_state.selected_theme = THEMES[0]['id']
+if 'fresh_images' not in st.session_state:
+    st.session_state.fresh_images = False
+if 'fast_images' not in st.session_state:
+    st.session_state.fast_images = False
+if 'trace_id' not in st.session_state:
+    st.session_state.trace_id = tracing.new_trace_id()
 
 
 # --- UI Functions ---
@@ -78,42 +113,97 @@ def display_slide_content(slide):
         st.markdown(f"**{data.get('message')}**")
 
 def stream_content_generation(analysis_data):
+    """Shows each slide as soon as the content service streams it (NDJSON, one event per line)."""
+    slides = []
+    progress_note = st.empty()
     try:
-        response = requests.post(f"{CONTENT_URL}/generate-content", json=analysis_data, timeout=180)
-        response.raise_for_status()
-        full_content = response.json().get("slides", [])
-        st.session_state.slide_data = full_content
-        for slide in st.session_state.slide_data:
-            with st.container(border=True):
-                display_slide_content(slide)
+        with tracing.span("ui.generate_content", kind="CLIENT", trace_id=st.session_state.trace_id):
+            with http_session().post(f"{CONTENT_URL}/generate-content/stream", json=analysis_data, timeout=180,
+                                     headers=tracing.inject({"Accept": "application/x-ndjson"}),
+                                     stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["event"] == "slide":
+                        slides.append(event["slide"])
+                        with st.container(border=True):
+                            display_slide_content(event["slide"])
+                        progress_note.caption(f"{len(slides)} slides drafted so far...")
+                    elif event["event"] == "error":
+                        raise RuntimeError(event["detail"])
+                    elif event["event"] == "done" and event.get("missing_slides"):
+                        st.warning(f"{event['missing_slides']} of the requested slides could not be written; "
+                                   "try drafting again for the full deck.", icon="⚠️")
+        progress_note.empty()
+        st.session_state.slide_data = slides
+        # "Draft a Different Outline" bypasses the content cache for this one draft only.
+        analysis_data.pop("force_refresh", None)
         return True
     except Exception as e:
         st.error(f"Failed to generate content: {e}", icon="⚠️")
         return False
 
+JOB_POLL_INTERVAL_SECONDS = 1.5
+JOB_TIMEOUT_SECONDS = 600
+
+def describe_job_progress(status):
+    """Maps a design-service job status to a progress fraction and label."""
+    stage = status.get("stage")
+    if stage == "images":
+        done, total = status.get("images_done", 0), max(status.get("images_total", 0), 1)
+        return 0.05 + 0.75 * done / total, f"Generating images ({done}/{total})..."
+    if stage == "rendering":
+        return 0.85, "Applying your theme and building slides..."
+    if stage == "uploading":
+        return 0.95, "Uploading your presentation..."
+    if stage == "done":
+        return 1.0, "Done!"
+    return 0.02, "Waiting for a free presentation builder..."
+
 def generate_final_presentation():
     payload = {
         "slides": st.session_state.slide_data,
         "theme": st.session_state.selected_theme,
+        "fresh_images": st.session_state.fresh_images,
+        "fast_images": st.session_state.fast_images,
     }
     
-    spinner_text = "Creating your presentation, adding your theme, inserting images, and getting everything set up. This may take a few moments..."
-    with st.spinner(spinner_text):
-        try:
-            response = requests.post(f"{DESIGN_URL}/generate-full-presentation", json=payload, timeout=600)
+    try:
+        with tracing.span("ui.build_presentation", kind="CLIENT", trace_id=st.session_state.trace_id):
+            response = http_session().post(f"{DESIGN_URL}/jobs", json=payload, timeout=30, headers=tracing.inject())
             response.raise_for_status()
-            st.session_state.final_presentation = response.json()
-            return True
-        except requests.exceptions.HTTPError as http_err:
-            try:
-                error_detail = http_err.response.json().get("detail", http_err.response.text)
-            except json.JSONDecodeError:
-                error_detail = http_err.response.text
-            st.error(f"Failed to build presentation: {error_detail}", icon="⚠️")
-            return False
-        except requests.exceptions.RequestException as e:
-            st.error(f"Could not connect to the presentation service: {e}", icon="⚠️")
+            job = response.json()
+
+            progress_bar = st.progress(0.0, text="Queued...")
+            deadline = time.time() + JOB_TIMEOUT_SECONDS
+            while time.time() < deadline:
+                status_res = http_session().get(f"{DESIGN_URL}{job['status_url']}", timeout=30,
+                                          headers=tracing.inject())
+                status_res.raise_for_status()
+                status = status_res.json()
+                fraction, label = describe_job_progress(status)
+                progress_bar.progress(fraction, text=label)
+                if status["state"] == "succeeded":
+                    st.session_state.final_presentation = status["result"]
+                    return True
+                if status["state"] == "failed":
+                    st.error(f"Failed to build presentation: {status.get('error')}", icon="⚠️")
+                    return False
+                time.sleep(JOB_POLL_INTERVAL_SECONDS)
+            st.error("Building the presentation is taking longer than expected. Please try again.", icon="⚠️")
             return False
+    except requests.exceptions.HTTPError as http_err:
+        try:
+            error_detail = http_err.response.json().get("detail", http_err.response.text)
+        except json.JSONDecodeError:
+            error_detail = http_err.response.text
+        st.error(f"Failed to build presentation: {error_detail}", icon="⚠️")
+        return False
+    except requests.exceptions.RequestException as e:
+        st.error(f"Could not connect to the presentation service: {e}", icon="⚠️")
+        return False
 
 # --- UI Rendering Stages ---
 
@@ -135,8 +225,11 @@ if st.session_state.stage == 'input':
     if submitted and topic:
         with st.spinner("Analyzing your request..."):
             try:
-                analysis_res = requests.post(f"{ANALYSIS_URL}/analyze", json={"prompt": topic}, timeout=45)
-                analysis_res.raise_for_status()
+                st.session_state.trace_id = tracing.new_trace_id()
+                with tracing.span("ui.analyze", kind="CLIENT", trace_id=st.session_state.trace_id):
+                    analysis_res = http_session().post(f"{ANALYSIS_URL}/analyze", json={"prompt": topic}, timeout=45,
+                                                 headers=tracing.inject())
+                    analysis_res.raise_for_status()
                 st.session_state.analysis_data = analysis_res.json()
                 st.session_state.analysis_data['slide_count'] = num_slides
                 st.session_state.analysis_data['language'] = language
@@ -158,9 +251,22 @@ elif st.session_state.stage == 'generating':
 
     if generation_successful:
         st.success("Your content strategy has been drafted.")
+        if st.button("Draft a Different Outline", help="Similar requests reuse earlier outlines; this writes a new one."):
+            st.session_state.analysis_data["force_refresh"] = True
+            st.session_state.slide_data = []
+            st.rerun()
         st.markdown("---")
         
         theme_picker()
+        st.session_state.fresh_images = st.checkbox(
+            "Generate new images", value=st.session_state.fresh_images,
+            help="By default, images already generated for the same slide content and theme are reused.")
+        if image_library_available():
+            st.session_state.fast_images = st.checkbox(
+                "Fast mode", value=st.session_state.fast_images,
+                help="Use ready-made images from the image library instead of generating new ones.")
+        else:
+            st.session_state.fast_images = False
         
         st.markdown("---")
         col1, col2 = st.columns(2)
@@ -249,13 +355,19 @@ elif st.session_state.stage == 'complete':
     final_data = st.session_state.final_presentation
     download_url = final_data.get("download_url")
     preview_url = final_data.get("preview_url")
+    st.caption(f"Trace ID: {st.session_state.trace_id}")
+    if final_data.get("slides_without_images"):
+        st.info(f"{final_data['slides_without_images']} slides use a text-only layout because their images "
+                "were not available in time. Building the deck again will fill in the images that have finished since.")
     if preview_url:
+        if preview_url.startswith("/"):
+            preview_url = f"{DESIGN_URL}{preview_url}"
         st.subheader("Presentation Preview")
         st.components.v1.iframe(preview_url, height=500, scrolling=True)
         st.markdown("---")
     if download_url:
         try:
-            ppt_content = requests.get(download_url, timeout=60).content
+            ppt_content = http_session().get(download_url, timeout=60).content
             st.download_button(
                 label="Download Presentation (.pptx)",
                 data=ppt_content, 